@@ -0,0 +1,35 @@
+"""
+Benchmarks of solving many variants of a cloth statically: the variants
+solved one after the other (Workers=1) against a pool of threads. The cloth
+is 8 by 8 quads on the pure Python backend, each variant scales the rest
+lengths of its edges. The Python backend holds the interpreter lock, so the
+pool only pays off with the native library, whose calls release it.
+"""
+
+import harness
+import scenarios
+from suite import case
+
+def setupBatch(count,workers):
+
+    harness.useNativeLibrary(None)
+    mesh,points,sigs = scenarios.cloth(8)
+    edges = sigs[0]["count"]
+    variants = [(None,[[1.0,1.0+0.01*i,1.0+0.01*i]*edges,None]) for i in range(count)]
+    sigs[0] = scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices"),1.0,
+                                scalars=[[1.0,1.0,1.0]]*edges)
+    settings = scenarios.staticSettings(Iterations=10,CacheSize=0,Workers=workers,Backend="python")
+
+    def run():
+        out = scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,settings,variants)
+        return {"variants":len(out["Iterations"]),"workers":out["SolverInfo"][0]["workers"]}
+
+    return run
+
+@case("batch.workers1",sizes=(8,32),repeat=3,unit="variants")
+def workers1(count):
+    return setupBatch(count,1)
+
+@case("batch.workers4",sizes=(8,32),repeat=3,unit="variants")
+def workers4(count):
+    return setupBatch(count,4)
@@ -0,0 +1,73 @@
+"""
+Benchmarks of adding the constraints of a signature to a solver on the stub
+library: the batched addSoConstraints against the per-constraint path it
+replaced, which built new ctypes arrays for each constraint.
+"""
+
+import ctypes as ct
+from array import array
+
+import harness
+from suite import case
+
+import ShapeOpConstraintSolver as cs
+
+def chainSig(count):
+
+    """ A compact EdgeStrain signature of a chain of count edges, with
+    scalars per constraint """
+
+    indices = array("i",[v for i in range(count) for v in (i,i+1)])
+    scalars = array("d",[v for i in range(count) for v in (1.0,0.9,1.1)])
+
+    return {"type":"EdgeStrain","format":"compact","count":count,
+            "pointIndices":indices,"indexOffsets":array("i",range(0,2*count+1,2)),
+            "weights":array("d",[1.0]),"scalars":scalars,"scalarOffsets":array("i",range(0,3*count+1,3))}
+
+def addPerConstraint(solver,csd):
+
+    """ The per-constraint path: one new type string, index array and scalars
+    array per constraint, filled one element at a time """
+
+    csids = []
+    for i in range(csd["count"]):
+        ids = csd["pointIndices"][csd["indexOffsets"][i]:csd["indexOffsets"][i+1]]
+        t = cs.makeSoTypeName(csd["type"])
+        ptIds = (ct.c_int * len(ids))()
+        for j,v in enumerate(ids):
+            ptIds[j] = v
+        csid = cs.so.shapeop_addConstraint(solver,t,ct.byref(ptIds),len(ids),csd["weights"][0])
+        if csid < 0:
+            raise LookupError("addSoConstraint failed adding a constraint of type " + csd["type"])
+        scalars = cs.getSoConstraintScalars(csd,i)
+        t = cs.makeSoTypeName(csd["type"])
+        scalarsC = (ct.c_double * len(scalars))()
+        for j,v in enumerate(scalars):
+            scalarsC[j] = v
+        if cs.so.shapeop_editConstraint(solver,t,csid,ct.byref(scalarsC),len(scalars)) != 0:
+            raise LookupError("editSoConstraint failed editing constraint.")
+        csids.append(csid)
+
+    return csids
+
+def setupAdd(count,add):
+
+    stub = harness.StubShapeOp()
+    cs.so = stub
+    csd = chainSig(count)
+
+    def run():
+        solver = stub.shapeop_create()
+        csids = add(solver,csd)
+        stub.shapeop_delete(solver)
+        return {"constraints":len(csids),"calls":stub.calls["shapeop_addConstraint"]+stub.calls["shapeop_editConstraint"]}
+
+    return run
+
+@case("constraints.perConstraint",sizes=(10000,100000,1000000),repeat=3)
+def perConstraint(count):
+    return setupAdd(count,addPerConstraint)
+
+@case("constraints.batched",sizes=(10000,100000,1000000),repeat=3)
+def batched(count):
+    return setupAdd(count,cs.addSoConstraints)
@@ -0,0 +1,111 @@
+"""
+Benchmarks of the four example definitions in the examples folder, rebuilt
+headlessly from generated meshes of n by n faces. Each run times the whole
+pipeline of a definition: indexing the mesh, making the constraint
+signatures and settings, adding the constraints, solving and getting the
+points. The meshes are generated without randomness, so runs of the same
+size always solve the same problem. Without the ShapeOp library the solves
+run on the pure Python backend.
+"""
+
+import math
+
+import harness
+import scenarios
+from suite import case
+
+sizes = (8,16,32)
+
+def waveMesh(n,triangles=False,seams=()):
+
+    """ A grid mesh of n by n faces lifted to a wave, so that the faces are
+    not planar and bending has something to do """
+
+    grid = harness.gridMesh(n,triangles=triangles,seams=seams)
+    vertices = [(p.X,p.Y,0.25*math.sin(2.0*math.pi*p.X/n)*math.cos(2.0*math.pi*p.Y/n)*n/4.0) for p in grid.Vertices.Item]
+    faces = [(f.A,f.B,f.C,f.D) if f.IsQuad else (f.A,f.B,f.C) for f in grid.Faces.Item]
+
+    return harness.Mesh(vertices,faces)
+
+def solveStatic(sigs,points,iterations=20):
+    settings = scenarios.staticSettings(Iterations=iterations,CacheSize=0)
+    return scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,settings)
+
+def hangingCloth(mesh,n):
+
+    """ HangingCloth: a cloth hanging from its two top corners under gravity,
+    solved live for ten updates after resetting """
+
+    sigs = [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices")),
+            scenarios.makeSig("Closeness",[[n*(n+1)],[(n+1)*(n+1)-1]],10.0)]
+    points = mesh.Vertices.ToPoint3dArray()
+    component = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=True,UnaryVector=scenarios.gravity))
+    settings = scenarios.liveSettings(Reset=False,UnaryVector=scenarios.gravity)
+    for i in range(10):
+        component.document.scheduled = []
+        out = scenarios.solve(component,sigs,points,settings)
+
+    return out
+
+def sheetMaterial(mesh,n):
+
+    """ SheetMaterial: an inextensible triangulated sheet which resists
+    bending, held along its first row of vertices """
+
+    sigs = [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices")),
+            scenarios.makeSig("Bending",scenarios.indexMesh(mesh,"edgeFaceVertices"),0.1),
+            scenarios.makeSig("Closeness",[[i] for i in range(n+1)],10.0)]
+
+    return solveStatic(sigs,mesh.Vertices.ToPoint3dArray())
+
+def quadMeshWithCircularUV(mesh,n):
+
+    """ QuadMeshWithCircularUV: planar quads whose corners lie on a circle,
+    held at the naked vertices """
+
+    naked = scenarios.indexMesh(mesh,"nakedVertices").Branches[0]
+    faces = scenarios.indexMesh(mesh,"faceVertices")
+    sigs = [scenarios.makeSig("Plane",faces),
+            scenarios.makeSig("Circle",faces),
+            scenarios.makeSig("Closeness",[[i] for i in naked],10.0)]
+
+    return solveStatic(sigs,mesh.Vertices.ToPoint3dArray())
+
+def complexMeshWithVariousConstraints(mesh,n):
+
+    """ ComplexMeshWithVariousConstraints: a mesh unwelded along a seam with
+    edge, angle, smoothing, planarity and closeness constraints """
+
+    naked = scenarios.indexMesh(mesh,"nakedVertices").Branches[0]
+    sigs = [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices")),
+            scenarios.makeSig("AngleConstraint",scenarios.indexMesh(mesh,"faceAngleVertices"),0.1),
+            scenarios.makeSig("Laplacian",scenarios.indexMesh(mesh,"vertexNeighbours"),0.1),
+            scenarios.makeSig("Plane",scenarios.indexMesh(mesh,"faceVertices"),0.5),
+            scenarios.makeSig("Closeness",[[i] for i in naked],5.0)]
+
+    return solveStatic(sigs,mesh.Vertices.ToPoint3dArray())
+
+def setupExample(example,mesh,n):
+
+    def run():
+        out = example(mesh,n)
+        return {"iterations":out["Iterations"],"constraints":out["ConstraintCount"],"points":len(out["Points"])}
+
+    return run
+
+@case("examples.hangingCloth",sizes=sizes,repeat=3,memory=True)
+def benchHangingCloth(n):
+    return setupExample(hangingCloth,harness.gridMesh(n),n)
+
+@case("examples.sheetMaterial",sizes=sizes,repeat=3,memory=True)
+def benchSheetMaterial(n):
+    return setupExample(sheetMaterial,waveMesh(n,triangles=True),n)
+
+@case("examples.quadMeshWithCircularUV",sizes=sizes,repeat=3,memory=True)
+def benchQuadMeshWithCircularUV(n):
+    return setupExample(quadMeshWithCircularUV,waveMesh(n),n)
+
+@case("examples.complexMeshWithVariousConstraints",sizes=sizes,repeat=3,memory=True)
+def benchComplexMesh(n):
+    return setupExample(complexMeshWithVariousConstraints,waveMesh(n,seams=(n//2,)),n)
@@ -0,0 +1,71 @@
+"""
+Benchmarks of the mesh indexer: the topology functions on flat face arrays
+and the component, on grids of n by n quads (10k to 1M faces) with an
+unwelded seam through the middle. The peak memory of the component is
+traced for a datatree and for index blocks, which are meant to bound it.
+"""
+
+import harness
+import scenarios
+from suite import case
+
+import ShapeOpMeshIndexer as mi
+
+def seamGrid(n):
+    return harness.gridMesh(n,seams=(n//2,))
+
+def setupPattern(n,pattern):
+
+    mesh = seamGrid(n)
+    faces,vertexMap = mi.getMeshFaces(mesh),mi.getVertexMap(mesh)
+    iterate = mi.blockPatterns[pattern][0]
+
+    def run():
+        count = 0
+        for ids in iterate(faces,mesh.Vertices.Count,vertexMap):
+            count += 1
+        return {"constraints":count}
+
+    return run
+
+@case("indexer.edgeVertices",sizes=(100,316,1000),repeat=3)
+def edgeVertices(n):
+    return setupPattern(n,"edgeVertices")
+
+@case("indexer.vertexNeighbours",sizes=(100,316,1000),repeat=3)
+def vertexNeighbours(n):
+    return setupPattern(n,"vertexNeighbours")
+
+@case("indexer.edgeFaceVertices",sizes=(100,316,1000),repeat=3)
+def edgeFaceVertices(n):
+    return setupPattern(n,"edgeFaceVertices")
+
+@case("indexer.nakedVertices",sizes=(100,316,1000),repeat=3)
+def nakedVertices(n):
+    return setupPattern(n,"nakedVertices")
+
+@case("indexer.component",sizes=(100,316),repeat=3,memory=True)
+def component(n):
+
+    """ The component without its cache, from the mesh to the datatree """
+
+    mesh = seamGrid(n)
+
+    def run():
+        return {"branches":scenarios.indexMesh(mesh,"edgeVertices").BranchCount}
+
+    return run
+
+@case("indexer.componentBlocks",sizes=(100,316),repeat=3,memory=True)
+def componentBlocks(n):
+
+    """ The component without its cache, from the mesh to iterating over
+    its index blocks """
+
+    mesh = seamGrid(n)
+
+    def run():
+        blocks = scenarios.indexMesh(mesh,"edgeVertices",blockSize=1000)[0]
+        return {"blocks":sum(1 for b in blocks["blocks"]())}
+
+    return run
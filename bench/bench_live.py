@@ -0,0 +1,71 @@
+"""
+Benchmarks of a live solver update and of the pure Python backend.
+"""
+
+import sys
+import time
+
+import harness
+import scenarios
+from suite import case
+
+@case("live.update",sizes=(32,100,316))
+def liveUpdate(n):
+
+    """ One live update of the solver component on the stub library, i.e.
+    the per-tick overhead of the component without the solving """
+
+    harness.useNativeLibrary(harness.StubShapeOp())
+    mesh,points,sigs = scenarios.cloth(n)
+    component = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=True,UnaryVector=scenarios.gravity))
+    settings = scenarios.liveSettings(Reset=False,UnaryVector=scenarios.gravity)
+
+    def run():
+        component.document.scheduled = []
+        return {"iterations":scenarios.solve(component,sigs,points,settings)["Iterations"]}
+
+    return run
+
+@case("backend.python.static",sizes=(8,16,32),repeat=3)
+def pythonStatic(n):
+
+    """ A static solve of a cloth with a plane constraint per face on the
+    pure Python backend: adding the Closeness, EdgeStrain and Plane
+    constraints, factoring and solving 20 iterations """
+
+    harness.useNativeLibrary(None)
+    mesh,points,sigs = scenarios.cloth(n)
+    sigs.append(scenarios.makeSig("Plane",scenarios.indexMesh(mesh,"faceVertices"),0.5))
+    settings = scenarios.staticSettings(Iterations=20,CacheSize=0,Backend="python")
+
+    def run():
+        out = scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,settings)
+        return {"iterations":out["Iterations"],"constraints":out["ConstraintCount"]}
+
+    return run
+
+@case("backend.python.live",sizes=(32,100,224),unit="points")
+def pythonLive(n):
+
+    """ One live update of a hanging cloth under gravity on the Python
+    backend, i.e. the interactive frame time: 224 by 224 quads is about 50k
+    points. The metrics have the time per iteration and whether NumPy (the
+    batched local step) and SciPy (the sparse global step) were used """
+
+    harness.useNativeLibrary(None)
+    mesh,points,sigs = scenarios.cloth(n)
+    component = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=True,UnaryVector=scenarios.gravity,Backend="python"))
+    settings = scenarios.liveSettings(Reset=False,UnaryVector=scenarios.gravity,Backend="python")
+
+    def run():
+        component.document.scheduled = []
+        start = time.perf_counter()
+        out = scenarios.solve(component,sigs,points,settings)
+        seconds = time.perf_counter()-start
+        return {"iterations":out["Iterations"],"secondsPerIteration":seconds/settings["iterations"],
+                "points":len(out["Points"]),"numpy":sys.modules.get("numpy") is not None,
+                "scipy":sys.modules.get("scipy.sparse") is not None}
+
+    return run
@@ -0,0 +1,42 @@
+"""
+Benchmarks of the time to solve a static problem down to a residual, with
+and without the coarse-to-fine multilevel solve. The problem is a tent: a
+triangulated sheet of n by n quads which resists bending a little, held at
+its naked vertices while its center is pulled up by half its width, on the
+pure Python backend. The solves stop once the points move less than the
+tolerance between chunks of iterations, and report the iterations of the
+finest level. With NumPy the iterations are cheap, so the coarse levels only
+pay off from about 48 by 48 quads.
+"""
+
+import harness
+import scenarios
+from suite import case
+
+def setupTent(n,levels):
+
+    harness.useNativeLibrary(None)
+    mesh = harness.gridMesh(n,triangles=True)
+    points = mesh.Vertices.ToPoint3dArray()
+    center = (n+1)*(n//2)+n//2
+    naked = scenarios.indexMesh(mesh,"nakedVertices").Branches[0]
+    sigs = [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices")),
+            scenarios.makeSig("Bending",scenarios.indexMesh(mesh,"edgeFaceVertices"),0.03),
+            scenarios.makeSig("Closeness",[[i] for i in naked],10.0),
+            scenarios.makeSig("Closeness",[[center]],10.0,scalars=[[points[center].X,points[center].Y,n*0.5]])]
+    settings = scenarios.staticSettings(Iterations=2000,Tolerance=1e-3,Chunk=10,CacheSize=0,
+                                        Levels=levels,Backend="python")
+
+    def run():
+        out = scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,settings)
+        return {"iterations":out["Iterations"],"levels":out["SolverInfo"][0].get("levels",1)}
+
+    return run
+
+@case("multilevel.levels0",sizes=(24,48,64),repeat=3)
+def singleLevel(n):
+    return setupTent(n,0)
+
+@case("multilevel.levels3",sizes=(24,48,64),repeat=3)
+def threeLevels(n):
+    return setupTent(n,3)
@@ -0,0 +1,64 @@
+"""
+Benchmarks of marshalling points between Point3d lists and the coordinates
+buffer of a solver: the bulk packSoPoints/unpackSoPoints against the element
+by element loops they replaced.
+"""
+
+import ctypes as ct
+
+from harness import Point3d
+from suite import case
+
+import ShapeOpConstraintSolver as cs
+
+sizes = (10000,100000,1000000)
+
+def makePoints(n):
+    return [Point3d(i,i*0.5,i*0.25) for i in range(n)]
+
+def packLoop(points):
+
+    """ Pack the points one coordinate at a time into a new buffer """
+
+    ptCoords = (ct.c_double * (len(points)*3))()
+    for i in range(len(points)):
+        b = 3*i
+        ptCoords[b] = float(points[i].X)
+        ptCoords[b+1] = float(points[i].Y)
+        ptCoords[b+2] = float(points[i].Z)
+
+    return ptCoords
+
+def unpackLoop(ptCoords):
+
+    """ Unpack the points one point at a time """
+
+    points = [None]*(len(ptCoords)//3)
+    for i in range(len(points)):
+        b = 3*i
+        points[i] = Point3d(ptCoords[b],ptCoords[b+1],ptCoords[b+2])
+
+    return points
+
+@case("points.pack.loop",sizes=sizes,unit="points")
+def packLoopCase(n):
+    points = makePoints(n)
+    return lambda: packLoop(points) and None
+
+@case("points.pack.bulk",sizes=sizes,unit="points")
+def packBulkCase(n):
+
+    # Reuse one buffer across runs, like the live solver across updates
+    points = makePoints(n)
+    ptCoords = cs.packSoPoints(points)
+    return lambda: cs.packSoPoints(points,ptCoords) and None
+
+@case("points.unpack.loop",sizes=sizes,unit="points")
+def unpackLoopCase(n):
+    ptCoords = cs.packSoPoints(makePoints(n))
+    return lambda: unpackLoop(ptCoords) and None
+
+@case("points.unpack.bulk",sizes=sizes,unit="points")
+def unpackBulkCase(n):
+    ptCoords = cs.packSoPoints(makePoints(n))
+    return lambda: cs.unpackSoPoints(ptCoords) and None
@@ -0,0 +1,504 @@
+"""
+Headless harness for the ShapeOpGHPython components.
+-
+The components are GHPython scripts which get their inputs and ghenv as
+globals and import RhinoCommon, Grasshopper and scriptcontext. This harness
+stands in for those host modules with small stubs, so that the component
+scripts can be run (like Grasshopper runs them) and imported as modules (to
+call their functions) with CPython outside of Rhino, e.g. by the tests and
+the benchmark suite. The other modules in src (e.g. ShapeOpCore, which the
+solver component imports) are imported as plain modules:
+
+    import harness
+    harness.install()
+    import ShapeOpMeshIndexer as mi
+    mi.topoEdgeVertices(faces)
+
+    comp = harness.Component("ShapeOpConstraintSolver")
+    out = harness.runComponent(comp,ConstraintSigs=sigs,Points=pts,Settings=settings)
+
+The stubs only implement what the components use. The ShapeOp library can be
+replaced with the StubShapeOp library (which records its calls and does not
+solve) or left out, in which case the solver falls back to its pure Python
+backend.
+"""
+
+import ctypes as ct
+import os
+import re
+import sys
+import types
+from collections import Counter, OrderedDict
+
+srcPath = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,"src")
+srcPath = os.path.normpath(srcPath)
+
+# RhinoCommon stubs
+
+class Point3d(object):
+
+    """ Stand-in for Rhino.Geometry.Point3d """
+
+    __slots__ = ("X","Y","Z")
+
+    def __init__(self,x=0.0,y=0.0,z=0.0):
+        if isinstance(x,Point3d):
+            x,y,z = x.X,x.Y,x.Z
+        self.X,self.Y,self.Z = float(x),float(y),float(z)
+
+    def __repr__(self):
+        return "Point3d(%g,%g,%g)" % (self.X,self.Y,self.Z)
+
+    def __eq__(self,other):
+        return isinstance(other,Point3d) and (self.X,self.Y,self.Z) == (other.X,other.Y,other.Z)
+
+    def __ne__(self,other):
+        return not self == other
+
+    __hash__ = None
+
+    def DistanceToSquared(self,other):
+        return (self.X-other.X)**2 + (self.Y-other.Y)**2 + (self.Z-other.Z)**2
+
+    def DistanceTo(self,other):
+        return self.DistanceToSquared(other)**0.5
+
+class Vector3d(Point3d):
+
+    """ Stand-in for Rhino.Geometry.Vector3d """
+
+    __slots__ = ()
+
+    @property
+    def Length(self):
+        return (self.X**2 + self.Y**2 + self.Z**2)**0.5
+
+class BoundingBox(object):
+
+    """ Stand-in for Rhino.Geometry.BoundingBox """
+
+    def __init__(self,points):
+        self.Min = Point3d(*[min(getattr(p,c) for p in points) for c in "XYZ"])
+        self.Max = Point3d(*[max(getattr(p,c) for p in points) for c in "XYZ"])
+        self.Diagonal = Vector3d(self.Max.X-self.Min.X,self.Max.Y-self.Min.Y,self.Max.Z-self.Min.Z)
+
+class Curve(object):
+
+    """ Stand-in for Rhino.Geometry.Curve (a line segment) """
+
+    def __init__(self,start,end):
+        self.PointAtStart,self.PointAtEnd = start,end
+
+class MeshFace(object):
+
+    """ Stand-in for Rhino.Geometry.MeshFace, D is C for triangles """
+
+    __slots__ = ("A","B","C","D","IsQuad")
+
+    def __init__(self,ids):
+        self.A,self.B,self.C = ids[0],ids[1],ids[2]
+        self.IsQuad = len(ids) == 4
+        self.D = ids[3] if self.IsQuad else ids[2]
+
+class Mesh(object):
+
+    """ Stand-in for Rhino.Geometry.Mesh made from vertex coordinates and
+    faces (tuples of three or four vertex indices). Vertices at the same
+    location share a topology vertex, as in RhinoCommon """
+
+    def __init__(self,vertices,faces):
+        points = [Point3d(*v) for v in vertices]
+        items = [MeshFace(f) for f in faces]
+
+        # Group the vertices by location into topology vertices
+        groups = OrderedDict()
+        for i,p in enumerate(points):
+            groups.setdefault((p.X,p.Y,p.Z),[]).append(i)
+        groups = list(groups.values())
+        topologyIndex = [0]*len(points)
+        for t,g in enumerate(groups):
+            for i in g:
+                topologyIndex[i] = t
+
+        self.Vertices = types.SimpleNamespace(
+            Count=len(points),Item=points,
+            ToPoint3dArray=lambda: list(points),
+            ToFloatArray=lambda: [c for p in points for c in (p.X,p.Y,p.Z)])
+        self.Faces = types.SimpleNamespace(Count=len(items),Item=items)
+        self.TopologyVertices = types.SimpleNamespace(
+            Count=len(groups),
+            MeshVertexIndices=lambda t: list(groups[t]),
+            TopologyVertexIndex=lambda i: topologyIndex[i])
+
+    def GetBoundingBox(self,accurate):
+        return BoundingBox(self.Vertices.Item)
+
+def gridMesh(nu,nv=None,size=1.0,triangles=False,seams=()):
+
+    """ Make a flat grid mesh of nu by nv quads (or triangles) in the XY plane.
+    The vertices of the columns in seams are duplicated, so the mesh is
+    unwelded along them (like a mesh joined from separate pieces) """
+
+    nv = nu if nv is None else nv
+    vertices,ids = [],{}
+    for j in range(nv+1):
+        for i in range(nu+1):
+            ids[(i,j,0)] = len(vertices)
+            vertices.append((i*size,j*size,0.0))
+            if i in seams:
+                ids[(i,j,1)] = len(vertices)
+                vertices.append((i*size,j*size,0.0))
+
+    # Faces on the right of a seam column use its duplicated vertices
+    def vertex(i,j,left):
+        return ids[(i,j,1)] if (i in seams and not left) else ids[(i,j,0)]
+
+    faces = []
+    for j in range(nv):
+        for i in range(nu):
+            quad = (vertex(i,j,False),vertex(i+1,j,True),vertex(i+1,j+1,True),vertex(i,j+1,False))
+            if triangles:
+                faces.extend([quad[:3],(quad[0],quad[2],quad[3])])
+            else:
+                faces.append(quad)
+
+    return Mesh(vertices,faces)
+
+# Grasshopper stubs
+
+class Branch(list):
+
+    """ A datatree branch, which is a list with a Count """
+
+    @property
+    def Count(self):
+        return len(self)
+
+class DataTree(object):
+
+    """ Stand-in for Grasshopper.DataTree[T], paths are plain integers """
+
+    def __init__(self,branches=()):
+        self._branches = OrderedDict()
+        for i,b in enumerate(branches):
+            self.AddRange(b,i)
+
+    def Branch(self,path):
+        if path not in self._branches:
+            self._branches[path] = Branch()
+        return self._branches[path]
+
+    def Add(self,item,path=0):
+        self.Branch(path).append(item)
+
+    def AddRange(self,items,path=0):
+        self.Branch(path).extend(items)
+
+    def AllData(self):
+        return [item for b in self._branches.values() for item in b]
+
+    @property
+    def Branches(self):
+        return list(self._branches.values())
+
+    @property
+    def Paths(self):
+        return list(self._branches)
+
+    @property
+    def BranchCount(self):
+        return len(self._branches)
+
+    @property
+    def DataCount(self):
+        return sum(len(b) for b in self._branches.values())
+
+class DataTreeType(object):
+
+    """ Makes gh.DataTree[T]() return a DataTree """
+
+    def __getitem__(self,itemType):
+        return DataTree
+
+class Event(object):
+
+    """ A .NET style event which handlers are added to with += """
+
+    def __init__(self):
+        self.handlers = []
+
+    def __iadd__(self,handler):
+        self.handlers.append(handler)
+        return self
+
+    def __call__(self,*args):
+        for handler in list(self.handlers):
+            handler(*args)
+
+class Document(object):
+
+    """ Stand-in for a GH_Document, scheduled solutions are queued until they
+    are run with runScheduled """
+
+    count = 0
+
+    def __init__(self):
+        Document.count += 1
+        self.DocumentID = "document%d" % Document.count
+        self.scheduled = []
+
+    def ScheduleSolution(self,interval,callback):
+        self.scheduled.append((interval,callback))
+
+    def runScheduled(self):
+        scheduled,self.scheduled = self.scheduled,[]
+        for interval,callback in scheduled:
+            callback(self)
+        return len(scheduled)
+
+class Component(object):
+
+    """ Stand-in for the GHPython component running a component script, it
+    collects the runtime messages and whether the solution was expired """
+
+    count = 0
+
+    def __init__(self,script,document=None):
+        Component.count += 1
+        self.script = script
+        self.Name = self.NickName = ""
+        self.Message = None
+        self.InstanceGuid = "component%d" % Component.count
+        self.document = document if document is not None else Document()
+        self.messages = []
+        self.expired = 0
+
+    def OnPingDocument(self):
+        return self.document
+
+    def AddRuntimeMessage(self,level,message):
+        self.messages.append((level,message))
+
+    def ExpireSolution(self,recompute):
+        self.expired += 1
+
+def removeDocument(document):
+
+    """ Close a document: its components are no longer in a document and the
+    DocumentRemoved event is raised """
+
+    for component in list(components):
+        if component.document is document:
+            component.document = None
+    grasshopper.Instances.DocumentServer.DocumentRemoved(None,document)
+
+def makeModules():
+
+    """ Make the stub Rhino, Grasshopper and scriptcontext modules """
+
+    rhino = types.ModuleType("Rhino")
+    rhino.Geometry = types.SimpleNamespace(Point3d=Point3d,Vector3d=Vector3d,Curve=Curve,
+                                           Mesh=Mesh,BoundingBox=BoundingBox)
+
+    gh = types.ModuleType("Grasshopper")
+    gh.DataTree = DataTreeType()
+    gh.Kernel = types.SimpleNamespace(
+        Data=types.SimpleNamespace(GH_Path=lambda *indices: indices[0] if len(indices) == 1 else indices),
+        GH_Document=types.SimpleNamespace(GH_ScheduleDelegate=lambda callback: callback),
+        GH_RuntimeMessageLevel=types.SimpleNamespace(Remark=0,Warning=1,Error=2))
+    gh.Instances = types.SimpleNamespace(DocumentServer=types.SimpleNamespace(DocumentRemoved=Event()))
+
+    sc = types.ModuleType("scriptcontext")
+    sc.sticky = {}
+
+    return rhino,gh,sc
+
+rhino,grasshopper,scriptcontext = makeModules()
+components = []
+
+def resetSticky():
+
+    """ Empty scriptcontext.sticky, deleting the registered solvers first """
+
+    registry = scriptcontext.sticky.get("ShapeOpSolverRegistry")
+    if registry is not None:
+        for entry in list(registry["solvers"].values()):
+            entry["so"].shapeop_delete(entry["solver"])
+    for key,value in list(scriptcontext.sticky.items()):
+        if isinstance(value,dict) and "stop" in value and "thread" in value:
+            value["stop"].set()
+            value["thread"].join()
+    scriptcontext.sticky.clear()
+
+# The ShapeOp library stub
+
+class StubShapeOp(object):
+
+    """ Stand-in for the ShapeOp library which copies the points in and out
+    and records the number of calls to each function, but does not solve. It
+    isolates the Python side of the solver in benchmarks """
+
+    name = "stub"
+
+    def __init__(self):
+        self.calls = Counter()
+        self.solvers = {}
+        self.handles = 0
+
+    def shapeop_create(self):
+        self.calls["shapeop_create"] += 1
+        self.handles += 1
+        self.solvers[self.handles] = {"points":None,"constraints":0}
+        return self.handles
+
+    def shapeop_delete(self,solver):
+        self.calls["shapeop_delete"] += 1
+        self.solvers.pop(solver,None)
+
+    def shapeop_setPoints(self,solver,ptr,pointCount):
+        self.calls["shapeop_setPoints"] += 1
+        points = (ct.c_double * (pointCount*3))()
+        ct.memmove(points,ptr,ct.sizeof(points))
+        self.solvers[solver]["points"] = points
+
+    def shapeop_getPoints(self,solver,ptr,pointCount):
+        self.calls["shapeop_getPoints"] += 1
+        ct.memmove(ptr,self.solvers[solver]["points"],pointCount*3*ct.sizeof(ct.c_double))
+
+    def shapeop_addConstraint(self,solver,t,ptr,idCount,weight):
+        self.calls["shapeop_addConstraint"] += 1
+        self.solvers[solver]["constraints"] += 1
+        return self.solvers[solver]["constraints"]-1
+
+    def shapeop_editConstraint(self,solver,t,constraintId,ptr,scalarCount):
+        self.calls["shapeop_editConstraint"] += 1
+        return 0
+
+    def shapeop_addGravityForce(self,solver,ptr):
+        self.calls["shapeop_addGravityForce"] += 1
+        return 0
+
+    def shapeop_init(self,solver):
+        self.calls["shapeop_init"] += 1
+        return 0
+
+    def shapeop_initDynamic(self,solver,mass,damping,timeStep):
+        self.calls["shapeop_initDynamic"] += 1
+        return 0
+
+    def shapeop_solve(self,solver,iterations):
+        self.calls["shapeop_solve"] += 1
+        return 0
+
+loadLibrary = ct.cdll.LoadLibrary
+nativeLibrary = None
+
+def useNativeLibrary(library):
+
+    """ Make loading the ShapeOp library return library, None makes it fail
+    (like on a system without the library) """
+
+    global nativeLibrary
+    nativeLibrary = library
+
+def loadShapeOpLibrary(name):
+
+    """ Load a library, standing in for the ShapeOp library """
+
+    if not name.startswith("ShapeOp"):
+        return loadLibrary(name)
+    if nativeLibrary is None:
+        raise OSError("ShapeOp library is not available in the harness")
+
+    return nativeLibrary
+
+# Running and importing the component scripts
+
+codeCache = {}
+
+def getComponentInputs(script):
+
+    """ Get the input names of a component script from the Args section of
+    its docstring """
+
+    code,source = getComponentCode(script)
+    args = source.split("Args:",1)[1].split("Returns:",1)[0]
+
+    return re.findall(r"^        (\w+):",args,re.M)
+
+def getComponentCode(script):
+
+    """ Get the compiled code and source of a component script in src """
+
+    if script not in codeCache:
+        path = os.path.join(srcPath,script + ".py")
+        with open(path,encoding="utf-8-sig") as f:
+            source = f.read()
+        codeCache[script] = compile(source,path,"exec"),source
+
+    return codeCache[script]
+
+# Inputs which Grasshopper passes as empty datatrees or lists rather than None
+emptyInputs = {"ShapeOpConstraintSignature":{"PointIndices":DataTree,"Scalars":DataTree,"Weights":list}}
+
+def runComponent(component,namespace=None,**inputs):
+
+    """ Run the script of a component with the inputs (the other inputs are
+    None or empty like in Grasshopper) and return the namespace it ran in,
+    which holds its outputs. It runs in a new namespace unless one is passed """
+
+    if isinstance(component,str):
+        component = Component(component)
+    if component not in components:
+        components.append(component)
+    code = getComponentCode(component.script)[0]
+
+    if namespace is None:
+        namespace = {"__name__":component.script}
+    namespace["ghenv"] = types.SimpleNamespace(Component=component)
+    namespace["ghdoc"] = types.SimpleNamespace(Path="harness.gh")
+    for name in getComponentInputs(component.script):
+        empty = emptyInputs.get(component.script,{}).get(name)
+        namespace[name] = empty() if empty else None
+    namespace.update(inputs)
+    exec(code,namespace)
+
+    return namespace
+
+def isComponentScript(script):
+
+    """ Check if a script in src is a component script, i.e. its docstring has
+    the Args section of the component inputs """
+
+    return "Args:" in getComponentCode(script)[1]
+
+class ComponentImporter(object):
+
+    """ Import hook which imports the scripts in src as modules, running the
+    component scripts once with no inputs """
+
+    def find_spec(self,name,path=None,target=None):
+        if "." in name or not os.path.exists(os.path.join(srcPath,name + ".py")):
+            return None
+        import importlib.util
+        return importlib.util.spec_from_loader(name,self)
+
+    def create_module(self,spec):
+        return None
+
+    def exec_module(self,module):
+        if isComponentScript(module.__name__):
+            runComponent(module.__name__,module.__dict__)
+        else:
+            exec(getComponentCode(module.__name__)[0],module.__dict__)
+
+def install(native=None):
+
+    """ Install the stub host modules and the import hook for the component
+    scripts, and set the ShapeOp library (see useNativeLibrary) """
+
+    sys.modules.update({"Rhino":rhino,"Grasshopper":grasshopper,"scriptcontext":scriptcontext})
+    if not any(isinstance(f,ComponentImporter) for f in sys.meta_path):
+        sys.meta_path.append(ComponentImporter())
+    ct.cdll.LoadLibrary = loadShapeOpLibrary
+    useNativeLibrary(native)
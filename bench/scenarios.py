@@ -0,0 +1,73 @@
+"""
+Scenarios for the tests and benchmarks, made by running the components like
+a Grasshopper definition would: meshes are indexed by ShapeOpMeshIndexer,
+constraint signatures are made by ShapeOpConstraintSignature and settings by
+ShapeOpSettingsStatic/ShapeOpSettingsLive.
+"""
+
+import harness
+from harness import DataTree, Vector3d, gridMesh
+
+def toTree(branches):
+
+    """ Make a datatree from a list of branches, datatrees are returned as they are """
+
+    if branches is None or isinstance(branches,DataTree):
+        return branches if branches is not None else DataTree()
+
+    return DataTree(branches)
+
+def indexMesh(mesh,pattern,blockSize=None):
+
+    """ Get a vertex indices pattern of a mesh from ShapeOpMeshIndexer """
+
+    return harness.runComponent("ShapeOpMeshIndexer",Mesh=mesh,Pattern=pattern,BlockSize=blockSize,CacheSize=0)["PointIndices"]
+
+def makeSig(constraintType,pointIndices,weights=1.0,scalars=None,points=None,factor=None):
+
+    """ Make a constraint signature with ShapeOpConstraintSignature, from a
+    datatree or a list of branches of point indices and scalars """
+
+    if not isinstance(weights,list):
+        weights = [weights]
+    if isinstance(pointIndices,list) and pointIndices and isinstance(pointIndices[0],dict):
+        pointIndices = DataTree([pointIndices])
+
+    return harness.runComponent("ShapeOpConstraintSignature",ConstraintType=constraintType,
+                                PointIndices=toTree(pointIndices),Weights=weights,
+                                Scalars=toTree(scalars),Points=points,Factor=factor)["ConstraintSigs"][0]
+
+def staticSettings(**inputs):
+
+    """ Get the settings of ShapeOpSettingsStatic with the inputs """
+
+    return harness.runComponent("ShapeOpSettingsStatic",**inputs)["Settings"][0]
+
+def liveSettings(**inputs):
+
+    """ Get the settings of ShapeOpSettingsLive with the inputs """
+
+    return harness.runComponent("ShapeOpSettingsLive",**inputs)["Settings"][0]
+
+def solve(component,sigs,points,settings,variants=None):
+
+    """ Run a solver component and return its outputs as a dictionary """
+
+    ns = harness.runComponent(component,ConstraintSigs=sigs,Points=points,Settings=settings,Variants=variants)
+
+    return {name:ns.get(name) for name in ("Iterations","ConstraintCount","Points","SolverInfo","Profile")}
+
+def cloth(n,blockSize=None):
+
+    """ A hanging cloth: a grid of n by n quads whose edges keep their length,
+    hanging from its two top corners. Returns the mesh, points and signatures """
+
+    mesh = gridMesh(n)
+    points = mesh.Vertices.ToPoint3dArray()
+    corners = [[n*(n+1)],[(n+1)*(n+1)-1]]
+    sigs = [makeSig("EdgeStrain",indexMesh(mesh,"edgeVertices",blockSize),1.0),
+            makeSig("Closeness",corners,10.0)]
+
+    return mesh,points,sigs
+
+gravity = Vector3d(0,0,-0.1)
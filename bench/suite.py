@@ -0,0 +1,185 @@
+"""
+Benchmark suite for the ShapeOpGHPython components, run headlessly through
+the harness (see harness.py).
+-
+The bench_*.py modules in this folder register benchmark cases with the case
+decorator. A case is a function of a size which sets up the benchmark and
+returns the function to time, which may return a dictionary of metrics (e.g.
+the iterations run). Each case is timed at each of its sizes after warmup
+runs, and the peak memory of one more run is traced for the cases which ask
+for it (or all cases with --memory). The results are written as JSON and/or
+CSV, and can be compared against the JSON results of an earlier run: the
+suite then fails if the median time of a case is more than the threshold
+percentage slower than in the baseline:
+
+    python bench/suite.py [--quick] [--filter NAME] [--repeat N] [--warmup N] [--memory]
+                          [--out PATH] [--csv PATH] [--baseline PATH] [--threshold PERCENT]
+"""
+
+import argparse
+import csv
+import glob
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import harness
+
+benchPath = os.path.dirname(os.path.abspath(__file__))
+cases = []
+
+def case(name,sizes,repeat=None,unit=None,memory=False):
+
+    """ Register a benchmark case which is run at each of the sizes, repeat
+    overrides the number of timed runs of slow cases. If the size counts a
+    unit (e.g. points) the results also get the units per second, and if
+    memory is True the peak memory of a run is traced """
+
+    def register(setup):
+        cases.append({"name":name,"sizes":list(sizes),"repeat":repeat,"unit":unit,"memory":memory,"setup":setup})
+        return setup
+
+    return register
+
+def loadCases():
+
+    """ Import the bench_*.py modules, which register their cases """
+
+    harness.install()
+    sys.modules.setdefault("suite",sys.modules[__name__])
+    if benchPath not in sys.path:
+        sys.path.insert(0,benchPath)
+    for path in sorted(glob.glob(os.path.join(benchPath,"bench_*.py"))):
+        importlib.import_module(os.path.splitext(os.path.basename(path))[0])
+
+    return cases
+
+def timeCase(setup,size,warmup,repeat,memory=False):
+
+    """ Set up a case at a size and time its runs, returns the timings (in
+    seconds), the metrics of the last run and the peak memory (in bytes) of
+    one more run traced by tracemalloc if memory is True, otherwise None. The
+    traced run is not timed, as tracing slows Python down """
+
+    run = setup(size)
+    for i in range(warmup):
+        run()
+    times,metrics = [],None
+    for i in range(repeat):
+        start = time.perf_counter()
+        metrics = run()
+        times.append(time.perf_counter()-start)
+    times.sort()
+
+    peakBytes = None
+    if memory:
+        tracemalloc.start()
+        try:
+            run()
+            peakBytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {"min":times[0],"median":times[len(times)//2],"mean":sum(times)/len(times)},metrics or {},peakBytes
+
+def runSuite(names=None,quick=False,warmup=1,repeat=5,memory=False):
+
+    """ Run the registered cases whose names contain one of names (all if
+    None), quick runs each case once at its smallest size only. memory traces
+    the peak memory of all cases """
+
+    results = []
+    for c in loadCases():
+        if names and not any(n in c["name"] for n in names):
+            continue
+        sizes = c["sizes"][:1] if quick else c["sizes"]
+        for size in sizes:
+            harness.resetSticky()
+            caseRepeat = 1 if quick else (c["repeat"] or repeat)
+            caseWarmup = 0 if quick else warmup
+            seconds,metrics,peakBytes = timeCase(c["setup"],size,caseWarmup,caseRepeat,memory or c["memory"])
+            result = {"name":c["name"],"size":size,"warmup":caseWarmup,"repeat":caseRepeat,
+                      "seconds":seconds,"metrics":metrics}
+            if c["unit"] and seconds["median"] > 0:
+                result["unit"] = c["unit"]
+                result["perSecond"] = size/seconds["median"]
+            if peakBytes is not None:
+                result["peakBytes"] = peakBytes
+            results.append(result)
+            print("%-44s %10s %12.6f s" % (c["name"],size,seconds["median"]))
+    harness.resetSticky()
+
+    return {"suite":"ShapeOpGHPython","version":1,"python":platform.python_version(),
+            "platform":platform.platform(),"quick":quick,"results":results}
+
+def writeResults(report,path):
+
+    """ Write a report as JSON with sorted keys, so reports diff cleanly """
+
+    with open(path,"w") as f:
+        json.dump(report,f,indent=1,sort_keys=True)
+        f.write("\n")
+
+def writeResultsCsv(report,path):
+
+    """ Write the results of a report as CSV, one row per case and size """
+
+    with open(path,"w",newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name","size","warmup","repeat","min","median","mean","perSecond","peakBytes"])
+        for r in report["results"]:
+            writer.writerow([r["name"],r["size"],r["warmup"],r["repeat"],
+                             "%.9f" % r["seconds"]["min"],"%.9f" % r["seconds"]["median"],"%.9f" % r["seconds"]["mean"],
+                             "%.3f" % r["perSecond"] if "perSecond" in r else "",r.get("peakBytes","")])
+
+def compareResults(report,baseline,threshold):
+
+    """ Compare the median times of a report with a baseline report, returns
+    the results which are more than threshold percent slower as (name,size,
+    baseline seconds,seconds) tuples. Cases missing from the baseline pass """
+
+    baselineTimes = {(r["name"],r["size"]):r["seconds"]["median"] for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        before = baselineTimes.get((r["name"],r["size"]))
+        if before is not None and r["seconds"]["median"] > before*(1.0+threshold/100.0):
+            regressions.append((r["name"],r["size"],before,r["seconds"]["median"]))
+
+    return regressions
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Run the ShapeOpGHPython benchmarks headlessly.")
+    parser.add_argument("--filter",action="append",help="only run the cases whose name contains this (repeatable)")
+    parser.add_argument("--quick",action="store_true",help="run each case once at its smallest size")
+    parser.add_argument("--warmup",type=int,default=1,help="untimed runs before timing (default 1)")
+    parser.add_argument("--repeat",type=int,default=5,help="timed runs of each case (default 5)")
+    parser.add_argument("--memory",action="store_true",help="trace the peak memory of every case")
+    parser.add_argument("--out",help="path of the JSON results file")
+    parser.add_argument("--csv",help="path of the CSV results file")
+    parser.add_argument("--baseline",help="path of a JSON results file to compare the median times against")
+    parser.add_argument("--threshold",type=float,default=10.0,help="percentage slower than the baseline which fails (default 10)")
+    args = parser.parse_args(argv)
+
+    report = runSuite(args.filter,args.quick,args.warmup,args.repeat,args.memory)
+    if args.out:
+        writeResults(report,args.out)
+    if args.csv:
+        writeResultsCsv(report,args.csv)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compareResults(report,json.load(f),args.threshold)
+        for name,size,before,after in regressions:
+            print("REGRESSION %-33s %10s %12.6f s -> %.6f s (+%.1f%%)" % (name,size,before,after,100.0*(after/before-1.0)))
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
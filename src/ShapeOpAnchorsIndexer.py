@@ -8,10 +8,11 @@ anchoring positions and points for static positions.
 -
 Authors: Anders Holden Deleuran (CITA/KADK), Mario Deuss (LGG/EPFL) 
 Github: github.com/AndersDeleuran/ShapeOpGHPython
-Updated: 150401
+Updated: 261017
     Args:
         Mesh: The mesh to extract vertex indices from.
         AnchorGeo: Geometry to use for anchoring mesh vertices (points or curve-type).
+        Tolerance: Optional maximum distance between an anchor and its mesh vertex, anchors with no vertex within this distance are reported and skipped (default = None).
     Returns:
         PointIndices: The mesh with vertices to anchor.
         AnchorPts: The anchor points.
@@ -19,39 +20,123 @@ Updated: 150401
 
 import Rhino as rc
 import Grasshopper as gh
+import math
+from scriptcontext import sticky as st
 
 # Set component name
 ghenv.Component.Name = "ShapeOpAnchorsIndexer"
 ghenv.Component.NickName = "SOAI"
 
+def makeVertexGrid(mesh):
+    
+    """ Make a uniform grid over the mesh vertices, which is a dictionary
+    mapping cell coordinates to the indices of the vertices in that cell """
+    
+    pts = mesh.Vertices.ToPoint3dArray()
+    bb = mesh.GetBoundingBox(False)
+    cellSize = bb.Diagonal.Length/max(math.sqrt(len(pts)),1.0)
+    if cellSize <= 0:
+        cellSize = 1.0
+        
+    cells = {}
+    for i,pt in enumerate(pts):
+        c = (int((pt.X-bb.Min.X)//cellSize),int((pt.Y-bb.Min.Y)//cellSize),int((pt.Z-bb.Min.Z)//cellSize))
+        if c in cells:
+            cells[c].append(i)
+        else:
+            cells[c] = [i]
+    dims = [int(d//cellSize) for d in (bb.Max.X-bb.Min.X,bb.Max.Y-bb.Min.Y,bb.Max.Z-bb.Min.Z)]
+    
+    return {"pts":pts,"min":bb.Min,"cellSize":cellSize,"dims":dims,"cells":cells}
+
+def getVertexGrid(mesh):
+    
+    """ Get the vertex grid of the mesh from sticky, it is only remade when
+    the vertex count or vertex coordinates of the mesh change """
+    
+    key = "vertexGrid_" + str(ghenv.Component.InstanceGuid)
+    meshHash = (mesh.Vertices.Count,hash(tuple(mesh.Vertices.ToFloatArray())))
+    if key not in st or st[key][0] != meshHash:
+        st[key] = (meshHash,makeVertexGrid(mesh))
+        
+    return st[key][1]
+
+def closestVertexIndices(grid,points,tolerance=None):
+    
+    """ Get the index of the closest grid vertex to each point, searching the
+    grid cells in growing shells around the cell of the point. Points with no
+    vertex within the tolerance get the index -1 """
+    
+    pts,cellSize,cells = grid["pts"],grid["cellSize"],grid["cells"]
+    nx,ny,nz = grid["dims"]
+    indices = []
+    for pt in points:
+        
+        # Get the cell of the point and the shells needed to cover the grid
+        cx = int((pt.X-grid["min"].X)//cellSize)
+        cy = int((pt.Y-grid["min"].Y)//cellSize)
+        cz = int((pt.Z-grid["min"].Z)//cellSize)
+        rMax = max(abs(cx),abs(cx-nx),abs(cy),abs(cy-ny),abs(cz),abs(cz-nz))
+        if tolerance is not None:
+            rMax = min(rMax,int(tolerance//cellSize)+1)
+            
+        # Search the shells until no closer vertex can be found
+        best,bestDist = -1,float("inf") if tolerance is None else tolerance**2
+        for r in range(rMax+1):
+            if best >= 0 and bestDist <= ((r-1)*cellSize)**2:
+                break
+            for ix in range(max(cx-r,0),min(cx+r,nx)+1):
+                for iy in range(max(cy-r,0),min(cy+r,ny)+1):
+                    onShell = abs(ix-cx) == r or abs(iy-cy) == r
+                    for iz in range(max(cz-r,0),min(cz+r,nz)+1):
+                        if not onShell and abs(iz-cz) != r:
+                            continue
+                        for i in cells.get((ix,iy,iz),()):
+                            d = pts[i].DistanceToSquared(pt)
+                            if d <= bestDist:
+                                best,bestDist = i,d
+        indices.append(best)
+        
+    return indices
+
 if AnchorGeo and Mesh and not None in AnchorGeo:
     
     # Make output datatrees
     PointIndices = gh.DataTree[int]()
     AnchorPts = gh.DataTree[rc.Geometry.Point3d]()
     
-    # Make mesh vertices point search list
-    ptsList = rc.Collections.Point3dList(Mesh.Vertices.ToPoint3dArray())
+    # Get anchor start and end points
+    aPtsS,aPtsE = [],[]
+    for ag in AnchorGeo:
+        if isinstance(ag,rc.Geometry.Curve):
+            aPtsS.append(ag.PointAtStart)
+            aPtsE.append(ag.PointAtEnd)
+        elif isinstance(ag,rc.Geometry.Point3d):
+            aPtsS.append(ag)
+            aPtsE.append(ag)
+            
+    # Get indices of points to anchor from the (cached) mesh vertex grid
+    aPtIds = closestVertexIndices(getVertexGrid(Mesh),aPtsS,Tolerance)
     
-    for i,ag in enumerate(AnchorGeo):
+    unmatched = []
+    for i,aPtId in enumerate(aPtIds):
         
+        # Skip anchors which have no mesh vertex within the tolerance
+        if aPtId < 0:
+            unmatched.append(i)
+            continue
+            
         # Make datatree path
         p = gh.Kernel.Data.GH_Path(i)
         
-        # Get anchor start and end points
-        if isinstance(ag,rc.Geometry.Curve):
-            aPtS = ag.PointAtStart
-            aPtE = ag.PointAtEnd
-        elif isinstance(ag,rc.Geometry.Point3d):
-            aPtS = ag
-            aPtE = ag
-            
-        # Get index of points to anchor and add to PointIndices datatree
-        aPtId = ptsList.ClosestIndex(aPtS)
+        # Add index of point to anchor and anchor end point to datatrees
         PointIndices.AddRange((aPtId,),p)
+        AnchorPts.Add(aPtsE[i],p)
         
-        # Add anchor end points to datatree
-        AnchorPts.Add(aPtE,p)
+    # Report the anchors which were skipped
+    if unmatched:
+        msg = "No mesh vertex within tolerance of anchors: " + ", ".join(str(i) for i in unmatched)
+        ghenv.Component.AddRuntimeMessage(gh.Kernel.GH_RuntimeMessageLevel.Warning,msg)
         
 else:
     PointIndices = []
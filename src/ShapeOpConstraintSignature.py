@@ -4,7 +4,7 @@ component to add and edit ShapeOp constraints.
 -
 Authors: Anders Holden Deleuran (CITA/KADK), Mario Deuss (LGG/EPFL) 
 Github: github.com/AndersDeleuran/ShapeOpGHPython
-Updated: 150330
+Updated: 261017
     Args:
         ConstraintType:
             A string containing one of the following constraint types (see documentation for more info):
@@ -28,7 +28,7 @@ Updated: 150330
                 LaplacianDisplacement = takes 2 or more indices, center vertex first, then the one ring neighborhood.
                 AngleConstraint = takes 3 indices forming two consecutive edges.
         PointIndices:
-            A datatree of indices of the points subject to the constraints.
+            A datatree of indices of the points subject to the constraints, or a source of index blocks from the ShapeOpMeshIndexer (in which case a single weight and a single set of scalars are used, unless the scalars are derived from Points).
         Weights:
             A list of weights of the constraints to be added relative to the other constraints in the ShapeOpSolver (if a single value is provided the same weight will be used).
         Scalars:
@@ -44,51 +44,201 @@ Updated: 150330
                 Similarity = The scalars have 3 * n * m entries, where m is the number of candidate shapes that the constrained vertices should be similar to,and n is the number of points in each candidate shape (the same as the number of constrained vertices). Each block of 3 * n scalars provides the point coordinates of a candidate shape.
                 Rigid = Same as for "Similarity", see above.
                 AngleConstraint =The scalars have 2 entries: (1) minAngle; (2) maxAngle.
+        Points:
+            Optional points which the constraint indices refer to, if provided the scalars of these constraint types are derived from the current points instead of taken from Scalars:
+                -
+                EdgeStrain = The desired distance is the current edge length times Factor, rangeMin/rangeMax are 1.
+                Closeness = The desired coordinates are the current point coordinates.
+                Similarity = The candidate shape is the current shape of the constrained points, scaled by Factor about its centroid.
+                Rigid = Same as for "Similarity", see above.
+            With a source of index blocks the derived scalars of each constraint are stored in the signature (8 bytes per scalar, e.g. 24 bytes per EdgeStrain constraint), so memory is no longer bounded by the block size.
+        Factor: Optional multiplier of the derived EdgeStrain lengths and Similarity/Rigid shapes (default = 1.0).
     Returns:
-        ConstraintSigs: A Python dictionary which wraps all the data for constructing the constraints.
+        ConstraintSigs: A Python dictionary which wraps all the data for constructing the constraints. The point indices, weights and scalars are stored in flat typed arrays (with offsets per constraint), a single weight or a single set of scalars is stored once and shared by all the constraints. With a source of index blocks the point indices are not stored, the solver generates them block by block.
 """
 
 import Rhino as rc
+import Grasshopper as gh
+import math
+from array import array
 
 # Set component name
 ghenv.Component.Name = "ShapeOpConstraintSignature"
 ghenv.Component.NickName = "SOCSig"
 
-if PointIndices.DataCount and ConstraintType and len(Weights):    
+# Set defaults
+if Factor is None:
+    Factor = 1.0
     
-    # Make dict for storing shapeop constraint signature
-    ConstraintSigs = {"type":ConstraintType, "pointIndices":[], "weights":[], "scalars":[]}
+def flattenPoints(points):
     
-    # Convert PointIndices datatree to nested Python list and add to dict
-    ConstraintSigs["pointIndices"] = [list(i) for i in PointIndices.Branches]
+    """ Flatten a list of points to a flat array of their coordinates """
     
-    # Add Scalars to dict if there are any
-    if Scalars.DataCount:
+    return array("d",[c for pt in points for c in (pt.X,pt.Y,pt.Z)])
+
+def flattenScalars(branch):
+    
+    """ Flatten a scalars datatree branch, points are flattened to their coordinates """
+    
+    if isinstance(branch[0],rc.Geometry.Point3d):
+        return flattenPoints(branch)
         
-        # Convert datatree to python list and ensure that length matches PointIndices
-        scalars = [list(i) for i in Scalars.Branches]
-        if len(scalars) != PointIndices.BranchCount:
-            scalars = [list(Scalars.Branches[0]) for i in range(PointIndices.BranchCount)]
-            
-        # Case for point scalars datatree
-        if isinstance(scalars[0][0],rc.Geometry.Point3d):
-            for l in scalars:
-                coords = []
-                for pt in l:
-                    coords.append(pt.X)
-                    coords.append(pt.Y)
-                    coords.append(pt.Z)
-                ConstraintSigs["scalars"].append(coords)
+    return branch
+
+def flattenTree(tree):
+    
+    """ Flatten a datatree in one pass over all its data and get the offsets
+    of each branch, points are flattened to their coordinates (with offsets
+    to match) """
+    
+    data = list(tree.AllData())
+    offsets = array("i",[0])
+    for b in tree.Branches:
+        offsets.append(offsets[-1]+b.Count)
+    if data and isinstance(data[0],rc.Geometry.Point3d):
+        return flattenPoints(data),array("i",[o*3 for o in offsets])
+        
+    return data,offsets
+
+# Scalar derivation functions: these get the scalars of each constraint from
+# the flat point coordinates (and their x, y and z columns) and the flat
+# indices and offsets of the constraints, and return flat scalars plus offsets
+
+def lengthScalars(coords,columns,indices,offsets,factor):
+    
+    """ Get the current length of each edge times factor, followed by a
+    rangeMin/rangeMax of 1 """
+    
+    xs,ys,zs = columns
+    edges = [(indices[o],indices[o+1]) for o in offsets[:-1]]
+    lengths = [math.sqrt((xs[a]-xs[b])**2+(ys[a]-ys[b])**2+(zs[a]-zs[b])**2)*factor for a,b in edges]
+    scalars = array("d",[v for l in lengths for v in (l,1.0,1.0)])
+    
+    return scalars,array("i",range(0,len(scalars)+1,3))
+
+def positionScalars(coords,columns,indices,offsets,factor):
+    
+    """ Get the current coordinates of the point of each constraint """
+    
+    scalars = array("d",[c for o in offsets[:-1] for c in coords[indices[o]*3:indices[o]*3+3]])
+    
+    return scalars,array("i",range(0,len(scalars)+1,3))
+
+def shapeScalars(coords,columns,indices,offsets,factor):
+    
+    """ Get the current coordinates of the points of each constraint, scaled
+    by factor about their centroid """
+    
+    scalars = array("d",[c for v in indices for c in coords[v*3:v*3+3]])
+    if factor != 1.0:
+        for k in range(len(offsets)-1):
+            b,e = offsets[k]*3,offsets[k+1]*3
+            n = float(offsets[k+1]-offsets[k])
+            centroid = [sum(scalars[b+j:e:3])/n for j in range(3)]
+            for i in range(b,e):
+                c = centroid[i%3]
+                scalars[i] = c+(scalars[i]-c)*factor
                 
-        # Case for simple float datatree
+    return scalars,array("i",[o*3 for o in offsets])
+
+# The constraint types whose scalars can be derived from the current points
+derivedScalars = {
+    "EdgeStrain":lengthScalars,
+    "Closeness":positionScalars,
+    "Similarity":shapeScalars,
+    "Rigid":shapeScalars}
+
+def deriveScalars(constraintType,points,blocks,factor):
+    
+    """ Derive the scalars of each constraint from the current points for a
+    sequence of blocks of flat indices and offsets. Returns the flat scalars
+    and their offsets, or None if the points do not cover the indices """
+    
+    derive = derivedScalars[constraintType]
+    coords = flattenPoints(points)
+    columns = coords[0::3],coords[1::3],coords[2::3]
+    scalars,offsets = array("d"),array("i",[0])
+    for indices,idOffsets in blocks:
+        if indices and (min(indices) < 0 or max(indices) >= len(points)):
+            msg = "The Points do not cover the PointIndices, the scalars are not derived."
+            ghenv.Component.AddRuntimeMessage(gh.Kernel.GH_RuntimeMessageLevel.Warning,msg)
+            return None
+        sc,scOffsets = derive(coords,columns,indices,idOffsets,factor)
+        base = len(scalars)
+        scalars.extend(sc)
+        offsets.extend(array("i",[base+o for o in scOffsets[1:]]))
+        
+    return scalars,offsets
+
+def getIndexBlocks(tree):
+    
+    """ Get the source of index blocks made by the ShapeOpMeshIndexer if the
+    PointIndices datatree holds one, otherwise None """
+    
+    if tree.DataCount == 1:
+        item = tree.Branches[0][0]
+        if isinstance(item,dict) and item.get("format") == "blocks":
+            return item
+            
+    return None
+
+indexBlocks = getIndexBlocks(PointIndices)
+
+if indexBlocks and ConstraintType and len(Weights):
+    
+    # Make dict for storing the constraint signature of a source of index
+    # blocks, with a single weight and a single set of scalars (or the
+    # scalars of each constraint if they are derived from the points)
+    ConstraintSigs = {"type":ConstraintType, "format":"blocks", "count":indexBlocks["count"],
+                      "indexCount":indexBlocks["indexCount"], "key":indexBlocks["key"], "blocks":indexBlocks["blocks"],
+                      "weights":array("d",[Weights[0]]), "scalars":array("d"), "scalarOffsets":None}
+    derived = None
+    if Points and ConstraintType in derivedScalars:
+        derived = deriveScalars(ConstraintType,Points,indexBlocks["blocks"](),Factor)
+    if derived:
+        ConstraintSigs["scalars"],ConstraintSigs["scalarOffsets"] = derived
+    elif Scalars.DataCount:
+        ConstraintSigs["scalars"].extend(flattenScalars(Scalars.Branches[0]))
+        
+    # Output to GH (wrap in list to send as one item)
+    ConstraintSigs = [ConstraintSigs,]
+    
+elif PointIndices.DataCount and ConstraintType and len(Weights):    
+    
+    # Make dict for storing compact shapeop constraint signature
+    ConstraintSigs = {"type":ConstraintType, "format":"compact", "count":PointIndices.BranchCount,
+                      "pointIndices":array("i"), "indexOffsets":array("i",[0]),
+                      "weights":array("d"), "scalars":array("d"), "scalarOffsets":None}
+    
+    # Flatten PointIndices datatree with the offsets of each branch
+    indices,offsets = flattenTree(PointIndices)
+    ConstraintSigs["pointIndices"].extend(indices)
+    ConstraintSigs["indexOffsets"] = offsets
+    
+    # Derive the scalars from the points for the types which support it
+    derived = None
+    if Points and ConstraintType in derivedScalars:
+        blocks = [(ConstraintSigs["pointIndices"],ConstraintSigs["indexOffsets"])]
+        derived = deriveScalars(ConstraintType,Points,blocks,Factor)
+    if derived:
+        ConstraintSigs["scalars"],ConstraintSigs["scalarOffsets"] = derived
+        
+    # Add Scalars to dict if there are any
+    elif Scalars.DataCount:
+        
+        # Store a single set of scalars once if the length does not match PointIndices
+        if Scalars.BranchCount != PointIndices.BranchCount:
+            ConstraintSigs["scalars"].extend(flattenScalars(Scalars.Branches[0]))
         else:
-            ConstraintSigs["scalars"] = scalars
+            scalars,offsets = flattenTree(Scalars)
+            ConstraintSigs["scalars"].extend(scalars)
+            ConstraintSigs["scalarOffsets"] = offsets
             
-    # Add weights to dict
+    # Add weights to dict (a single weight is stored once)
     if len(Weights) != PointIndices.BranchCount:
-        ConstraintSigs["weights"] = [Weights[0] for i in range(PointIndices.BranchCount)]
+        ConstraintSigs["weights"].append(Weights[0])
     else:
-        ConstraintSigs["weights"] = Weights
+        ConstraintSigs["weights"].extend(Weights)
 
     # Output to GH (wrap in list to send as one item)
     ConstraintSigs = [ConstraintSigs,]
@@ -3,77 +3,254 @@ Make a ShapeOp solver and solve a whole bunch of constraints!
 -
 Authors: Anders Holden Deleuran (CITA/KADK), Mario Deuss (LGG/EPFL) 
 Github: github.com/AndersDeleuran/ShapeOpGHPython
-Updated: 150402
+Updated: 261017
     Args:
-        ConstraintSigs: Signatures used for adding and editing constaints.
+        ConstraintSigs: Signatures used for adding and editing constaints (compact or the old nested list format). Duplicate constraints are merged if Merge is enabled in the settings.
         Points: Points which the solver will operate on. ConstraintSigs should be constructed using the indices of this list.
         Settings: A list of settings which will be used to set up and run the solver..
+        Variants: Optional list of (points,scalars) variants which are solved statically in parallel, points of None uses Points and scalars is a list with the scalars of each signature (None keeps the signature scalars).
     Returns:
-        Iterations: The number of iterations the solver has run.
+        Iterations: The number of iterations the solver has run (per variant in batch mode).
         ConstraintCount: The total number of contraints which are being solved.
-        Points: The constrained points after solving.
+        Points: The constrained points after solving (a branch per variant in batch mode).
+        SolverInfo: A Python dictionary with solver diagnostics (e.g. which reset path the live solver took and how it reset the velocities).
+        Profile: A Python dictionary with the time spent in each phase of the solution, the constraint counts per type and the marshalled bytes (only if Profile is enabled in the settings).
 """
 
 import Rhino as rc
 import ctypes as ct
+import json
+import math
+import os
+from array import array
+from collections import OrderedDict
+import threading
+import time
 import Grasshopper as gh
 from scriptcontext import sticky as st
-so = ct.cdll.LoadLibrary("ShapeOp.0.1.0.dll")
+
+# The Python backend, the solver registry and the snapshot files are in the
+# ShapeOpCore module, which has to be in the Grasshopper Libraries folder
+from ShapeOpCore import (PySoBackend,loadSoBackend,getSoBackendName,registerSoSolver,useSoSolver,
+                         deleteSoSolver,purgeSoSolvers,listSoSolvers,stopSoWorker,saveSoSnapshot,
+                         loadSoSnapshot,appendSoTrajectory,truncateSoTrajectory,readSoTrajectoryFrame)
 
 # Set component name
 ghenv.Component.Name = "ShapeOpConstraintSolver"
 ghenv.Component.NickName = "SOSolver"
 
-def makeSoSolver(points):
+def packSoPoints(points,ptCoords=None):
+    
+    """ Pack the points coordinates into a ctypes double array in bulk, reusing
+    the ptCoords buffer if it is passed and has the right size """
+    
+    if ptCoords is None or len(ptCoords) != len(points)*3:
+        ptCoords = (ct.c_double * (len(points)*3))()
+    ptCoords[:] = [c for pt in points for c in (pt.X,pt.Y,pt.Z)]
+    
+    return ptCoords
+
+def unpackSoPoints(ptCoords):
+    
+    """ Unpack a ctypes double array of points coordinates into a list of
+    points, reading the coordinates through one iterator three at a time
+    instead of making a slice per axis """
+    
+    coords = iter(ptCoords[:])
+    
+    return list(map(rc.Geometry.Point3d,coords,coords,coords))
+
+def makeSoSolver(points,ptCoords=None,component=None,kind="variant"):
     
-    """ Make ShapeOp solver and returns its ID and points coordinates ID """
+    """ Make ShapeOp solver and returns its ID and points coordinates ID, the
+    ptCoords buffer is reused if it is passed and has the right size. The
+    solver is registered as owned by the component (see registerSoSolver) """
     
     solver = so.shapeop_create()
+    registerSoSolver(solver,so,component,kind,len(points))
     
     # Make ctypes double array containing points coordinates
-    ptCoords = (ct.c_double * (len(points)*3))()
-    for i in range(len(points)):
-        b = 3*i
-        ptCoords[b] = float(points[i].X)
-        ptCoords[b+1] = float(points[i].Y)
-        ptCoords[b+2] = float(points[i].Z)
-        
+    ptCoords = packSoPoints(points,ptCoords)
+    
    # Add points coordinates to solver
     so.shapeop_setPoints(solver,ct.byref(ptCoords),len(points))
     
     return solver,ptCoords
 
-def addSoConstraint(solver,constraintType,pointIndices,weight):
+def makeSoTypeName(constraintType):
+    
+    """ Make the ctypes string of a constraint type name, which must be made
+    from bytes on Python 3 """
+    
+    return ct.c_char_p(constraintType.encode("ascii"))
+
+def compactSoConstraintSig(csd):
+    
+    """ Convert a constraint signature dictionary with nested lists (i.e. the
+    old format) to the compact format made by ShapeOpConstraintSignature,
+    compact signatures are returned as they are. In the compact format the
+    point indices and scalars are flat typed arrays with offsets per constraint,
+    and a single weight or scalars offsets of None means they are shared.
+    Signatures of index blocks are also returned as they are """
+    
+    if csd.get("format") in ("compact","blocks"):
+        return csd
+        
+    indices,offsets = array("i"),array("i",[0])
+    for ids in csd["pointIndices"]:
+        indices.extend(ids)
+        offsets.append(len(indices))
+        
+    scalars,scOffsets = array("d"),None
+    if csd["scalars"]:
+        scOffsets = array("i",[0])
+        for sc in csd["scalars"]:
+            scalars.extend(sc)
+            scOffsets.append(len(scalars))
+            
+    return {"type":csd["type"],"format":"compact","count":len(offsets)-1,
+            "pointIndices":indices,"indexOffsets":offsets,
+            "weights":array("d",csd["weights"]),
+            "scalars":scalars,"scalarOffsets":scOffsets}
+
+def getSoConstraintScalars(csd,i):
+    
+    """ Get the scalars of constraint i of a compact constraint signature """
+    
+    scOffsets = csd["scalarOffsets"]
+    if scOffsets is None:
+        return csd["scalars"]
+        
+    return csd["scalars"][scOffsets[i]:scOffsets[i+1]]
+
+# Constraint types whose constraint does not depend on the order of its points
+unorderedSoTypes = ("Closeness","EdgeStrain","TriangleStrain","TetrahedronStrain",
+                    "Area","Volume","Line","Plane","Circle","Sphere")
+
+def mergeSoConstraintSigs(constraintSigs):
     
-    """ Add a constraint: The solver is ID of shapeop solver, constraintType
-    is name of constraint type to apply, pointIndices is list of points indices
-    to operate on, weight is a float """
+    """ Merge duplicate constraints (of the same type on the same points) of
+    compact constraint signatures by summing their weights into the first of
+    them. Duplicates with different scalars are conflicts and are kept. The
+    points are compared as sets for the types in unorderedSoTypes and as
+    sequences otherwise. Signatures of index blocks are returned as they are.
+    Returns the merged signatures and a dictionary with the merge results,
+    whose layout hashes the merged constraints and weights (which depend on
+    the scalars, so a live solver must be reset when the layout changes) """
     
-    t = ct.c_char_p(constraintType)
-    ptIds = (ct.c_int * len(pointIndices))()
-    for i,v in enumerate(pointIndices):
-        ptIds[i] = v
+    index = {}
+    merged,mergedCount,conflicts = [],0,[]
+    for csd in constraintSigs:
+        if csd["format"] == "blocks":
+            merged.append(csd)
+            continue
+            
+        # Make an empty signature with per constraint weights (and scalars)
+        shared = csd["scalarOffsets"] is None
+        out = {"type":csd["type"],"format":"compact","count":0,
+               "pointIndices":array("i"),"indexOffsets":array("i",[0]),"weights":array("d"),
+               "scalars":csd["scalars"] if shared else array("d"),"scalarOffsets":None if shared else array("i",[0])}
+        indices,offsets,weights = csd["pointIndices"],csd["indexOffsets"],csd["weights"]
+        unordered = csd["type"] in unorderedSoTypes
+        
+        # Add the constraints which are not duplicates, and sum the weights of those that are
+        for i in range(csd["count"]):
+            ids = indices[offsets[i]:offsets[i+1]]
+            key = (csd["type"],tuple(sorted(ids)) if unordered else tuple(ids))
+            scalars = tuple(getSoConstraintScalars(csd,i))
+            weight = weights[0] if len(weights) == 1 else weights[i]
+            if key in index:
+                first,j,firstScalars = index[key]
+                if firstScalars == scalars:
+                    first["weights"][j] += weight
+                    mergedCount += 1
+                    continue
+                conflicts.append((csd["type"],list(ids)))
+            else:
+                index[key] = (out,out["count"],scalars)
+            out["pointIndices"].extend(ids)
+            out["indexOffsets"].append(len(out["pointIndices"]))
+            out["weights"].append(weight)
+            if not shared:
+                out["scalars"].extend(scalars)
+                out["scalarOffsets"].append(len(out["scalars"]))
+            out["count"] += 1
+        merged.append(out)
         
-    id = so.shapeop_addConstraint(solver,t,ct.byref(ptIds),len(pointIndices),weight)
-    if id < 0 :
-        raise LookupError("addSoConstraint failed adding a constraint of type "+constraintType)
+    # Hash the layout of the merged constraints
+    layout = hash(tuple(csd["key"] if csd["format"] == "blocks" else (csd["type"],tuple(csd["pointIndices"]),tuple(csd["weights"])) for csd in merged))
+    
+    return merged,{"merged":mergedCount,"conflicts":len(conflicts),"conflictSamples":conflicts[:10],"layout":layout}
+
+def getSoMergedSigs(ghenv,constraintSigs):
+    
+    """ Get the merged constraint signatures, reusing the last merge of this
+    component while it gets the same signature objects """
+    
+    key = "mergedSigs_" + str(ghenv.Component.InstanceGuid) + str(ghdoc.Path)
+    cached = st.get(key)
+    if cached is not None and len(cached[0]) == len(constraintSigs) and all(a is b for a,b in zip(cached[0],constraintSigs)):
+        return cached[1],cached[2]
+    merged,mergeInfo = mergeSoConstraintSigs(constraintSigs)
+    st[key] = (list(constraintSigs),merged,mergeInfo)
     
-    return id
+    return merged,mergeInfo
 
-def editSoConstraint(solver,constraintType,constraintId,scalars):
+def iterSoIndexBlocks(csd):
     
-    """ Edit a constraint: solver is ID of shapeop solver, constraintType
-    is name of constraint type to edit, constraintId is ID if the constraint.
-    scalars is list of floats """
+    """ Iterate over the point indices of a constraint signature as blocks of
+    flat (indices,offsets) arrays, a compact signature is a single block """
     
-    t = ct.c_char_p(constraintType)
-    scalarsC = (ct.c_double * len(scalars))()
-    for i,s in enumerate(scalars):
-        scalarsC[i] = s
+    if csd["format"] == "blocks":
+        return csd["blocks"]()
         
-    errCode = so.shapeop_editConstraint(solver,t,constraintId,ct.byref(scalarsC),len(scalars))
-    if errCode != 0 :
-        raise LookupError("editSoConstraint failed editing constraint. Check that SOGSig scalars are correctly defined.")
+    return iter([(csd["pointIndices"],csd["indexOffsets"])])
+
+def countSoIndices(csd):
+    
+    """ Get the number of point indices of a constraint signature """
+    
+    if csd["format"] == "blocks":
+        return csd["indexCount"]
+        
+    return len(csd["pointIndices"])
+
+def addSoConstraints(solver,csd):
+    
+    """ Add (and edit) all the constraints of a constraint signature in one
+    pass over its flat buffers, returns the list of constraint IDs. Index
+    blocks are copied to ctypes one block at a time """
+    
+    # Make the constraint type and the flat scalars ctypes buffer once
+    constraintType = csd["type"]
+    t = makeSoTypeName(constraintType)
+    weights = csd["weights"]
+    scalars,scOffsets = csd["scalars"],csd["scalarOffsets"]
+    scalarsC = None
+    if scalars:
+        scalarsC = (ct.c_double * len(scalars))(*scalars)
+    intSize = ct.sizeof(ct.c_int)
+    doubleSize = ct.sizeof(ct.c_double)
+    
+    # Add (and edit) the constraints, pointing into the flat buffers
+    csids = []
+    for indices,idOffsets in iterSoIndexBlocks(csd):
+        ptIds = (ct.c_int * len(indices))(*indices)
+        for k in range(len(idOffsets)-1):
+            i = len(csids)
+            b,e = idOffsets[k],idOffsets[k+1]
+            weight = weights[0] if len(weights) == 1 else weights[i]
+            id = so.shapeop_addConstraint(solver,t,ct.byref(ptIds,b*intSize),e-b,weight)
+            if id < 0 :
+                raise LookupError("addSoConstraint failed adding a constraint of type "+constraintType)
+            csids.append(id)
+            if scalarsC is not None:
+                b,e = (0,len(scalars)) if scOffsets is None else (scOffsets[i],scOffsets[i+1])
+                errCode = so.shapeop_editConstraint(solver,t,id,ct.byref(scalarsC,b*doubleSize),e-b)
+                if errCode != 0 :
+                    raise LookupError("editSoConstraint failed editing constraint. Check that SOGSig scalars are correctly defined.")
+                    
+    return csids
 
 def addUnaryForce(solver,vector):
     
@@ -86,44 +263,836 @@ def addUnaryForce(solver,vector):
     
     so.shapeop_addGravityForce(solver,fv)
 
-def runSoSolverStatic(constraintSigs,points,settings):
+def measureSoDisplacement(ptCoords,prevCoords):
+    
+    """ Get the maximum and root mean square point displacement between two
+    points coordinates buffers """
+    
+    d = [a-b for a,b in zip(ptCoords,prevCoords)]
+    sq = [dx*dx+dy*dy+dz*dz for dx,dy,dz in zip(d[0::3],d[1::3],d[2::3])]
+    if not sq:
+        return 0.0,0.0
+        
+    return math.sqrt(max(sq)),math.sqrt(sum(sq)/len(sq))
+
+def solveSoConverged(solver,ptCoords,pointCount,settings):
+    
+    """ Solve in chunks of iterations until the maximum point displacement
+    between two chunks is below the tolerance, the time budget (in seconds)
+    is spent or all the iterations are used. Returns the number of iterations
+    run and the residual history as (iterations,max,rms) tuples """
+    
+    maxIterations = settings["iterations"]
+    chunk = max(settings.get("chunk") or 10,1)
+    tolerance = settings.get("tolerance")
+    timeBudget = settings.get("timeBudget")
+    
+    startTime = time.time()
+    prevCoords = ptCoords[:]
+    iterations,residuals = 0,[]
+    while iterations < maxIterations:
+        
+        # Solve a chunk and measure the displacement since the last one
+        n = min(chunk,maxIterations-iterations)
+        err_code = so.shapeop_solve(solver,n)
+        if err_code != 0 :
+            raise LookupError("ShapeOp solve failed.")
+        iterations += n
+        so.shapeop_getPoints(solver,ct.byref(ptCoords),pointCount)
+        maxD,rmsD = measureSoDisplacement(ptCoords,prevCoords)
+        residuals.append((iterations,maxD,rmsD))
+        
+        # Stop when converged or out of time
+        if tolerance is not None and maxD <= tolerance:
+            break
+        if timeBudget is not None and time.time()-startTime >= timeBudget:
+            break
+        prevCoords = ptCoords[:]
+        
+    return iterations,residuals
+
+def estimateSoSolverBytes(pointCount,constraintSigs):
+    
+    """ Roughly estimate the native memory used by a solver from its number
+    of points, constraints and constrained point indices """
+    
+    csCount = sum(csd["count"] for csd in constraintSigs)
+    idCount = sum(countSoIndices(csd) for csd in constraintSigs)
+    
+    return 8*3*pointCount*6 + 56*idCount + 128*csCount
+
+def makeSoProfile():
+    
+    """ Make a profile which times the phases of one solution """
+    
+    return {"phases":OrderedDict(),"bytes":OrderedDict(),"start":time.time(),"mark":time.time()}
+
+def markSoPhase(profile,phase,byteCount=0):
+    
+    """ Add the time since the last mark (and the bytes marshalled) to a phase
+    of the profile, does nothing if profiling is off (i.e. profile is None) """
+    
+    if profile is None:
+        return
+    now = time.time()
+    profile["phases"][phase] = profile["phases"].get(phase,0.0) + now-profile["mark"]
+    profile["bytes"][phase] = profile["bytes"].get(phase,0) + byteCount
+    profile["mark"] = now
+
+def measureSoSigBytes(constraintSigs):
     
-    """ Run the ShapeOp solver statically and return the points """
+    """ Get the number of bytes marshalled to the solver when adding the
+    constraints of the constraint signatures """
     
-    # Make ShapeOp solver
+    return sum(ct.sizeof(ct.c_int)*countSoIndices(csd) + ct.sizeof(ct.c_double)*(len(csd["weights"])+len(csd["scalars"]))
+               for csd in constraintSigs)
+
+def finishSoProfile(profile,constraintSigs,logPath=None,logBytes=1024*1024):
+    
+    """ Finish a profile with the total time and the constraint counts per
+    type, and append it as a line of JSON to the log file if logPath is set.
+    The log file is rolled over to logPath + ".1" when it grows past logBytes """
+    
+    counts = OrderedDict()
+    for csd in constraintSigs:
+        counts[csd["type"]] = counts.get(csd["type"],0) + csd["count"]
+    result = {"phases":dict(profile["phases"]),"bytes":dict(profile["bytes"]),
+              "total":time.time()-profile["start"],"constraints":dict(counts)}
+              
+    if logPath:
+        if os.path.exists(logPath) and os.path.getsize(logPath) > logBytes:
+            if os.path.exists(logPath + ".1"):
+                os.remove(logPath + ".1")
+            os.rename(logPath,logPath + ".1")
+        with open(logPath,"a") as f:
+            f.write(json.dumps(dict(result,time=profile["start"])) + "\n")
+            
+    return result
+
+def getSoStaticCache():
+    
+    """ Get the cache of initialized static solvers from sticky """
+    
+    if "ShapeOpStaticCache" not in st:
+        st["ShapeOpStaticCache"] = OrderedDict()
+        
+    return st["ShapeOpStaticCache"]
+
+def freeSoStaticCache(cache,owner,maxCount=0,maxBytes=0):
+    
+    """ Delete the least recently used solvers of an owner component in the
+    cache until it holds at most maxCount of its solvers using at most
+    maxBytes, the cache settings of a component only limit its own solvers """
+    
+    keys = [k for k,e in cache.items() if e.get("owner") == owner]
+    totalBytes = sum(cache[k]["bytes"] for k in keys)
+    while keys and (len(keys) > maxCount or totalBytes > maxBytes):
+        entry = cache.pop(keys.pop(0))
+        deleteSoSolver(entry["solver"],so)
+        totalBytes -= entry["bytes"]
+
+def makeSoResultKey(constraintSigs,editableCS,settings):
+    
+    """ Make the key of what decides the result of solving an initialized
+    static solver: the scalars of its editable constraints and the iteration
+    settings """
+    
+    scalars = gatherSoEditableScalars(constraintSigs,editableCS)[0]
+    
+    return (tuple(scalars),settings["iterations"],settings.get("tolerance"),settings.get("timeBudget"),settings.get("chunk"))
+
+def runSoSolverStatic(ghenv,constraintSigs,points,settings,profile=None):
+    
+    """ Run the ShapeOp solver statically and return the points. Initialized
+    solvers are cached on their constraint topology and points, so that they
+    can be reused when only scalars or iterations change """
+    
+    cache = getSoStaticCache()
+    cacheSize = settings.get("cacheSize",0)
+    owner = str(ghenv.Component.InstanceGuid)
+    
+    # Look up a cached solver (only when caching is on, so that a component
+    # which does not cache never takes the solver of another component),
+    # comparing the topology too in case of a hash collision
+    topology = topologyHash = entry = None
+    if cacheSize > 0:
+        topology = makeSoTopology(constraintSigs,points,settings)
+        topologyHash = hash(topology)
+        entry = cache.pop(topologyHash,None)
+        if entry is not None and entry["topology"] != topology:
+            deleteSoSolver(entry["solver"],so)
+            entry = None
+    markSoPhase(profile,"cache")
+    
+    # Return the cached result if nothing has changed
+    if entry is not None and entry["result"] is not None:
+        if entry["result"][0] == makeSoResultKey(constraintSigs,entry["editableCS"],settings):
+            cache[topologyHash] = entry
+            points,iterations,info = entry["result"][1:]
+            info = dict(info,cache="result")
+            useSoSolver(entry["solver"])
+            markSoPhase(profile,"cache")
+            return list(points),iterations,entry["csCount"],info
+            
+    # Delete the solver if anything fails, it is not in the cache while solving
+    solver = entry["solver"] if entry is not None else None
+    try:
+        if entry is None:
+            
+            # Make ShapeOp solver
+            solver,ptCoords = makeSoSolver(points,None,ghenv.Component,"static")
+            
+            # Add constraints to the solver from the constraint signatures dictionary
+            csCount = 0
+            editableCS = []
+            for i,csd in enumerate(constraintSigs):
+                csids = addSoConstraints(solver,csd)
+                csCount += len(csids)
+                if csd["scalars"]:
+                    editableCS.extend((i,j,csid) for j,csid in enumerate(csids))
+            markSoPhase(profile,"register",len(ptCoords)*ct.sizeof(ct.c_double) + measureSoSigBytes(constraintSigs))
+                    
+            # Initialize solver
+            err_code = so.shapeop_init(solver)
+            if err_code != 0 :
+                raise LookupError("ShapeOp initialization failed.")
+            markSoPhase(profile,"init")
+                
+            entry = {"solver":solver,"ptCoords":ptCoords,"csCount":csCount,"editableCS":editableCS,
+                     "sent":gatherSoEditableScalars(constraintSigs,editableCS),"result":None,
+                     "bytes":estimateSoSolverBytes(len(points),constraintSigs),"owner":owner,"topology":topology}
+            useSoSolver(solver,bytes=entry["bytes"],release=[(cache,topologyHash)])
+            info = {"cache":"miss"}
+            
+        else:
+            
+            # Move the points back to their input positions and push changed scalars
+            solver,ptCoords = entry["solver"],packSoPoints(points,entry["ptCoords"])
+            so.shapeop_setPoints(solver,ct.byref(ptCoords),len(points))
+            entry["sent"] = updateSoEditableConstraints(solver,constraintSigs,entry["editableCS"],entry["sent"])[0]
+            info = {"cache":"solver"}
+            useSoSolver(solver)
+            markSoPhase(profile,"edit",len(ptCoords)*ct.sizeof(ct.c_double))
+            
+        # Solve until converged or solve all the iterations in one go
+        if settings.get("tolerance") is not None or settings.get("timeBudget") is not None:
+            iterations,residuals = solveSoConverged(solver,ptCoords,len(points),settings)
+            tolerance = settings.get("tolerance")
+            info["residuals"] = residuals
+            info["converged"] = bool(residuals) and tolerance is not None and residuals[-1][1] <= tolerance
+        else:
+            iterations = settings["iterations"]
+            err_code = so.shapeop_solve(solver,iterations)
+            if err_code != 0 :
+                raise LookupError("ShapeOp solve failed.")
+            so.shapeop_getPoints(solver,ct.byref(ptCoords),len(points))
+        markSoPhase(profile,"solve",len(ptCoords)*ct.sizeof(ct.c_double))
+            
+        # Update and return the points list
+        points = unpackSoPoints(ptCoords)
+        markSoPhase(profile,"points")
+    except Exception:
+        if solver is not None:
+            deleteSoSolver(solver,so)
+        raise
+        
+    # Cache the solver and its result, or delete it if caching is off
+    if cacheSize > 0:
+        entry["result"] = (makeSoResultKey(constraintSigs,entry["editableCS"],settings),points,iterations,info)
+        cache[topologyHash] = entry
+        freeSoStaticCache(cache,owner,cacheSize,settings.get("cacheMemory",512)*1024*1024)
+    else:
+        deleteSoSolver(solver,so)
+        
+    return list(points),iterations,entry["csCount"],info
+
+def mapSoThreads(function,items,workers):
+    
+    """ Call function on each item using a pool of worker threads and return
+    the results in the order of the items """
+    
+    results = [None]*len(items)
+    errors = []
+    lock = threading.Lock()
+    remaining = iter(range(len(items)))
+    
+    def work():
+        while not errors:
+            with lock:
+                i = next(remaining,None)
+            if i is None:
+                return
+            try:
+                results[i] = function(items[i])
+            except Exception as e:
+                errors.append(e)
+                
+    threads = [threading.Thread(target=work) for i in range(max(min(workers,len(items)),1))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+        
+    return results
+
+def solveSoVariant(constraintSigs,points,scalars,settings):
+    
+    """ Solve one variant of the constraint signatures on its own solver. The
+    scalars list has one entry per signature which replaces its scalars (in
+    the same layout), None keeps the signature scalars. Returns the points and
+    the number of iterations run """
+    
+    # Replace the signature scalars with the variant scalars, which must have
+    # the same length as the offsets of the signature scalars index into them
+    if scalars:
+        for csd,sc in zip(constraintSigs,scalars):
+            if sc is not None and len(sc) != len(csd["scalars"]):
+                raise LookupError("The variant scalars of the " + csd["type"] + " signature have " + str(len(sc)) +
+                                  " values but the signature has " + str(len(csd["scalars"])) + ".")
+        constraintSigs = [csd if sc is None else dict(csd,scalars=array("d",sc)) for csd,sc in zip(constraintSigs,scalars)]
+        
     solver,ptCoords = makeSoSolver(points)
+    try:
+        for csd in constraintSigs:
+            addSoConstraints(solver,csd)
+        err_code = so.shapeop_init(solver)
+        if err_code != 0 :
+            raise LookupError("ShapeOp initialization failed.")
+        if settings.get("tolerance") is not None or settings.get("timeBudget") is not None:
+            iterations = solveSoConverged(solver,ptCoords,len(points),settings)[0]
+        else:
+            iterations = settings["iterations"]
+            err_code = so.shapeop_solve(solver,iterations)
+            if err_code != 0 :
+                raise LookupError("ShapeOp solve failed.")
+            so.shapeop_getPoints(solver,ct.byref(ptCoords),len(points))
+    finally:
+        deleteSoSolver(solver,so)
+        
+    return unpackSoPoints(ptCoords),iterations
+
+def runSoSolverBatch(constraintSigs,points,variants,settings):
+    
+    """ Solve many variants of the same constraint topology statically and
+    concurrently on a pool of threads. Each variant is a (points,scalars) pair
+    where points of None uses the input points (see solveSoVariant for scalars).
+    Returns the points and iterations of each variant in the input order """
+    
+    # Solve the variants on the thread pool
+    workers = settings.get("workers") or 1
+    startTime = time.time()
+    results = mapSoThreads(lambda v: solveSoVariant(constraintSigs,v[0] or points,v[1],settings),variants,workers)
+    elapsed = time.time() - startTime
+    
+    # Make the diagnostics
+    info = {"variants":len(variants),"workers":workers,"seconds":elapsed}
+    if elapsed > 0:
+        info["variantsPerSecond"] = len(variants)/elapsed
+    csCount = sum(csd["count"] for csd in constraintSigs)
+    
+    return [r[0] for r in results],[r[1] for r in results],csCount,info
+
+def partitionSoConstraintSigs(constraintSigs,pointCount):
+    
+    """ Partition the constraints into the connected components of the graph
+    of points they connect, using union-find over the point indices. Returns
+    a list with the point indices of each component and a list with the
+    compact constraint signatures of each component, whose point indices are
+    local to the component """
     
-    # Add constraints to the solver from the constraint signatures dictionary
-    csCount = 0
+    # Union the points of each constraint
+    parent = list(range(pointCount))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
     for csd in constraintSigs:
-        for i in range(len(csd["pointIndices"])):
-            csid = addSoConstraint(solver,csd["type"],csd["pointIndices"][i],csd["weights"][i])
-            csCount += 1
-            if csd["scalars"]:
-                editSoConstraint(solver,csd["type"],csid,csd["scalars"][i])
+        for indices,offsets in iterSoIndexBlocks(csd):
+            for k in range(len(offsets)-1):
+                r = find(indices[offsets[k]])
+                for j in range(offsets[k]+1,offsets[k+1]):
+                    q = find(indices[j])
+                    if q != r:
+                        parent[q] = r
+                        
+    # Number the components and map each point to its index in its component
+    componentOf,local,members = {},[0]*pointCount,[]
+    for i in range(pointCount):
+        r = find(i)
+        if r not in componentOf:
+            componentOf[r] = len(members)
+            members.append(array("i"))
+        c = componentOf[r]
+        local[i] = len(members[c])
+        members[c].append(i)
+    componentOf = [componentOf[find(i)] for i in range(pointCount)]
+    
+    # Split each signature into a compact signature per component
+    sigs = [[] for c in members]
+    for csd in constraintSigs:
+        weights,shared = csd["weights"],csd["scalarOffsets"] is None
+        parts = {}
+        i = 0
+        for indices,offsets in iterSoIndexBlocks(csd):
+            for k in range(len(offsets)-1):
+                ids = indices[offsets[k]:offsets[k+1]]
+                c = componentOf[ids[0]]
+                if c not in parts:
+                    parts[c] = {"type":csd["type"],"format":"compact","count":0,
+                                "pointIndices":array("i"),"indexOffsets":array("i",[0]),
+                                "weights":array("d",weights) if len(weights) == 1 else array("d"),
+                                "scalars":csd["scalars"] if shared else array("d"),
+                                "scalarOffsets":None if shared else array("i",[0])}
+                    sigs[c].append(parts[c])
+                part = parts[c]
+                part["pointIndices"].extend(local[v] for v in ids)
+                part["indexOffsets"].append(len(part["pointIndices"]))
+                if len(weights) != 1:
+                    part["weights"].append(weights[i])
+                if not shared:
+                    part["scalars"].extend(getSoConstraintScalars(csd,i))
+                    part["scalarOffsets"].append(len(part["scalars"]))
+                part["count"] += 1
+                i += 1
                 
-    # Initialize and solve
-    err_code = so.shapeop_init(solver)
-    if err_code != 0 :
-        raise LookupError("ShapeOp initialization failed.")
-    err_code = so.shapeop_solve(solver,settings["iterations"])
-    if err_code != 0 :
-        raise LookupError("ShapeOp solve failed.")
+    return members,sigs
+
+def runSoSolverPartitioned(constraintSigs,points,settings):
+    
+    """ Run the ShapeOp solver statically with a solver per connected component
+    of the constraint graph, solving the components concurrently on a pool of
+    threads and scattering their points back into the input order. Points
+    without constraints are returned as they are """
     
-    # Update and return the points list
-    so.shapeop_getPoints(solver,ct.byref(ptCoords),len(points))
-    for i in range(len(points)):
-        b = i*3
-        points[i] = rc.Geometry.Point3d(ptCoords[b],ptCoords[b+1],ptCoords[b+2])
+    startTime = time.time()
+    members,sigs = partitionSoConstraintSigs(constraintSigs,len(points))
+    partitionTime = time.time() - startTime
+    
+    # Solve the constrained components (largest first, to balance the threads)
+    components = sorted([c for c in range(len(members)) if sigs[c]],key=lambda c: -len(members[c]))
+    def solveComponent(c):
+        componentStart = time.time()
+        pts,iterations = solveSoVariant(sigs[c],[points[i] for i in members[c]],None,settings)
+        return pts,iterations,time.time()-componentStart
+    workers = settings.get("workers") or 1
+    results = mapSoThreads(solveComponent,components,workers)
+    
+    # Scatter the component points back into the input order
+    points = list(points)
+    for c,(pts,iterations,seconds) in zip(components,results):
+        for i,pt in zip(members[c],pts):
+            points[i] = pt
+            
+    info = {"components":len(components),"workers":workers,"partitionSeconds":partitionTime,
+            "seconds":time.time()-startTime,
+            "componentPoints":[len(members[c]) for c in components],
+            "componentSeconds":[r[2] for r in results]}
+    csCount = sum(csd["count"] for csd in constraintSigs)
+    
+    return points,max([r[1] for r in results] or [0]),csCount,info
+
+def coarsenSoConstraintSigs(constraintSigs,points):
+    
+    """ Coarsen the constraints by aggregating the points into clusters of a
+    point and its neighbours in the constraint graph. Each cluster becomes a
+    coarse point at the position of its seed point. Constraints are remapped
+    to the clusters and dropped if two of their points fall in one cluster,
+    EdgeStrain rest lengths are scaled by the ratio of the seed distance to
+    the point distance and Closeness targets are moved with the seed. Returns
+    the seed of each cluster, the cluster of each point and the merged coarse
+    constraint signatures """
+    
+    # Get the neighbours of each point (a star from the first point of each constraint)
+    neighbours = [set() for pt in points]
+    for csd in constraintSigs:
+        for indices,offsets in iterSoIndexBlocks(csd):
+            for k in range(len(offsets)-1):
+                a = indices[offsets[k]]
+                for j in range(offsets[k]+1,offsets[k+1]):
+                    neighbours[a].add(indices[j])
+                    neighbours[indices[j]].add(a)
+                    
+    # Aggregate the points whose neighbours are all free, then attach the rest
+    clusterOf,seeds = [-1]*len(points),[]
+    for v in range(len(points)):
+        if clusterOf[v] < 0 and all(clusterOf[n] < 0 for n in neighbours[v]):
+            for n in neighbours[v]:
+                clusterOf[n] = len(seeds)
+            clusterOf[v] = len(seeds)
+            seeds.append(v)
+    for v in range(len(points)):
+        if clusterOf[v] < 0:
+            attached = [clusterOf[n] for n in neighbours[v] if clusterOf[n] >= 0]
+            if attached:
+                clusterOf[v] = attached[0]
+            else:
+                clusterOf[v] = len(seeds)
+                seeds.append(v)
+                
+    # Remap the constraints to the clusters
+    coarseSigs = []
+    for csd in constraintSigs:
+        weights = csd["weights"]
+        out = {"type":csd["type"],"format":"compact","count":0,
+               "pointIndices":array("i"),"indexOffsets":array("i",[0]),
+               "weights":array("d",weights) if len(weights) == 1 else array("d"),
+               "scalars":array("d"),"scalarOffsets":array("i",[0]) if csd["scalars"] else None}
+        i = 0
+        for indices,offsets in iterSoIndexBlocks(csd):
+            for k in range(len(offsets)-1):
+                ids = indices[offsets[k]:offsets[k+1]]
+                mapped = [clusterOf[v] for v in ids]
+                if len(set(mapped)) == len(mapped):
+                    out["pointIndices"].extend(mapped)
+                    out["indexOffsets"].append(len(out["pointIndices"]))
+                    if len(weights) != 1:
+                        out["weights"].append(weights[i])
+                    if csd["scalars"]:
+                        scalars = list(getSoConstraintScalars(csd,i))
+                        if csd["type"] == "EdgeStrain" and len(scalars) == 3:
+                            a,b = points[ids[0]],points[ids[1]]
+                            sa,sb = points[seeds[mapped[0]]],points[seeds[mapped[1]]]
+                            if a.DistanceTo(b) > 0:
+                                scalars[0] *= sa.DistanceTo(sb)/a.DistanceTo(b)
+                        elif csd["type"] == "Closeness" and len(scalars) == 3:
+                            a,sa = points[ids[0]],points[seeds[mapped[0]]]
+                            scalars = [scalars[0]+sa.X-a.X,scalars[1]+sa.Y-a.Y,scalars[2]+sa.Z-a.Z]
+                        out["scalars"].extend(scalars)
+                        out["scalarOffsets"].append(len(out["scalars"]))
+                    out["count"] += 1
+                i += 1
+        coarseSigs.append(out)
+        
+    return seeds,clusterOf,mergeSoConstraintSigs(coarseSigs)[0]
+
+def solveSoLevel(constraintSigs,points,startCoords,settings):
+    
+    """ Solve one level of a multilevel solve: the constraints are added at
+    the points (which sets their rest state) and solving starts from the
+    startCoords coordinates if they are passed. Returns the solved coordinates
+    and the number of iterations run """
+    
+    solver,ptCoords = makeSoSolver(points)
+    try:
+        for csd in constraintSigs:
+            addSoConstraints(solver,csd)
+        err_code = so.shapeop_init(solver)
+        if err_code != 0 :
+            raise LookupError("ShapeOp initialization failed.")
+        if startCoords is not None:
+            ptCoords[:] = startCoords
+            so.shapeop_setPoints(solver,ct.byref(ptCoords),len(points))
+        if settings.get("tolerance") is not None or settings.get("timeBudget") is not None:
+            iterations = solveSoConverged(solver,ptCoords,len(points),settings)[0]
+        else:
+            iterations = settings["iterations"]
+            err_code = so.shapeop_solve(solver,iterations)
+            if err_code != 0 :
+                raise LookupError("ShapeOp solve failed.")
+            so.shapeop_getPoints(solver,ct.byref(ptCoords),len(points))
+    finally:
+        deleteSoSolver(solver,so)
+        
+    return ptCoords[:],iterations
+
+def runSoSolverMultilevel(constraintSigs,points,settings):
+    
+    """ Run the ShapeOp solver statically from coarse to fine: the constraints
+    are coarsened up to settings["levels"] times (see coarsenSoConstraintSigs),
+    the coarsest level is solved first and the displacement of each cluster
+    is prolongated to its points as the starting positions of the next finer
+    level. The coarse levels only need a rough start, so they are solved with
+    a quarter of the iterations (and time budget) and ten times the tolerance.
+    The finest level
+    solves the input constraints and its iterations are returned """
+    
+    # Build the hierarchy of coarser points and constraints
+    hierarchy = [(points,constraintSigs,None)]
+    for level in range(settings["levels"]):
+        finePoints,fineSigs = hierarchy[-1][:2]
+        seeds,clusterOf,coarseSigs = coarsenSoConstraintSigs(fineSigs,finePoints)
+        if len(seeds) < 4 or len(seeds) > 0.9*len(finePoints):
+            break
+        hierarchy.append(([finePoints[i] for i in seeds],coarseSigs,clusterOf))
+        
+    # Solve from the coarsest to the finest level, the coarse levels on a reduced budget
+    coarseSettings = dict(settings,iterations=max(settings["iterations"]//4,1))
+    if settings.get("tolerance") is not None:
+        coarseSettings["tolerance"] = settings["tolerance"]*10.0
+    if settings.get("timeBudget") is not None:
+        coarseSettings["timeBudget"] = settings["timeBudget"]/4.0
+    startCoords,info = None,{"levelPoints":[],"levelIterations":[],"levelSeconds":[]}
+    for level in reversed(range(len(hierarchy))):
+        levelPoints,levelSigs,clusterOf = hierarchy[level]
+        levelStart = time.time()
+        try:
+            coords,iterations = solveSoLevel(levelSigs,levelPoints,startCoords,settings if level == 0 else coarseSettings)
+        except LookupError:
+            
+            # Skip a coarse level which can not be solved (e.g. unconstrained clusters)
+            if level == 0:
+                raise
+            coords,iterations = startCoords or [c for pt in levelPoints for c in (pt.X,pt.Y,pt.Z)],0
+        info["levelPoints"].append(len(levelPoints))
+        info["levelIterations"].append(iterations)
+        info["levelSeconds"].append(time.time()-levelStart)
+        
+        # Prolongate the cluster displacements to the points of the finer level
+        if level > 0:
+            finePoints = hierarchy[level-1][0]
+            startCoords = []
+            for pt,c in zip(finePoints,clusterOf):
+                seed = levelPoints[c]
+                startCoords.extend((pt.X+coords[c*3]-seed.X,pt.Y+coords[c*3+1]-seed.Y,pt.Z+coords[c*3+2]-seed.Z))
+                
+    info["levels"] = len(hierarchy)
+    csCount = sum(csd["count"] for csd in constraintSigs)
+    
+    return unpackSoPoints(coords),info["levelIterations"][-1],csCount,info
+
+def makeSoTopology(constraintSigs,points,settings):
+    
+    """ Make the key of everything which is baked into a solver when it is
+    initialized: the constraint types, point indices and weights, the points
+    the constraints are created from, the backend (the loaded one, as native
+    falls back to Python) and the dynamics/unary force settings. Lookups
+    compare the key itself, not only its hash """
+    
+    topology = [getSoBackendName(so),tuple((pt.X,pt.Y,pt.Z) for pt in points),settings.get("dynamic")]
+    if settings.get("dynamic"):
+        topology.append((settings["mass"],settings["damping"],settings["timeStep"]))
+    if settings.get("unaryVector"):
+        v = settings["unaryVector"]
+        topology.append((v.X,v.Y,v.Z))
+    for csd in constraintSigs:
+        if csd["format"] == "blocks":
+            indices = csd["key"]
+        else:
+            indices = (tuple(csd["pointIndices"]),tuple(csd["indexOffsets"]))
+        topology.append((csd["type"],
+                         indices,
+                         tuple(csd["weights"]),
+                         len(csd["scalars"]) > 0))
+        
+    return tuple(topology)
+
+def gatherSoEditableScalars(constraintSigs,editableCS):
+    
+    """ Gather the current scalars of the editable constraints into one flat
+    double array and return it with the offsets of each constraint """
+    
+    scalars = array("d")
+    offsets = [0]*(len(editableCS)+1)
+    for k,l in enumerate(editableCS):
+        scalars.extend(getSoConstraintScalars(constraintSigs[l[0]],l[1]))
+        offsets[k+1] = len(scalars)
+        
+    return scalars,offsets
+
+def updateSoEditableConstraints(solver,constraintSigs,editableCS,sent=None):
+    
+    """ Edit the constraints whose scalars differ from the sent snapshot of
+    scalars (i.e. the last ones pushed to the solver, all are edited if it is
+    None). Returns the new snapshot and the number of edits sent and skipped """
+    
+    scalars,offsets = gatherSoEditableScalars(constraintSigs,editableCS)
+    
+    # Get the editable constraints which are dirty
+    if sent is None or sent[1] != offsets:
+        dirty = range(len(editableCS))
+    elif sent[0] == scalars:
+        dirty = []
+    else:
+        sentScalars = sent[0]
+        dirty = [k for k in range(len(editableCS)) if scalars[offsets[k]:offsets[k+1]] != sentScalars[offsets[k]:offsets[k+1]]]
+        
+    pushSoEditableScalars(solver,constraintSigs,editableCS,scalars,offsets,dirty)
+    
+    return (scalars,offsets),len(dirty),len(editableCS)-len(dirty)
+
+def pushSoEditableScalars(solver,constraintSigs,editableCS,scalars,offsets,dirty):
+    
+    """ Edit the editable constraints in dirty with their scalars from the flat
+    scalars array, packed into one flat buffer """
+    
+    if not dirty:
+        return
+    dirtyScalars = array("d")
+    dirtyOffsets = [0]
+    for k in dirty:
+        dirtyScalars.extend(scalars[offsets[k]:offsets[k+1]])
+        dirtyOffsets.append(len(dirtyScalars))
+    scalarsC = (ct.c_double * len(dirtyScalars))(*dirtyScalars)
+    doubleSize = ct.sizeof(ct.c_double)
+    for n,k in enumerate(dirty):
+        csdIndex,csid = editableCS[k][0],editableCS[k][2]
+        t = makeSoTypeName(constraintSigs[csdIndex]["type"])
+        b,e = dirtyOffsets[n],dirtyOffsets[n+1]
+        errCode = so.shapeop_editConstraint(solver,t,csid,ct.byref(scalarsC,b*doubleSize),e-b)
+        if errCode != 0 :
+            raise LookupError("editSoConstraint failed editing constraint. Check that SOGSig scalars are correctly defined.")
+
+def startSoWorker(solver,editableCS,sentScalars,pointCount,iterations,count,tolerance=None,component=None):
+    
+    """ Start a thread which keeps solving the solver and returns the worker
+    dictionary used for talking to it. The solved points are copied into the
+    front buffer of a double-buffered coordinates array, and the constraint
+    signatures queued in sigs are used for editing constraints between solves.
+    If a tolerance is passed the worker idles once the points move less than
+    it, until queued signatures change a constraint. The worker stops itself
+    once its component is no longer in a document (i.e. it was deleted) """
+    
+    worker = {"solver":solver,"component":component,"editableCS":editableCS,"sent":sentScalars,
+              "pointCount":pointCount,"iterations":iterations,"count":count,
+              "tolerance":tolerance,"converged":False,
+              "front":(ct.c_double * (pointCount*3))(),"back":(ct.c_double * (pointCount*3))(),
+              "sigs":None,"editsSent":0,"editsSkipped":0,"rate":0.0,"error":None,
+              "lock":threading.Lock(),"run":threading.Event(),"stop":threading.Event()}
+    so.shapeop_getPoints(solver,ct.byref(worker["front"]),pointCount)
+    worker["thread"] = threading.Thread(target=runSoWorker,args=(worker,))
+    worker["thread"].daemon = True
+    worker["thread"].start()
+    
+    return worker
+
+def runSoWorker(worker):
+    
+    """ The worker thread loop: edit queued constraints, solve, get points and
+    swap the coordinates buffers until the worker is stopped """
+    
+    solver,lock = worker["solver"],worker["lock"]
+    rateTime,rateCount = time.time(),worker["count"]
+    pingTime = time.time()
+    while not worker["stop"].is_set():
+        
+        # Stop when the component has been removed from its document
+        if worker["component"] is not None and time.time() - pingTime >= 0.5:
+            pingTime = time.time()
+            if worker["component"].OnPingDocument() is None:
+                break
+                
+        # Wait while paused
+        if not worker["run"].wait(0.1):
+            rateTime,rateCount = time.time(),worker["count"]
+            continue
+            
+        try:
+            
+            # Edit the constraints with the queued signatures
+            with lock:
+                sigs,worker["sigs"] = worker["sigs"],None
+                iterations = worker["iterations"]
+            if sigs is not None:
+                worker["sent"],worker["editsSent"],worker["editsSkipped"] = updateSoEditableConstraints(solver,sigs,worker["editableCS"],worker["sent"])
+                if worker["editsSent"]:
+                    worker["converged"] = False
+                    
+            # Idle while converged
+            if worker["converged"]:
+                time.sleep(0.01)
+                continue
+                
+            # Solve and swap the coordinates buffers
+            err_code = so.shapeop_solve(solver,iterations)
+            if err_code != 0 :
+                raise LookupError("ShapeOp solve failed.")
+            so.shapeop_getPoints(solver,ct.byref(worker["back"]),worker["pointCount"])
+            with lock:
+                worker["front"],worker["back"] = worker["back"],worker["front"]
+                worker["count"] += iterations
+            if worker["tolerance"] is not None:
+                worker["converged"] = measureSoDisplacement(worker["front"],worker["back"])[0] <= worker["tolerance"]
+                
+        except Exception as e:
+            worker["error"] = e
+            break
+            
+        # Update the achieved iterations per second
+        t = time.time()
+        if t - rateTime >= 0.5:
+            worker["rate"] = (worker["count"]-rateCount)/(t-rateTime)
+            rateTime,rateCount = t,worker["count"]
+
+def getSoVelocities(solver,pointCount):
+    
+    """ Get the velocities of a dynamic solver if the backend exposes them,
+    otherwise None (the ShapeOp library does not) """
+    
+    getVelocities = getattr(so,"shapeop_getVelocities",None)
+    if getVelocities is None:
+        return None
+    velocities = (ct.c_double * (pointCount*3))()
+    getVelocities(solver,ct.byref(velocities),pointCount)
+    
+    return velocities
+
+def restoreSoSnapshot(solver,ptCoords,constraintSigs,editableCS,snapshot,dynamic):
+    
+    """ Restore the points, editable scalars and (if dynamic and the backend
+    supports it) the velocities of a snapshot into an initialized solver.
+    Returns the sent scalars snapshot, which is None if the scalars of the
+    snapshot do not match the editable constraints """
+    
+    pointCount = len(ptCoords)//3
+    if snapshot["pointCount"] != pointCount:
+        raise LookupError("The snapshot has " + str(snapshot["pointCount"]) + " points, the solver has " + str(pointCount) + ".")
+    ptCoords[:] = snapshot["coords"]
+    so.shapeop_setPoints(solver,ct.byref(ptCoords),pointCount)
+    
+    # Push the scalars the solver had when the snapshot was saved
+    sent = None
+    if snapshot["offsets"] == gatherSoEditableScalars(constraintSigs,editableCS)[1]:
+        sent = (snapshot["scalars"],snapshot["offsets"])
+        pushSoEditableScalars(solver,constraintSigs,editableCS,sent[0],sent[1],range(len(editableCS)))
+        
+    setVelocities = getattr(so,"shapeop_setVelocities",None)
+    if dynamic and snapshot["velocities"] is not None and setVelocities is not None:
+        velocities = (ct.c_double * (pointCount*3))(*snapshot["velocities"])
+        setVelocities(solver,ct.byref(velocities),pointCount)
+        
+    return sent
+
+def adaptSoIterations(frame,iterations,solveTime,targetFrameTime):
+    
+    """ Update the frame timing of a live solver with the solve time of this
+    update and return the iterations for the next update. The time between
+    updates which is not spent solving (i.e. redrawing Grasshopper) is
+    subtracted from the target frame time (in seconds) and the iterations are
+    scaled to fill the rest, growing at most twofold per update """
+    
+    frame["solveTime"] = solveTime
+    frame["ran"] = iterations
+    if not targetFrameTime or iterations <= 0:
+        return iterations
         
-    # Delete solver
-    so.shapeop_delete(solver)
+    perIteration = max(solveTime/iterations,1e-6)
+    budget = targetFrameTime - frame.get("overhead",0.0)
+    
+    return max(1,min(int(budget/perIteration),iterations*2))
+
+def startSoFrame(frame):
+    
+    """ Measure the time since the last update of a live solver and smooth the
+    frame time and the overhead (the part not spent solving) """
     
-    return points,settings["iterations"],csCount
+    now = time.time()
+    if frame.get("last") is not None:
+        frameTime = now - frame["last"]
+        overhead = max(frameTime - frame.get("solveTime",0.0),0.0)
+        if "frameTime" in frame:
+            frameTime = 0.8*frame["frameTime"] + 0.2*frameTime
+            overhead = 0.8*frame["overhead"] + 0.2*overhead
+        frame["frameTime"],frame["overhead"] = frameTime,overhead
+    frame["last"] = now
 
-def runSoSolverLive(ghenv,constraintSigs,points,settings):
+def runSoSolverLive(ghenv,constraintSigs,points,settings,profile=None,layout=None):
     
-    """ Run the ShapeOp solver cyclically (live) and return the points """
+    """ Run the ShapeOp solver cyclically (live) and return the points. The
+    layout of merged constraint signatures (see mergeSoConstraintSigs) resets
+    the solver when it changes, as the editable constraints refer to it """
     
     # Get GH component guid and make unique variable names for sticky keys
     guid = str(ghenv.Component.InstanceGuid) + str(ghdoc.Path)
@@ -132,81 +1101,273 @@ def runSoSolverLive(ghenv,constraintSigs,points,settings):
     count = "count_" + guid
     editableCS = "editableCS" + guid
     csCount = "csCount_" + guid
+    sentScalars = "sentScalars_" + guid
+    topology = "topology_" + guid
+    info = "info_" + guid
+    worker = "worker_" + guid
+    snapshotSaved = "snapshotSaved_" + guid
+    frame = "frame_" + guid
+    backend = "backend_" + guid
+    restored = "restored_" + guid
+    mergeLayout = "mergeLayout_" + guid
     
-    if settings["reset"]:
+    # Restore a snapshot (after resetting) once when RestoreSnapshot is set
+    # to True, or scrub through a trajectory
+    restoring = bool(settings.get("restoreSnapshot") and settings.get("snapshotPath"))
+    restore = restoring and not st.get(restored)
+    st[restored] = restoring
+    scrub = settings.get("scrubFrame") is not None and settings.get("trajectoryPath")
+    
+    # A solver can only be used by the backend which made it and merged
+    # constraints change with the scalars, so changing the backend or the
+    # merge layout resets the solver
+    rebuild = solver in st and st.get(backend) != getSoBackendName(so)
+    rebuild = rebuild or (solver in st and st.get(mergeLayout) != layout)
+    
+    if info not in st:
+        st[info] = {"resetPath":None,"fullResets":0,"incrementalResets":0,"editsSent":0,"editsSkipped":0}
         
-        # Delete old solver
-        if solver in st:
-            so.shapeop_delete(st[solver])
-            
-        # Make ShapeOp solver
-        st[solver],st[ptCoords] = makeSoSolver(points)
+    # Stop the worker thread before the solver is used from this thread
+    if worker in st and (settings["reset"] or restore or rebuild or scrub or not settings.get("threaded")):
+        stopSoWorker(st[worker])
+        st[sentScalars],st[count] = st[worker]["sent"],st[worker]["count"]
+        del st[worker]
         
-        # Add constraints to the solver from the constraint signatures dictionary
-        st[editableCS] = []
-        st[csCount] = 0
-        for i,csd in enumerate(constraintSigs):
-            for j in range(len(csd["pointIndices"])):
-                csid = addSoConstraint(st[solver],csd["type"],csd["pointIndices"][j],csd["weights"][j])
-                st[csCount] += 1
-                if csd["scalars"]:
-                    editSoConstraint(st[solver],csd["type"],csid,csd["scalars"][j])
-                    st[editableCS].append((i,j,csid))
+    # Output the points of a trajectory frame without solving
+    if scrub:
+        iterations,coords = readSoTrajectoryFrame(settings["trajectoryPath"],settings["scrubFrame"],len(points))
+        ghenv.Component.Message = "Solver is Scrubbing"
+        return unpackSoPoints(coords),iterations,st.get(csCount,0),st[info]
+        
+    if settings["reset"] or restore or rebuild or solver not in st:
+        
+        # Keep the initialized solver if the constraint topology is unchanged
+        topologyKey = makeSoTopology(constraintSigs,points,settings)
+        if solver in st and st.get(topology) == topologyKey:
+            
+            # Move the points back to their input positions and push scalars
+            st[ptCoords] = packSoPoints(points,st[ptCoords])
+            so.shapeop_setPoints(st[solver],ct.byref(st[ptCoords]),len(points))
+            st[sentScalars],sentCount,skippedCount = updateSoEditableConstraints(st[solver],constraintSigs,st[editableCS],st[sentScalars])
+            st[info]["editsSent"],st[info]["editsSkipped"] = sentCount,skippedCount
+            
+            # Zero the velocities of the same solver, a library without the
+            # velocities setter has to reinitialize (and refactor) it instead
+            setVelocities = getattr(so,"shapeop_setVelocities",None)
+            if settings["dynamic"] and setVelocities is not None:
+                velocities = (ct.c_double * (len(points)*3))()
+                setVelocities(st[solver],ct.byref(velocities),len(points))
+                st[info]["velocityReset"] = "setVelocities"
+            elif settings["dynamic"]:
+                err_code = so.shapeop_initDynamic(st[solver],settings["mass"],settings["damping"],settings["timeStep"])
+                if err_code != 0 :
+                    raise LookupError("ShapeOp init failed. Check that each point is constrained.")
+                st[info]["velocityReset"] = "initDynamic"
+            markSoPhase(profile,"edit",len(st[ptCoords])*ct.sizeof(ct.c_double))
                     
-        # Add unary force
-        if settings['unaryVector']:
-            addUnaryForce(st[solver],settings['unaryVector'])
-        
-        # Initialize solver
-        err_code = 0
-        if settings["dynamic"]:
-            err_code = so.shapeop_initDynamic(st[solver],settings["mass"],settings["damping"],settings["timeStep"])
+            st[info]["resetPath"] = "incremental"
+            st[info]["incrementalResets"] += 1
+            
         else:
-            err_code = so.shapeop_init(st[solver])
-        if err_code != 0 :
-            raise LookupError("ShapeOp init failed. Check that each point is constrained.")
-        
-        # Reset count
+            
+            # Delete old solver (with the backend which made it)
+            if solver in st:
+                deleteSoSolver(st[solver],so)
+                st.pop(solver,None)
+                
+            # Make ShapeOp solver, which the registry may delete (and remove
+            # from sticky) when the component is orphaned or memory runs out
+            st[solver],st[ptCoords] = makeSoSolver(points,st.get(ptCoords),ghenv.Component,"live")
+            st[backend] = getSoBackendName(so)
+            useSoSolver(st[solver],bytes=estimateSoSolverBytes(len(points),constraintSigs),release=[(st,solver)],busy=worker)
+            
+            # Add constraints to the solver from the constraint signatures dictionary
+            st[editableCS] = []
+            st[csCount] = 0
+            for i,csd in enumerate(constraintSigs):
+                csids = addSoConstraints(st[solver],csd)
+                st[csCount] += len(csids)
+                if csd["scalars"]:
+                    st[editableCS].extend((i,j,csid) for j,csid in enumerate(csids))
+            st[sentScalars] = gatherSoEditableScalars(constraintSigs,st[editableCS])
+            st[info]["editsSent"],st[info]["editsSkipped"] = len(st[editableCS]),0
+                    
+            # Add unary force
+            if settings['unaryVector']:
+                addUnaryForce(st[solver],settings['unaryVector'])
+            markSoPhase(profile,"register",len(st[ptCoords])*ct.sizeof(ct.c_double) + measureSoSigBytes(constraintSigs))
+            
+            # Initialize solver
+            err_code = 0
+            if settings["dynamic"]:
+                err_code = so.shapeop_initDynamic(st[solver],settings["mass"],settings["damping"],settings["timeStep"])
+            else:
+                err_code = so.shapeop_init(st[solver])
+            if err_code != 0 :
+                st[topology] = None
+                raise LookupError("ShapeOp init failed. Check that each point is constrained.")
+            st[topology] = topologyKey
+            markSoPhase(profile,"init")
+            
+            st[info]["resetPath"] = "full"
+            st[info]["fullResets"] += 1
+            
+        # Reset count and frame timing
+        st[mergeLayout] = layout
         st[count] = 0
+        st[frame] = {"iterations":settings["iterations"]}
+        
+        # Restore the saved points, scalars and velocities into the reset solver
+        if restore:
+            snapshot = loadSoSnapshot(settings["snapshotPath"])
+            sent = restoreSoSnapshot(st[solver],st[ptCoords],constraintSigs,st[editableCS],snapshot,settings["dynamic"])
+            if sent is not None:
+                st[sentScalars] = sent
+            st[count] = snapshot["iterations"]
+        st[snapshotSaved] = st[count]
+        if settings.get("trajectoryPath"):
+            truncateSoTrajectory(settings["trajectoryPath"],len(points),st[count])
         
         # Set component message
         ghenv.Component.Message = None
         
-    else:
+        # Keep running if the solver was rebuilt because the registry deleted it
+        if not settings["reset"]:
+            ghComponentTimer(ghenv,settings["pause"],10)
+        
+    elif settings.get("threaded"):
         
-        # Update editable constraints
-        for l in st[editableCS]:
-            csdIndex,scalarsIndex,csid = l[0],l[1],l[2]
-            scalars = constraintSigs[csdIndex]["scalars"]
-            t = constraintSigs[csdIndex]["type"]
-            editSoConstraint(st[solver],t,csid,scalars[scalarsIndex])
+        # Start a worker thread which solves in the background
+        if worker not in st:
+            st[worker] = startSoWorker(st[solver],st[editableCS],st[sentScalars],len(points),settings["iterations"],st[count],settings.get("tolerance"),ghenv.Component)
+        w = st[worker]
+        if w["error"] is not None:
+            raise LookupError("ShapeOp worker failed: " + str(w["error"]))
+            
+        # Queue the constraint signatures for editing and pause/unpause the worker
+        with w["lock"]:
+            w["sigs"] = constraintSigs
+            w["iterations"] = settings["iterations"]
+            w["tolerance"] = settings.get("tolerance")
+        if settings["pause"]:
+            w["run"].clear()
+        else:
+            w["run"].set()
             
-        # Solve and update the Grasshopper component (ie. update cyclically)
-        err_code = so.shapeop_solve(st[solver],settings["iterations"])
+        # Update the Grasshopper component at the refresh interval (or the target
+        # frame time) instead of per solve, or only poll for the worker resuming
+        # while it is converged
+        st[info]["converged"] = w["converged"]
+        interval = settings.get("refreshInterval",10)
+        if settings.get("targetFrameTime"):
+            interval = settings["targetFrameTime"]
+        if w["converged"]:
+            interval = max(interval,250)
+        ghComponentTimer(ghenv,settings["pause"],interval)
+        
+        # Set component message
+        message = "Solver is Running Threaded (%d it/s)" % w["rate"]
+        if settings["pause"]:
+            message = "Solver is Paused"
+        elif w["converged"]:
+            message = "Solver has Converged"
+        ghenv.Component.Message = message
+        
+    else:
+        
+        # Update the editable constraints whose scalars have changed
+        st[sentScalars],sentCount,skippedCount = updateSoEditableConstraints(st[solver],constraintSigs,st[editableCS],st[sentScalars])
+        st[info]["editsSent"],st[info]["editsSkipped"] = sentCount,skippedCount
+        markSoPhase(profile,"edit")
+        
+        # Get the iterations of this update, adapted toward the target frame time
+        targetFrameTime = (settings.get("targetFrameTime") or 0)/1000.0
+        if frame not in st:
+            st[frame] = {"iterations":settings["iterations"]}
+        startSoFrame(st[frame])
+        iterations = st[frame]["iterations"] if targetFrameTime else settings["iterations"]
+        
+        # Solve and get the points
+        prevCoords = st[ptCoords][:]
+        solveStart = time.time()
+        err_code = so.shapeop_solve(st[solver],iterations)
         if err_code != 0 :
             raise LookupError("ShapeOp solve failed.")
-        ghComponentTimer(ghenv,settings["pause"],10)
+        so.shapeop_getPoints(st[solver],ct.byref(st[ptCoords]),len(points))
+        st[frame]["iterations"] = adaptSoIterations(st[frame],iterations,time.time()-solveStart,targetFrameTime)
+        markSoPhase(profile,"solve",len(st[ptCoords])*ct.sizeof(ct.c_double))
+        
+        # Auto-pause when the points moved less than the tolerance
+        converged = False
+        if settings.get("tolerance") is not None:
+            converged = measureSoDisplacement(st[ptCoords],prevCoords)[0] <= settings["tolerance"]
+        st[info]["converged"] = converged
         
+        # Update the Grasshopper component (ie. update cyclically), as soon as
+        # possible if the iterations are adapted to the target frame time
+        ghComponentTimer(ghenv,settings["pause"] or converged,1 if targetFrameTime else 10)
+        if settings["pause"] or converged:
+            st[frame]["last"] = None
+            
         # Increment count
-        st[count] += 1*settings["iterations"]
+        st[count] += iterations
         
         # Set component message
         message = "Solver is Running Live"
         if settings["pause"]:
             message = "Solver is Paused"
+        elif converged:
+            message = "Solver has Converged"
         ghenv.Component.Message = message
         
-    # Update and return the points list
-    so.shapeop_getPoints(st[solver],ct.byref(st[ptCoords]),len(points))
-    for i in range(len(points)):
-        b = i*3
-        points[i] = rc.Geometry.Point3d(st[ptCoords][b],st[ptCoords][b+1],st[ptCoords][b+2])
+    # Mark the solver as used by this update in the registry
+    useSoSolver(st[solver])
+    
+    # Update and return the points list (from the latest worker snapshot if threaded)
+    if worker in st:
+        w = st[worker]
+        with w["lock"]:
+            points = unpackSoPoints(w["front"])
+            st[count] = w["count"]
+        st[info]["editsSent"],st[info]["editsSkipped"] = w["editsSent"],w["editsSkipped"]
+        st[info]["iterationsPerSecond"] = w["rate"]
+    else:
+        points = unpackSoPoints(st[ptCoords])
+        st[info].pop("iterationsPerSecond",None)
+        if "frameTime" in st.get(frame,{}):
+            st[info]["iterationsPerSecond"] = st[frame]["ran"]/st[frame]["frameTime"]
+            st[info]["framesPerSecond"] = 1.0/st[frame]["frameTime"]
+            st[info]["iterationsPerUpdate"] = st[frame]["ran"]
+    markSoPhase(profile,"points")
+    
+    # Save a snapshot on demand or periodically, and append a trajectory frame
+    snapshotInterval = settings.get("snapshotInterval")
+    periodic = bool(snapshotInterval) and st[count] - st.get(snapshotSaved,0) >= snapshotInterval
+    if periodic:
+        st[snapshotSaved] = st[count]
+    if (settings.get("snapshotPath") and (settings.get("saveSnapshot") or periodic)) or (settings.get("trajectoryPath") and periodic):
+        velocities = None
+        if worker in st:
+            with st[worker]["lock"]:
+                coords = st[worker]["front"][:]
+            sent = st[worker]["sent"]
+        else:
+            coords,sent = st[ptCoords][:],st[sentScalars]
+            if settings["dynamic"]:
+                velocities = getSoVelocities(st[solver],len(points))
+        if settings.get("snapshotPath") and (settings.get("saveSnapshot") or periodic):
+            saveSoSnapshot(settings["snapshotPath"],coords,st[count],sent,velocities)
+        if settings.get("trajectoryPath") and periodic:
+            appendSoTrajectory(settings["trajectoryPath"],coords,st[count])
+    markSoPhase(profile,"snapshot")
         
-    return points,st[count],st[csCount]
+    return points,st[count],st[csCount],st[info]
 
 def ghComponentTimer(ghenv,pause,interval):
     
-    """ Update the component at the interval like using a GH timer """
+    """ Update the component at the interval like using a GH timer. Pausing
+    cancels the pending updates by bumping the timer generation, which the
+    callbacks check before expiring the component """
     
     # Ensure interval is larger than zero
     if interval <= 0:
@@ -216,21 +1377,77 @@ def ghComponentTimer(ghenv,pause,interval):
     ghComp = ghenv.Component
     ghDoc = ghComp.OnPingDocument()
     
+    # Get the timer generation of the component, bump it to cancel pending updates
+    key = "timerGeneration_" + str(ghComp.InstanceGuid) + str(ghdoc.Path)
+    if pause:
+        st[key] = st.get(key,0) + 1
+        return
+    generation = st.get(key,0)
+    
     # Define the callback function
     def callBack(ghDoc):
-        ghComp.ExpireSolution(False)
+        if st.get(key,0) == generation:
+            ghComp.ExpireSolution(False)
         
     # Update the solution
-    if not pause:
-        ghDoc.ScheduleSolution(interval,gh.Kernel.GH_Document.GH_ScheduleDelegate(callBack))
+    ghDoc.ScheduleSolution(interval,gh.Kernel.GH_Document.GH_ScheduleDelegate(callBack))
 
 # Check GH input parameters
 if ConstraintSigs and Points and Settings:
     
+    # Load the ShapeOp backend
+    so = loadSoBackend(Settings.get("backend","native"))
+    if isinstance(so,PySoBackend) and Settings.get("backend","native") != "python":
+        ghenv.Component.AddRuntimeMessage(gh.Kernel.GH_RuntimeMessageLevel.Remark,"ShapeOp library not found, using the Python backend.")
+    
+    # Start timing the phases of this solution if profiling is enabled
+    profile = makeSoProfile() if Settings.get("profile") else None
+    
+    # Delete orphaned solvers and keep all the solvers within the memory cap
+    purgeSoSolvers(None,Settings.get("solverMemory",2048)*1024*1024,ghenv.Component)
+    
+    # Convert any old format constraint signatures to the compact format
+    ConstraintSigs = [compactSoConstraintSig(csd) for csd in ConstraintSigs]
+    markSoPhase(profile,"convert")
+    
+    # Merge duplicate constraints (not with Variants, whose scalars follow the signatures)
+    mergeInfo = None
+    if Settings.get("merge") and not (Settings["mode"] == "static" and Variants):
+        ConstraintSigs,mergeInfo = getSoMergedSigs(ghenv,ConstraintSigs)
+        if mergeInfo["conflicts"]:
+            ghenv.Component.AddRuntimeMessage(gh.Kernel.GH_RuntimeMessageLevel.Warning,str(mergeInfo["conflicts"]) + " duplicate constraints have different scalars and were not merged.")
+        markSoPhase(profile,"merge")
+    
+    # Run solver statically on many variants in parallel
+    if Settings["mode"] == "static" and Variants:
+        variantPoints,Iterations,ConstraintCount,SolverInfo = runSoSolverBatch(ConstraintSigs,Points,Variants,Settings)
+        markSoPhase(profile,"solve")
+        Points = gh.DataTree[rc.Geometry.Point3d]()
+        for i,pts in enumerate(variantPoints):
+            Points.AddRange(pts,gh.Kernel.Data.GH_Path(i))
+        markSoPhase(profile,"points")
+            
+    # Run solver statically with a solver per connected component
+    elif Settings["mode"] == "static" and Settings.get("partition"):
+        Points,Iterations,ConstraintCount,SolverInfo = runSoSolverPartitioned(ConstraintSigs,Points,Settings)
+        
+    # Run solver statically from coarse to fine levels
+    elif Settings["mode"] == "static" and Settings.get("levels"):
+        Points,Iterations,ConstraintCount,SolverInfo = runSoSolverMultilevel(ConstraintSigs,Points,Settings)
+        
     # Run solver statically (i.e. only one GH iteration)
-    if Settings["mode"] == "static":
-        Points,Iterations,ConstraintCount = runSoSolverStatic(ConstraintSigs,Points,Settings)
+    elif Settings["mode"] == "static":
+        Points,Iterations,ConstraintCount,SolverInfo = runSoSolverStatic(ghenv,ConstraintSigs,Points,Settings,profile)
         
     # Run solver live (i.e. the solver component will cyclically update)
     elif Settings["mode"] == "live":
-        Points,Iterations,ConstraintCount = runSoSolverLive(ghenv,ConstraintSigs,Points,Settings)
\ No newline at end of file
+        layout = mergeInfo["layout"] if mergeInfo is not None else None
+        Points,Iterations,ConstraintCount,SolverInfo = runSoSolverLive(ghenv,ConstraintSigs,Points,Settings,profile,layout)
+        
+    # Output diagnostics to GH (wrap in list to send as one item)
+    if mergeInfo is not None:
+        SolverInfo.update(mergeInfo)
+    SolverInfo["solvers"] = listSoSolvers()
+    SolverInfo = [SolverInfo,]
+    if profile is not None:
+        Profile = [finishSoProfile(profile,ConstraintSigs,Settings.get("profileLog")),]
\ No newline at end of file
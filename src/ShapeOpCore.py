@@ -0,0 +1,1173 @@
+﻿"""
+The parts of the ShapeOp solver component which do not depend on its inputs,
+as a module which the component imports: the pure Python backend (with its
+NumPy batches) implementing the ShapeOp C API, the registry of the solvers
+made by the components and the snapshot and trajectory files. It has to be in
+a folder on the RhinoPython paths, e.g. the Grasshopper Libraries folder (see
+the README).
+-
+Authors: Anders Holden Deleuran (CITA/KADK), Mario Deuss (LGG/EPFL) 
+Github: github.com/AndersDeleuran/ShapeOpGHPython
+Updated: 261017
+"""
+
+import ctypes as ct
+import math
+import os
+import struct
+from array import array
+from collections import OrderedDict
+import threading
+import time
+import Grasshopper as gh
+from scriptcontext import sticky as st
+
+# NumPy and SciPy are optional: NumPy vectorizes the local step of the Python
+# backend and SciPy factors and solves its global matrix
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import scipy.sparse as sps
+    from scipy.sparse.linalg import splu
+except ImportError:
+    sps = None
+
+def symmetricEigenVectors(m):
+    
+    """ Get the eigenvalues and eigenvectors of a symmetric 3x3 matrix (list
+    of rows) sorted by increasing eigenvalue, using Jacobi rotations """
+    
+    a = [list(r) for r in m]
+    v = [[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0]]
+    for sweep in range(50):
+        off = a[0][1]**2 + a[0][2]**2 + a[1][2]**2
+        if off < 1e-30:
+            break
+        for p,q in ((0,1),(0,2),(1,2)):
+            if abs(a[p][q]) < 1e-300:
+                continue
+            theta = (a[q][q]-a[p][p])/(2.0*a[p][q])
+            t = (1.0 if theta >= 0 else -1.0)/(abs(theta)+math.sqrt(theta*theta+1.0))
+            c = 1.0/math.sqrt(t*t+1.0)
+            s = t*c
+            for k in range(3):
+                akp,akq = a[k][p],a[k][q]
+                a[k][p],a[k][q] = c*akp-s*akq,s*akp+c*akq
+            for k in range(3):
+                apk,aqk = a[p][k],a[q][k]
+                a[p][k],a[q][k] = c*apk-s*aqk,s*apk+c*aqk
+            for k in range(3):
+                vkp,vkq = v[k][p],v[k][q]
+                v[k][p],v[k][q] = c*vkp-s*vkq,s*vkp+c*vkq
+    order = sorted(range(3),key=lambda i: a[i][i])
+    
+    return [a[i][i] for i in order],[[v[k][i] for k in range(3)] for i in order]
+
+def vSub(a,b):
+    return [a[0]-b[0],a[1]-b[1],a[2]-b[2]]
+
+def vAdd(a,b):
+    return [a[0]+b[0],a[1]+b[1],a[2]+b[2]]
+
+def vScale(a,s):
+    return [a[0]*s,a[1]*s,a[2]*s]
+
+def vDot(a,b):
+    return a[0]*b[0]+a[1]*b[1]+a[2]*b[2]
+
+def vCross(a,b):
+    return [a[1]*b[2]-a[2]*b[1],a[2]*b[0]-a[0]*b[2],a[0]*b[1]-a[1]*b[0]]
+
+def vUnit(a):
+    l = math.sqrt(vDot(a,a))
+    return vScale(a,1.0/l) if l > 1e-300 else None
+
+def vPerpendicular(a):
+    
+    """ Get a unit vector perpendicular to a """
+    
+    b = [1.0,0.0,0.0] if abs(a[0]) < 0.9 else [0.0,1.0,0.0]
+    
+    return vUnit(vCross(a,b))
+
+def svd3(columns):
+    
+    """ Get the singular value decomposition of a 3xn (n <= 3) matrix given
+    as a list of its columns. Returns the left singular vectors U (one per
+    column, completed to a right handed frame), the singular values and the
+    right singular vectors V as lists sorted by decreasing singular value """
+    
+    n = len(columns)
+    mtm = [[vDot(columns[a],columns[b]) if a < n and b < n else 0.0 for b in range(3)] for a in range(3)]
+    values,vectors = symmetricEigenVectors(mtm)
+    sigma = [math.sqrt(max(l,0.0)) for l in reversed(values)]
+    v = [vec for vec in reversed(vectors)]
+    
+    # Get the left singular vectors, keeping them orthonormal where sigma is small
+    mv = [[sum(columns[c][k]*v[i][c] for c in range(n)) for k in range(3)] for i in range(3)]
+    u0 = vUnit(mv[0]) or [1.0,0.0,0.0]
+    u1 = vUnit(vSub(mv[1],vScale(u0,vDot(mv[1],u0)))) or vPerpendicular(u0)
+    u2 = vCross(u0,u1)
+    if vDot(mv[2],u2) < 0:
+        u2 = vScale(u2,-1.0)
+        
+    return [u0,u1,u2],sigma,v
+
+def solveLinear(a,b):
+    
+    """ Solve the small dense linear system a * x = b with Gaussian elimination
+    and partial pivoting, returns None if it is singular """
+    
+    n = len(b)
+    m = [list(a[i])+[b[i]] for i in range(n)]
+    for c in range(n):
+        p = max(range(c,n),key=lambda r: abs(m[r][c]))
+        if abs(m[p][c]) < 1e-300:
+            return None
+        m[c],m[p] = m[p],m[c]
+        for r in range(c+1,n):
+            f = m[r][c]/m[c][c]
+            for k in range(c,n+1):
+                m[r][k] -= f*m[c][k]
+    x = [0.0]*n
+    for r in reversed(range(n)):
+        x[r] = (m[r][n]-sum(m[r][k]*x[k] for k in range(r+1,n)))/m[r][r]
+        
+    return x
+
+def factorSoMatrix(rows):
+    
+    """ Factor the sparse symmetric positive definite global matrix (a list
+    of rows of (column,value) pairs) once with a profile Cholesky on a reverse
+    Cuthill-McKee ordering, for when SciPy is not available (see
+    sparseSoMatrix). Returns a function which solves the system for an n x 3
+    NumPy array of right hand sides, or for one list of right hand sides
+    without NumPy. Raises ValueError if the matrix is not positive definite """
+    
+    n = len(rows)
+    
+    # Order the unknowns with reverse Cuthill-McKee to keep the profile small
+    neighbours = [[c for c,v in row if c != r] for r,row in enumerate(rows)]
+    order,visited = [],[False]*n
+    for start in sorted(range(n),key=lambda r: len(neighbours[r])):
+        if visited[start]:
+            continue
+        visited[start] = True
+        queue,k = [start],0
+        while k < len(queue):
+            r = queue[k]
+            k += 1
+            for c in sorted(neighbours[r],key=lambda c: len(neighbours[c])):
+                if not visited[c]:
+                    visited[c] = True
+                    queue.append(c)
+        order.extend(queue)
+    order.reverse()
+    perm = [0]*n
+    for new,old in enumerate(order):
+        perm[old] = new
+        
+    # Store the lower triangle of each row from its first nonzero column
+    first = list(range(n))
+    for r,row in enumerate(rows):
+        for c,v in row:
+            first[perm[r]] = min(first[perm[r]],perm[c])
+    low = [[0.0]*(r-first[r]+1) for r in range(n)]
+    for r,row in enumerate(rows):
+        pr = perm[r]
+        for c,v in row:
+            pc = perm[c]
+            if pc <= pr:
+                low[pr][pc-first[pr]] += v
+                
+    # Factor in place (the profile of L equals the profile of the matrix)
+    for r in range(n):
+        fr,lr = first[r],low[r]
+        for c in range(fr,r+1):
+            fc,lc = first[c],low[c]
+            k = max(fr,fc)
+            s = lr[c-fr] - sum(a*b for a,b in zip(lr[k-fr:c-fr],lc[k-fc:c-fc]))
+            if c < r:
+                lr[c-fr] = s/lc[c-fc]
+            elif s <= 0.0:
+                raise ValueError("Matrix is not positive definite")
+            else:
+                lr[c-fr] = math.sqrt(s)
+                
+    # Back-substitute the three coordinates at once with NumPy
+    if np is not None:
+        perm = np.array(perm)
+        low = [np.array(lr) for lr in low]
+        def solveArrays(b):
+            y = np.empty_like(b)
+            y[perm] = b
+            for r in range(n):
+                lr = low[r]
+                y[r] = (y[r]-lr[:-1].dot(y[first[r]:r]))/lr[-1]
+            for r in reversed(range(n)):
+                lr = low[r]
+                y[r] /= lr[-1]
+                y[first[r]:r] -= np.outer(lr[:-1],y[r])
+            return y[perm]
+        return solveArrays
+        
+    def solve(b):
+        y = [0.0]*n
+        for old,v in enumerate(b):
+            y[perm[old]] = v
+        for r in range(n):
+            fr,lr = first[r],low[r]
+            y[r] = (y[r]-sum(a*b for a,b in zip(lr[:-1],y[fr:r])))/lr[-1]
+        for r in reversed(range(n)):
+            fr,lr = first[r],low[r]
+            y[r] /= lr[-1]
+            yr = y[r]
+            for k in range(fr,r):
+                y[k] -= lr[k-fr]*yr
+        return [y[perm[old]] for old in range(n)]
+        
+    return solve
+
+def centeringRows(ids):
+    
+    """ Get the constraint matrix rows which subtract the mean of the points """
+    
+    n = float(len(ids))
+    
+    return [[(j,(1.0 if j == i else 0.0)-1.0/n) for j in ids] for i in ids]
+
+def gradientRows(ids,restInv):
+    
+    """ Get the constraint matrix rows of the deformation gradient of a
+    triangle or tetrahedron, restInv is the inverse of its rest edge matrix """
+    
+    rows = []
+    for c in range(len(restInv)):
+        coefs = [restInv[m][c] for m in range(len(restInv))]
+        rows.append([(ids[0],-sum(coefs))]+[(ids[m+1],coefs[m]) for m in range(len(coefs))])
+        
+    return rows
+
+def restGradientInverse(pts):
+    
+    """ Get the inverse of the rest edge matrix of a triangle (in its own 2D
+    frame) or tetrahedron, returns None if it is degenerate """
+    
+    edges = [vSub(p,pts[0]) for p in pts[1:]]
+    if len(edges) == 2:
+        u = vUnit(edges[0])
+        n = vUnit(vCross(edges[0],edges[1])) if u else None
+        if n is None:
+            return None
+        v = vCross(n,u)
+        a = [[vDot(edges[0],u),vDot(edges[1],u)],[vDot(edges[0],v),vDot(edges[1],v)]]
+        det = a[0][0]*a[1][1]-a[0][1]*a[1][0]
+        return [[a[1][1]/det,-a[0][1]/det],[-a[1][0]/det,a[0][0]/det]]
+        
+    # Inverse of the 3x3 matrix with the edges as columns
+    a = [[edges[c][r] for c in range(3)] for r in range(3)]
+    inv = [solveLinear(a,[1.0 if r == c else 0.0 for r in range(3)]) for c in range(3)]
+    if None in inv:
+        return None
+        
+    return [[inv[c][r] for c in range(3)] for r in range(3)]
+
+def clampSingularValues(columns,c):
+    
+    """ Project a deformation gradient (list of columns) by clamping its
+    singular values to the range of the constraint, or their product for the
+    Area and Volume constraints """
+    
+    u,sigma,v = svd3(columns)
+    n = len(columns)
+    sigma = sigma[:n]
+    if c["type"] in ("Area","Volume"):
+        product = 1.0
+        for s in sigma:
+            product *= s
+        target = min(max(product,c["rangeMin"]),c["rangeMax"])
+        if product > 1e-300:
+            f = (target/product)**(1.0/n)
+            sigma = [s*f for s in sigma]
+    else:
+        sigma = [min(max(s,c["rangeMin"]),c["rangeMax"]) for s in sigma]
+        
+    return [[sum(sigma[i]*u[i][k]*v[i][col] for i in range(n)) for k in range(3)] for col in range(n)]
+
+def bendingWeights(pts):
+    
+    """ Get the cotangent weights of the bending operator of two triangles
+    sharing the edge from pts[0] to pts[1], pts[2] and pts[3] being opposite """
+    
+    def cot(a,b):
+        s = math.sqrt(vDot(vCross(a,b),vCross(a,b)))
+        return vDot(a,b)/s if s > 1e-300 else 0.0
+        
+    e0,e1,e2 = vSub(pts[1],pts[0]),vSub(pts[2],pts[0]),vSub(pts[3],pts[0])
+    e3,e4 = vSub(pts[2],pts[1]),vSub(pts[3],pts[1])
+    c01,c02 = cot(e0,e1),cot(e0,e2)
+    c03,c04 = cot(vScale(e0,-1.0),e3),cot(vScale(e0,-1.0),e4)
+    
+    return [c03+c04,c01+c02,-c01-c03,-c02-c04]
+
+def bestRigidTransform(shape,pts,scaling):
+    
+    """ Get the shape (centered) rotated, and scaled if scaling is True, to
+    best fit the centered points, and the squared error of the fit """
+    
+    h = [[sum(s[a]*p[b] for s,p in zip(shape,pts)) for b in range(3)] for a in range(3)]
+    u,sigma,v = svd3([[h[r][c] for r in range(3)] for c in range(3)])
+    
+    # Rotation R = U * V^T (mapping shape onto points), without reflections
+    d = 1.0 if vDot(vCross(v[0],v[1]),v[2])*vDot(vCross(u[0],u[1]),u[2]) > 0 else -1.0
+    signs = [1.0,1.0,d]
+    rot = [[sum(signs[i]*u[i][r]*v[i][c] for i in range(3)) for c in range(3)] for r in range(3)]
+    rot = [[rot[c][r] for c in range(3)] for r in range(3)]
+    s = 1.0
+    if scaling:
+        norm = sum(vDot(p,p) for p in shape)
+        if norm > 1e-300:
+            s = sum(signs[i]*sigma[i] for i in range(3))/norm
+    fitted = [[s*vDot(rot[k],p) for k in range(3)] for p in shape]
+    error = sum(vDot(vSub(f,p),vSub(f,p)) for f,p in zip(fitted,pts))
+    
+    return fitted,error
+
+# Parameters of the NumPy batches per constraint type (see batchSoConstraints)
+batchParams = {"Closeness":("target",),"EdgeStrain":("rest","rangeMin","rangeMax"),
+               "Bending":("rest","rangeMin","rangeMax"),"LaplacianDisplacement":("rest",),
+               "TriangleStrain":("rangeMin","rangeMax"),"TetrahedronStrain":("rangeMin","rangeMax"),
+               "Area":("rangeMin","rangeMax"),"Volume":("rangeMin","rangeMax"),
+               "AngleConstraint":("rangeMin","rangeMax"),"Similarity":("shapes",),"Rigid":("shapes",)}
+
+def batchSoConstraints(constraints):
+
+    """ Group the constraints of the Python backend into NumPy batches of the
+    same type, index count, row count and shape count, so that the local step
+    projects each batch at once. A batch has the point indices (m x k), the
+    constraint matrix coefficients (m x rows x k), the coefficients times the
+    weights and the parameters of its m constraints. Returns the batches by
+    key and the (key,position) of each constraint in its batch """
+    
+    groups,slots = OrderedDict(),[]
+    for c in constraints:
+        key = (c["type"],len(c["ids"]),len(c["rows"]),len(c.get("shapes",())))
+        members = groups.setdefault(key,[])
+        slots.append((key,len(members)))
+        members.append(c)
+        
+    batches = OrderedDict()
+    for key,members in groups.items():
+        t,k,r = key[:3]
+        ids = np.array([c["ids"] for c in members],dtype=np.intp)
+        coefs = np.zeros((len(members),r,k))
+        for m,c in enumerate(members):
+            column = {}
+            for j,i in enumerate(c["ids"]):
+                column.setdefault(i,j)
+            for row,entries in enumerate(c["rows"]):
+                for i,coef in entries:
+                    coefs[m,row,column[i]] += coef
+        weights = np.array([c["weight"] for c in members])
+        batch = {"type":t,"ids":ids,"flatIds":ids.ravel(),"coefs":coefs,
+                 "weighted":coefs*weights[:,None,None],"params":batchParams.get(t,())}
+        for name in batch["params"]:
+            batch[name] = np.array([c[name] for c in members],dtype=float)
+        batches[key] = batch
+        
+    return batches,slots
+
+def sparseSoMatrix(batches,n,inertia=0.0):
+
+    """ Assemble the global matrix (sum of w * A^T * A plus the inertia) of
+    batched constraints as a SciPy sparse matrix """
+    
+    i,j,v = [np.arange(n)],[np.arange(n)],[np.full(n,float(inertia))]
+    for batch in batches.values():
+        ids = batch["ids"]
+        k = ids.shape[1]
+        i.append(np.repeat(ids,k,axis=1).ravel())
+        j.append(np.tile(ids,(1,k)).ravel())
+        v.append(np.einsum("mra,mrb->mab",batch["weighted"],batch["coefs"]).ravel())
+        
+    return sps.csc_matrix((np.concatenate(v),(np.concatenate(i),np.concatenate(j))),shape=(n,n))
+
+def solveSoSystems(a,b):
+
+    """ Solve a batch of small dense linear systems a * x = b, returns the
+    solutions and whether each system is regular (the solutions of singular
+    systems are meaningless) """
+    
+    regular = np.abs(np.linalg.det(a)) > 1e-300
+    a = np.where(regular[:,None,None],a,np.eye(a.shape[1]))
+    
+    return np.linalg.solve(a,b[...,None])[...,0],regular
+
+def projectOntoSpheres(pts,center,radius):
+
+    """ Project batched points (m x k x 3) onto spheres (or circles) with
+    batched centers and radii, points at a center go to the center """
+    
+    d = pts-center[:,None,:]
+    length = np.sqrt(np.einsum("mkd,mkd->mk",d,d))
+    scale = np.where(length > 1e-300,radius[:,None]/np.where(length > 1e-300,length,1.0),0.0)
+    
+    return center[:,None,:]+d*scale[...,None]
+
+def projectSoBatch(batch,x):
+
+    """ Get the projections of a batch of constraints (see batchSoConstraints)
+    from the points x (n x 3), like PySoBackend._project for all the
+    constraints of the batch at once: an m x rows x 3 array """
+    
+    t = batch["type"]
+    if t == "Closeness":
+        return batch["target"][:,None,:]
+        
+    # The vectors the constraint matrix rows currently map the points to
+    current = np.einsum("mrk,mkd->mrd",batch["coefs"],x[batch["ids"]])
+    m = len(current)
+    
+    if t in ("EdgeStrain","Bending"):
+        d = current[:,0]
+        length = np.sqrt(np.einsum("md,md->m",d,d))
+        rest = batch["rest"]
+        target = np.minimum(np.maximum(length,batch["rangeMin"]*rest),batch["rangeMax"]*rest)
+        valid = length > (1e-300 if t == "EdgeStrain" else 1e-12)
+        scale = np.where(valid,target/np.where(valid,length,1.0),1.0)
+        return (d*scale[:,None])[:,None,:]
+        
+    if t in ("TriangleStrain","TetrahedronStrain","Area","Volume"):
+        u,sigma,vt = np.linalg.svd(current.transpose(0,2,1),full_matrices=False)
+        if t in ("Area","Volume"):
+            product = np.prod(sigma,axis=1)
+            target = np.minimum(np.maximum(product,batch["rangeMin"]),batch["rangeMax"])
+            valid = product > 1e-300
+            sigma = sigma*np.where(valid,(target/np.where(valid,product,1.0))**(1.0/sigma.shape[1]),1.0)[:,None]
+        else:
+            sigma = np.minimum(np.maximum(sigma,batch["rangeMin"][:,None]),batch["rangeMax"][:,None])
+        return np.einsum("mai,mi,mic->mca",u,sigma,vt)
+        
+    if t == "Laplacian":
+        return np.zeros_like(current)
+        
+    if t == "LaplacianDisplacement":
+        d,rest = current[:,0],batch["rest"]
+        length = np.sqrt(np.einsum("md,md->m",d,d))
+        restLength = np.sqrt(np.einsum("md,md->m",rest,rest))
+        valid = length > 1e-300
+        scale = restLength/np.where(valid,length,1.0)
+        return np.where(valid[:,None],d*scale[:,None],rest)[:,None,:]
+        
+    if t == "AngleConstraint":
+        e1,e2 = current[:,0],current[:,1]
+        n = np.cross(e1,e2)
+        nLength = np.sqrt(np.einsum("md,md->m",n,n))
+        l1,l2 = np.sqrt(np.einsum("md,md->m",e1,e1)),np.sqrt(np.einsum("md,md->m",e2,e2))
+        valid = (nLength > 1e-300) & (l1 > 1e-300) & (l2 > 1e-300)
+        n = n/np.where(valid,nLength,1.0)[:,None]
+        cosine = np.einsum("md,md->m",e1,e2)/np.where(valid,l1*l2,1.0)
+        angle = np.arccos(np.clip(cosine,-1.0,1.0))
+        delta = np.where(valid,0.5*(np.minimum(np.maximum(angle,batch["rangeMin"]),batch["rangeMax"])-angle),0.0)
+        def rotate(e,a):
+            return e*np.cos(a)[:,None]+np.cross(n,e)*np.sin(a)[:,None]
+        return np.stack([rotate(e1,-delta),rotate(e2,delta)],axis=1)
+        
+    # Shape constraints operate on the centered points
+    pts = current
+    if t in ("Similarity","Rigid"):
+    
+        # Best rotation R = V * U^T (mapping each shape onto the points), without reflections
+        shapes = batch["shapes"]
+        h = np.einsum("mska,mkb->msab",shapes,pts)
+        u,sigma,vt = np.linalg.svd(h)
+        signs = np.ones_like(sigma)
+        signs[...,2] = np.where(np.linalg.det(u)*np.linalg.det(vt) > 0,1.0,-1.0)
+        rot = np.einsum("msij,msi,mski->msjk",vt,signs,u)
+        if t == "Similarity":
+            norm = np.einsum("mskd,mskd->ms",shapes,shapes)
+            valid = norm > 1e-300
+            rot = rot*np.where(valid,np.sum(signs*sigma,axis=2)/np.where(valid,norm,1.0),1.0)[...,None,None]
+        fitted = np.einsum("msjk,mspk->mspj",rot,shapes)
+        error = np.einsum("mspd,mspd->ms",fitted-pts[:,None],fitted-pts[:,None])
+        return fitted[np.arange(m),np.argmin(error,axis=1)]
+        
+    if t in ("Parallelogram","Rectangle"):
+        d = pts[:,0]-pts[:,1]+pts[:,2]-pts[:,3]
+        pts = pts-0.25*d[:,None,:]*np.array([1.0,-1.0,1.0,-1.0])[None,:,None]
+        if t == "Rectangle":
+            l1,l2 = np.sqrt(np.einsum("md,md->m",pts[:,0],pts[:,0])),np.sqrt(np.einsum("md,md->m",pts[:,1],pts[:,1]))
+            valid = (l1 > 1e-300) & (l2 > 1e-300)
+            h1 = pts[:,0]*(0.5*(l1+l2)/np.where(valid,l1,1.0))[:,None]
+            h2 = pts[:,1]*(0.5*(l1+l2)/np.where(valid,l2,1.0))[:,None]
+            pts = np.where(valid[:,None,None],np.stack([h1,h2,-h1,-h2],axis=1),pts)
+        return pts
+        
+    cov = np.einsum("mka,mkb->mab",pts,pts)
+    values,vectors = np.linalg.eigh(cov)
+    k = float(pts.shape[1])
+    
+    if t == "Line":
+        axis = vectors[:,:,2]
+        return axis[:,None,:]*np.einsum("mkd,md->mk",pts,axis)[...,None]
+        
+    if t == "Sphere":
+    
+        # Algebraic sphere fit |q|^2 = 2 c.q + k, then project onto it
+        square = np.einsum("mkd,mkd->mk",pts,pts)
+        a = np.empty((m,4,4))
+        a[:,:3,:3] = 4.0*cov
+        a[:,:3,3] = a[:,3,:3] = 2.0*pts.sum(axis=1)
+        a[:,3,3] = k
+        b = np.concatenate([2.0*np.einsum("mkd,mk->md",pts,square),square.sum(axis=1)[:,None]],axis=1)
+        fit,regular = solveSoSystems(a,b)
+        center = fit[:,:3]
+        radius = np.sqrt(np.maximum(fit[:,3]+np.einsum("md,md->m",center,center),0.0))
+        return np.where(regular[:,None,None],projectOntoSpheres(pts,center,radius),pts)
+        
+    # Project the points onto their best fitting plane
+    normal = vectors[:,:,0]
+    pts = pts-normal[:,None,:]*np.einsum("mkd,md->mk",pts,normal)[...,None]
+    if t == "Plane":
+        return pts
+        
+    # Circle: algebraic circle fit in the plane, then project onto it
+    u,v = vectors[:,:,2],vectors[:,:,1]
+    uv = np.stack([np.einsum("mkd,md->mk",pts,u),np.einsum("mkd,md->mk",pts,v)],axis=2)
+    square = np.einsum("mkd,mkd->mk",uv,uv)
+    a = np.empty((m,3,3))
+    a[:,:2,:2] = 4.0*np.einsum("mka,mkb->mab",uv,uv)
+    a[:,:2,2] = a[:,2,:2] = 2.0*uv.sum(axis=1)
+    a[:,2,2] = k
+    b = np.concatenate([2.0*np.einsum("mkd,mk->md",uv,square),square.sum(axis=1)[:,None]],axis=1)
+    fit,regular = solveSoSystems(a,b)
+    center = u*fit[:,0,None]+v*fit[:,1,None]
+    radius = np.sqrt(np.maximum(fit[:,2]+fit[:,0]**2+fit[:,1]**2,0.0))
+    return np.where(regular[:,None,None],projectOntoSpheres(pts,center,radius),pts)
+
+class PySoSolver(object):
+    
+    """ The state of a solver made by the pure Python reference backend """
+    
+    def __init__(self):
+        self.points = []
+        self.constraints = []
+        self.force = (0.0,0.0,0.0)
+        self.dynamic = None
+        self.velocities = None
+        self.solve = None
+        self.batches = None
+        self.slots = None
+
+class PySoBackend(object):
+    
+    """ Pure Python implementation of the parts of the ShapeOp C API used by
+    this component, for when the ShapeOp library is not available. It uses the
+    same projective dynamics local/global scheme: each constraint stores the
+    constraint matrix rows mapping the points to the vectors it projects, the
+    global matrix is factored once on initialization and each iteration then
+    only projects the constraints and back-substitutes. With NumPy the
+    constraints are projected in batches of the same type and the points are
+    kept in an n x 3 array while solving, with SciPy the global matrix is
+    factored and solved sparse """
+    
+    name = "python"
+    
+    # Minimum and maximum (None = unbounded) number of indices per type
+    idCounts = {"Closeness":(1,1),"EdgeStrain":(2,2),"TriangleStrain":(3,3),
+                "TetrahedronStrain":(4,4),"Area":(3,3),"Volume":(4,4),
+                "Bending":(4,4),"Line":(2,None),"Plane":(3,None),
+                "Circle":(3,None),"Sphere":(4,None),"Similarity":(1,None),
+                "Rigid":(1,None),"Rectangle":(4,4),"Parallelogram":(4,4),
+                "Laplacian":(2,None),"LaplacianDisplacement":(2,None),
+                "AngleConstraint":(3,3)}
+    
+    def _doubles(self,ptr,n):
+        p = ct.cast(ptr,ct.POINTER(ct.c_double))
+        return [p[i] for i in range(n)]
+        
+    def _type(self,t):
+        v = t.value
+        return v.decode() if isinstance(v,bytes) else v
+        
+    def _point(self,solver,i):
+        return solver.points[i*3:i*3+3]
+        
+    def shapeop_create(self):
+        return PySoSolver()
+        
+    def shapeop_delete(self,solver):
+        solver.constraints = []
+        solver.solve = None
+        solver.batches = None
+        
+    def shapeop_setPoints(self,solver,ptr,pointCount):
+        solver.points = self._doubles(ptr,pointCount*3)
+        
+    def shapeop_getPoints(self,solver,ptr,pointCount):
+        p = ct.cast(ptr,ct.POINTER(ct.c_double))
+        for i,v in enumerate(solver.points[:pointCount*3]):
+            p[i] = v
+            
+    def shapeop_getVelocities(self,solver,ptr,pointCount):
+        p = ct.cast(ptr,ct.POINTER(ct.c_double))
+        for i,v in enumerate((solver.velocities or [0.0]*pointCount*3)[:pointCount*3]):
+            p[i] = v
+            
+    def shapeop_setVelocities(self,solver,ptr,pointCount):
+        solver.velocities = self._doubles(ptr,pointCount*3)
+        
+    def shapeop_addGravityForce(self,solver,ptr):
+        solver.force = tuple(self._doubles(ptr,3))
+        return 0
+        
+    def shapeop_addConstraint(self,solver,t,ptr,idCount,weight):
+        
+        # Check the constraint type and indices
+        constraintType = self._type(t)
+        p = ct.cast(ptr,ct.POINTER(ct.c_int))
+        ids = [p[i] for i in range(idCount)]
+        if constraintType not in self.idCounts:
+            return -1
+        minIds,maxIds = self.idCounts[constraintType]
+        if idCount < minIds or (maxIds is not None and idCount > maxIds):
+            return -1
+        if min(ids) < 0 or max(ids) >= len(solver.points)//3:
+            return -1
+            
+        # Set the constraint matrix rows and the rest state from the current points
+        pts = [self._point(solver,i) for i in ids]
+        c = {"type":constraintType,"ids":ids,"weight":float(weight),"rangeMin":1.0,"rangeMax":1.0}
+        if constraintType == "Closeness":
+            c["rows"] = [[(ids[0],1.0)]]
+            c["target"] = pts[0]
+        elif constraintType == "EdgeStrain":
+            c["rows"] = [[(ids[0],-1.0),(ids[1],1.0)]]
+            c["rest"] = math.sqrt(vDot(vSub(pts[1],pts[0]),vSub(pts[1],pts[0])))
+        elif constraintType in ("TriangleStrain","TetrahedronStrain","Area","Volume"):
+            restInv = restGradientInverse(pts)
+            if restInv is None:
+                return -1
+            c["rows"] = gradientRows(ids,restInv)
+        elif constraintType == "Bending":
+            w = bendingWeights(pts)
+            c["rows"] = [[(i,wi) for i,wi in zip(ids,w)]]
+            c["rest"] = math.sqrt(vDot(*[[sum(wi*q[k] for wi,q in zip(w,pts)) for k in range(3)]]*2))
+        elif constraintType in ("Laplacian","LaplacianDisplacement"):
+            m = float(len(ids)-1)
+            c["rows"] = [[(ids[0],1.0)]+[(i,-1.0/m) for i in ids[1:]]]
+            c["rest"] = [pts[0][k]-sum(q[k] for q in pts[1:])/m for k in range(3)]
+        elif constraintType == "AngleConstraint":
+            c["rows"] = [[(ids[0],-1.0),(ids[1],1.0)],[(ids[0],-1.0),(ids[2],1.0)]]
+            c["rangeMin"],c["rangeMax"] = 0.0,math.pi
+        else:
+            c["rows"] = centeringRows(ids)
+            mean = [sum(q[k] for q in pts)/len(pts) for k in range(3)]
+            c["shapes"] = [[vSub(q,mean) for q in pts]]
+        solver.constraints.append(c)
+        solver.batches = None
+        
+        return len(solver.constraints)-1
+        
+    def shapeop_editConstraint(self,solver,t,constraintId,ptr,scalarCount):
+        
+        if constraintId < 0 or constraintId >= len(solver.constraints):
+            return 1
+        c = solver.constraints[constraintId]
+        if c["type"] != self._type(t):
+            return 1
+        scalars = self._doubles(ptr,scalarCount)
+        n = len(c["ids"])
+        
+        if c["type"] == "Closeness" and scalarCount == 3:
+            c["target"] = scalars
+        elif c["type"] == "EdgeStrain" and scalarCount == 3:
+            c["rest"],c["rangeMin"],c["rangeMax"] = scalars
+        elif c["type"] in ("TriangleStrain","TetrahedronStrain","Area","Volume","Bending","AngleConstraint") and scalarCount == 2:
+            c["rangeMin"],c["rangeMax"] = scalars
+        elif c["type"] in ("Similarity","Rigid") and scalarCount and scalarCount % (3*n) == 0:
+            shapes = []
+            for b in range(0,scalarCount,3*n):
+                pts = [scalars[b+i*3:b+i*3+3] for i in range(n)]
+                mean = [sum(q[k] for q in pts)/n for k in range(3)]
+                shapes.append([vSub(q,mean) for q in pts])
+            c["shapes"] = shapes
+        else:
+            return 1
+            
+        # Update the parameters of the constraint in its batch, or batch again
+        if solver.batches is not None:
+            key,position = solver.slots[constraintId]
+            if key[3] != len(c.get("shapes",())):
+                solver.batches = None
+            else:
+                batch = solver.batches[key]
+                for name in batch["params"]:
+                    batch[name][position] = c[name]
+                    
+        return 0
+        
+    def _project(self,c,x):
+        
+        """ Get the projection of a constraint: one 3D vector per matrix row """
+        
+        t = c["type"]
+        if t == "Closeness":
+            return [c["target"]]
+            
+        # The vectors the constraint matrix rows currently map the points to
+        current = [[sum(coef*x[i*3+k] for i,coef in row) for k in range(3)] for row in c["rows"]]
+        
+        if t == "EdgeStrain":
+            d = current[0]
+            length = math.sqrt(vDot(d,d))
+            target = min(max(length,c["rangeMin"]*c["rest"]),c["rangeMax"]*c["rest"])
+            return [vScale(d,target/length)] if length > 1e-300 else [d]
+            
+        if t in ("TriangleStrain","TetrahedronStrain","Area","Volume"):
+            return clampSingularValues(current,c)
+            
+        if t == "Bending":
+            d = current[0]
+            length = math.sqrt(vDot(d,d))
+            target = min(max(length,c["rangeMin"]*c["rest"]),c["rangeMax"]*c["rest"])
+            return [vScale(d,target/length)] if length > 1e-12 else [d]
+            
+        if t == "Laplacian":
+            return [[0.0,0.0,0.0]]
+            
+        if t == "LaplacianDisplacement":
+            d = vUnit(current[0])
+            rest = math.sqrt(vDot(c["rest"],c["rest"]))
+            return [vScale(d,rest)] if d else [c["rest"]]
+            
+        if t == "AngleConstraint":
+            e1,e2 = current
+            n = vUnit(vCross(e1,e2))
+            u1,u2 = vUnit(e1),vUnit(e2)
+            if n is None or u1 is None or u2 is None:
+                return current
+            angle = math.acos(max(-1.0,min(1.0,vDot(u1,u2))))
+            delta = 0.5*(min(max(angle,c["rangeMin"]),c["rangeMax"])-angle)
+            def rotate(e,a):
+                return vAdd(vScale(e,math.cos(a)),vScale(vCross(n,e),math.sin(a)))
+            return [rotate(e1,-delta),rotate(e2,delta)]
+            
+        # Shape constraints operate on the centered points
+        pts = current
+        if t in ("Similarity","Rigid"):
+            fits = [bestRigidTransform(shape,pts,t == "Similarity") for shape in c["shapes"]]
+            return min(fits,key=lambda f: f[1])[0]
+            
+        if t in ("Parallelogram","Rectangle"):
+            d = vAdd(vSub(pts[0],pts[1]),vSub(pts[2],pts[3]))
+            pts = [vSub(q,vScale(d,s*0.25)) for q,s in zip(pts,(1.0,-1.0,1.0,-1.0))]
+            if t == "Rectangle":
+                h1,h2 = vUnit(pts[0]),vUnit(pts[1])
+                if h1 and h2:
+                    l = 0.5*(math.sqrt(vDot(pts[0],pts[0]))+math.sqrt(vDot(pts[1],pts[1])))
+                    pts = [vScale(h1,l),vScale(h2,l),vScale(h1,-l),vScale(h2,-l)]
+            return pts
+            
+        cov = [[sum(q[a]*q[b] for q in pts) for b in range(3)] for a in range(3)]
+        values,vectors = symmetricEigenVectors(cov)
+        
+        if t == "Line":
+            axis = vectors[2]
+            return [vScale(axis,vDot(q,axis)) for q in pts]
+            
+        if t == "Sphere":
+            
+            # Algebraic sphere fit |q|^2 = 2 c.q + k, then project onto it
+            a = [[sum(4*q[r]*q[s] for q in pts) for s in range(3)]+[sum(2*q[r] for q in pts)] for r in range(3)]
+            a.append([sum(2*q[s] for q in pts) for s in range(3)]+[float(len(pts))])
+            b = [sum(2*q[r]*vDot(q,q) for q in pts) for r in range(3)]+[sum(vDot(q,q) for q in pts)]
+            fit = solveLinear(a,b)
+            if fit is None:
+                return pts
+            center = fit[:3]
+            radius = math.sqrt(max(fit[3]+vDot(center,center),0.0))
+            return [vAdd(center,vScale(vUnit(vSub(q,center)) or [0.0,0.0,0.0],radius)) for q in pts]
+            
+        # Project the points onto their best fitting plane
+        normal = vectors[0]
+        pts = [vSub(q,vScale(normal,vDot(q,normal))) for q in pts]
+        if t == "Plane":
+            return pts
+            
+        # Circle: algebraic circle fit in the plane, then project onto it
+        u,v = vectors[2],vectors[1]
+        uv = [(vDot(q,u),vDot(q,v)) for q in pts]
+        a = [[sum(4*p[r]*p[s] for p in uv) for s in range(2)]+[sum(2*p[r] for p in uv)] for r in range(2)]
+        a.append([sum(2*p[s] for p in uv) for s in range(2)]+[float(len(uv))])
+        b = [sum(2*p[r]*(p[0]**2+p[1]**2) for p in uv) for r in range(2)]+[sum(p[0]**2+p[1]**2 for p in uv)]
+        fit = solveLinear(a,b)
+        if fit is None:
+            return pts
+        center = vAdd(vScale(u,fit[0]),vScale(v,fit[1]))
+        radius = math.sqrt(max(fit[2]+fit[0]**2+fit[1]**2,0.0))
+        return [vAdd(center,vScale(vUnit(vSub(q,center)) or [0.0,0.0,0.0],radius)) for q in pts]
+        
+    def _initialize(self,solver):
+        
+        n = len(solver.points)//3
+        inertia = solver.dynamic["mass"]/solver.dynamic["timeStep"]**2 if solver.dynamic else 0.0
+        solver.batches = None
+        try:
+        
+            # Assemble and factor the constant global matrix (sum of w * A^T * A
+            # plus the inertia) once, failing like ShapeOp if a point is not constrained
+            if sps is not None:
+                solver.batches,solver.slots = batchSoConstraints(solver.constraints)
+                solver.solve = splu(sparseSoMatrix(solver.batches,n,inertia),permc_spec="MMD_AT_PLUS_A").solve
+                return 0
+            matrix = [dict() for i in range(n)]
+            for c in solver.constraints:
+                for row in c["rows"]:
+                    for a,ca in row:
+                        for b,cb in row:
+                            matrix[a][b] = matrix[a].get(b,0.0) + c["weight"]*ca*cb
+            if inertia:
+                for i in range(n):
+                    matrix[i][i] = matrix[i].get(i,0.0) + inertia
+            solver.solve = factorSoMatrix([list(row.items()) for row in matrix])
+        except (ValueError,ZeroDivisionError,RuntimeError):
+            solver.solve = None
+            return 1
+            
+        return 0
+        
+    def shapeop_init(self,solver):
+        solver.dynamic = None
+        return self._initialize(solver)
+        
+    def shapeop_initDynamic(self,solver,mass,damping,timeStep):
+        solver.dynamic = {"mass":float(mass),"damping":float(damping),"timeStep":float(timeStep)}
+        solver.velocities = [0.0]*len(solver.points)
+        return self._initialize(solver)
+        
+    def shapeop_solve(self,solver,iterations):
+        
+        if solver.solve is None:
+            return 1
+        if np is not None:
+            return self._solveBatches(solver,iterations)
+            
+        # Get the momentum (the inertial target) of a dynamic time step
+        dyn = solver.dynamic
+        if dyn:
+            h,m = dyn["timeStep"],dyn["mass"]
+            oldPoints = list(solver.points)
+            momentum = [x+v*h+solver.force[i%3]*h*h/m for i,(x,v) in enumerate(zip(solver.points,solver.velocities))]
+            inertia = m/(h*h)
+            
+        for it in range(iterations):
+            
+            # Local step: project the constraints and sum w * A^T * p
+            rhs = [0.0]*len(solver.points)
+            if dyn:
+                rhs = [inertia*v for v in momentum]
+            for c in solver.constraints:
+                w = c["weight"]
+                for row,proj in zip(c["rows"],self._project(c,solver.points)):
+                    for a,ca in row:
+                        rhs[a*3] += w*ca*proj[0]
+                        rhs[a*3+1] += w*ca*proj[1]
+                        rhs[a*3+2] += w*ca*proj[2]
+                        
+            # Global step: back-substitute each coordinate with the factorization
+            for k in range(3):
+                solver.points[k::3] = solver.solve(rhs[k::3])
+                
+        # Update the velocities of a dynamic time step
+        if dyn:
+            solver.velocities = [(x-o)/h*dyn["damping"] for x,o in zip(solver.points,oldPoints)]
+            
+        return 0
+        
+    def _solveBatches(self,solver,iterations):
+    
+        """ shapeop_solve with NumPy: the points stay in an n x 3 array while
+        solving and the constraints are projected batch by batch """
+        
+        if solver.batches is None:
+            solver.batches,solver.slots = batchSoConstraints(solver.constraints)
+        x = np.array(solver.points).reshape(-1,3)
+        n = len(x)
+        
+        # Get the momentum (the inertial target) of a dynamic time step
+        dyn = solver.dynamic
+        momentum = np.zeros((n,3))
+        if dyn:
+            h,m = dyn["timeStep"],dyn["mass"]
+            oldPoints = x
+            velocities = np.array(solver.velocities).reshape(-1,3)
+            momentum = (x+velocities*h+np.array(solver.force)*h*h/m)*(m/(h*h))
+            
+        for it in range(iterations):
+        
+            # Local step: project the batches and sum w * A^T * p
+            rhs = momentum.copy()
+            for batch in solver.batches.values():
+                proj = np.einsum("mrk,mrd->mkd",batch["weighted"],projectSoBatch(batch,x))
+                for k in range(3):
+                    rhs[:,k] += np.bincount(batch["flatIds"],proj[...,k].ravel(),n)
+                    
+            # Global step: solve the three coordinates with the factorization
+            x = solver.solve(rhs)
+            
+        solver.points = x.ravel().tolist()
+        if dyn:
+            solver.velocities = ((x-oldPoints)/h*dyn["damping"]).ravel().tolist()
+            
+        return 0
+
+def loadSoBackend(name="native"):
+    
+    """ Load a ShapeOp backend: "native" is the ShapeOp library through ctypes
+    and "python" is the pure Python backend, which is also returned if the
+    library can not be loaded. A backend is any object with the shapeop_*
+    functions of the ShapeOp C API """
+    
+    if name == "python":
+        return PySoBackend()
+    if name == "native":
+        try:
+            return ct.cdll.LoadLibrary("ShapeOp.0.1.0.dll")
+        except OSError:
+            return PySoBackend()
+    raise LookupError("Unknown ShapeOp backend: " + str(name))
+
+def getSoBackendName(backend):
+    
+    """ Get the name of a backend, the ShapeOp library is "native" """
+    
+    return getattr(backend,"name","native")
+
+def getSoRegistry():
+    
+    """ Get the registry of all the native solvers made by this component type
+    from sticky. The first time it also hooks up deleting the solvers of a
+    Grasshopper document when the document is closed """
+    
+    if "ShapeOpSolverRegistry" not in st:
+        st["ShapeOpSolverRegistry"] = {"solvers":OrderedDict(),"lock":threading.RLock()}
+        
+        def onDocumentRemoved(sender,doc):
+            purgeSoSolvers(str(doc.DocumentID))
+        gh.Instances.DocumentServer.DocumentRemoved += onDocumentRemoved
+        
+    return st["ShapeOpSolverRegistry"]
+
+def registerSoSolver(solver,backend,component=None,kind="variant",pointCount=0):
+    
+    """ Register a new solver with the backend which made it, its owner
+    component, kind ("live", "static" or "variant") and approximate memory
+    footprint. A component has only one
+    live solver, so a new one supersedes (deletes) its previous live solvers,
+    e.g. those left under an old sticky key after saving to a new path """
+    
+    registry = getSoRegistry()
+    with registry["lock"]:
+        if kind == "live" and component is not None:
+            for e in list(registry["solvers"].values()):
+                if e["kind"] == "live" and e["component"] is component:
+                    deleteSoSolver(e["solver"])
+        doc = component.OnPingDocument() if component is not None else None
+        registry["solvers"][id(solver)] = {
+            "solver":solver,"so":backend,"kind":kind,"component":component,
+            "owner":str(component.InstanceGuid) if component is not None else None,
+            "doc":str(doc.DocumentID) if doc is not None else None,
+            "bytes":8*3*pointCount,"lastUsed":time.time(),"release":[],"busy":None}
+
+def useSoSolver(solver,**fields):
+    
+    """ Mark a registered solver as used now (it moves to the end of the least
+    recently used order) and update its entry fields: bytes, release (a list
+    of (dictionary,key) pairs which are removed when the solver is deleted)
+    and busy (the sticky key of the worker thread which may be using it) """
+    
+    registry = getSoRegistry()
+    with registry["lock"]:
+        entry = registry["solvers"].pop(id(solver),None)
+        if entry is not None:
+            entry.update(fields)
+            entry["lastUsed"] = time.time()
+            registry["solvers"][id(solver)] = entry
+
+def deleteSoSolver(solver,backend=None):
+    
+    """ Delete a solver with the backend which made it and unregister it. The
+    dictionary keys in its release list which still refer to it are removed,
+    and its worker thread is stopped first if it has one. A solver which is
+    not registered is deleted with backend (if it is passed) """
+    
+    registry = getSoRegistry()
+    with registry["lock"]:
+        entry = registry["solvers"].pop(id(solver),None)
+    if entry is None:
+        if backend is not None:
+            backend.shapeop_delete(solver)
+        return
+        
+    if entry["busy"] is not None and entry["busy"] in st:
+        stopSoWorker(st[entry["busy"]])
+        del st[entry["busy"]]
+    for container,key in entry["release"]:
+        value = container.get(key)
+        if value is solver or (isinstance(value,dict) and value.get("solver") is solver):
+            del container[key]
+    entry["so"].shapeop_delete(solver)
+
+def purgeSoSolvers(docId=None,maxBytes=None,keep=None):
+    
+    """ Delete the solvers of the document with docId if it is passed, and the
+    orphaned solvers whose component is no longer in a document. Then delete
+    the least recently used static solvers until the registered solvers use
+    at most maxBytes (if it is passed), keeping the solvers of the keep
+    component. Live solvers of components in a document are never evicted,
+    as their component keeps using them """
+    
+    registry = getSoRegistry()
+    with registry["lock"]:
+        for e in list(registry["solvers"].values()):
+            if e["component"] is not None and (e["doc"] == docId or e["component"].OnPingDocument() is None):
+                deleteSoSolver(e["solver"])
+                
+        if maxBytes is not None:
+            totalBytes = sum(e["bytes"] for e in registry["solvers"].values())
+            for e in list(registry["solvers"].values()):
+                if totalBytes <= maxBytes:
+                    break
+                if e["kind"] == "static" and e["component"] is not keep:
+                    deleteSoSolver(e["solver"])
+                    totalBytes -= e["bytes"]
+
+def listSoSolvers():
+    
+    """ List the registered solvers (least recently used first) for diagnostics """
+    
+    registry = getSoRegistry()
+    now = time.time()
+    with registry["lock"]:
+        return [{"kind":e["kind"],"owner":e["owner"],"doc":e["doc"],"backend":getSoBackendName(e["so"]),
+                 "megabytes":e["bytes"]/1048576.0,"idleSeconds":now-e["lastUsed"]}
+                for e in registry["solvers"].values()]
+
+def stopSoWorker(worker):
+    
+    """ Stop the worker thread and wait for its current solve to finish """
+    
+    worker["stop"].set()
+    worker["thread"].join()
+
+# Snapshot file header: magic, version, point count, iteration count,
+# editable constraint count, scalar count and flags (1 = has velocities),
+# followed by the float64 coordinates, the int32 scalar offsets, the float64
+# scalars and the float64 velocities. Trajectory frames are a frame header
+# (magic, point count, iteration count) followed by the float64 coordinates
+snapshotHeader = struct.Struct("<4sIIqIII")
+frameHeader = struct.Struct("<4sIq")
+
+def writeSoArray(f,values):
+    
+    """ Write a typed array to a binary file """
+    
+    f.write(values.tobytes() if hasattr(values,"tobytes") else values.tostring())
+
+def readSoArray(f,typecode,count):
+    
+    """ Read count values of a typecode from a binary file into a typed array """
+    
+    values = array(typecode)
+    if count:
+        values.fromfile(f,count)
+        
+    return values
+
+def saveSoSnapshot(path,ptCoords,iterations,sent,velocities=None):
+    
+    """ Save the points coordinates, iteration count, sent editable scalars
+    (a (scalars,offsets) snapshot) and optionally the velocities to a binary
+    snapshot file. It is written to a temporary file first so that a crash
+    never leaves a partial snapshot """
+    
+    scalars,offsets = sent
+    tempPath = path + ".tmp"
+    with open(tempPath,"wb") as f:
+        f.write(snapshotHeader.pack(b"SOSN",1,len(ptCoords)//3,iterations,len(offsets)-1,len(scalars),1 if velocities is not None else 0))
+        writeSoArray(f,array("d",ptCoords))
+        writeSoArray(f,array("i",offsets))
+        writeSoArray(f,array("d",scalars))
+        if velocities is not None:
+            writeSoArray(f,array("d",velocities))
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tempPath,path)
+
+def loadSoSnapshot(path):
+    
+    """ Load a binary snapshot file saved by saveSoSnapshot into a dictionary """
+    
+    with open(path,"rb") as f:
+        magic,version,pointCount,iterations,editableCount,scalarCount,flags = snapshotHeader.unpack(f.read(snapshotHeader.size))
+        if magic != b"SOSN" or version != 1:
+            raise LookupError("Not a ShapeOp snapshot file: " + path)
+        snapshot = {"pointCount":pointCount,"iterations":iterations,
+                    "coords":readSoArray(f,"d",pointCount*3),
+                    "offsets":list(readSoArray(f,"i",editableCount+1)),
+                    "scalars":readSoArray(f,"d",scalarCount),
+                    "velocities":None}
+        if flags & 1:
+            snapshot["velocities"] = readSoArray(f,"d",pointCount*3)
+            
+    return snapshot
+
+def appendSoTrajectory(path,ptCoords,iterations):
+    
+    """ Append a frame with the points coordinates to a trajectory file """
+    
+    with open(path,"ab") as f:
+        f.write(frameHeader.pack(b"SOFR",len(ptCoords)//3,iterations))
+        writeSoArray(f,array("d",ptCoords))
+
+def truncateSoTrajectory(path,pointCount,iterations):
+    
+    """ Remove the frames solved after an iteration count from a trajectory
+    file, so that after a reset (or restoring a snapshot) the trajectory goes
+    on from there instead of appending to the frames of the previous run """
+    
+    if not os.path.exists(path):
+        return
+    frameSize = frameHeader.size + pointCount*3*8
+    with open(path,"r+b") as f:
+        f.seek(0,2)
+        frameCount = f.tell()//frameSize
+        keep = 0
+        while keep < frameCount:
+            f.seek(keep*frameSize)
+            magic,count,frameIterations = frameHeader.unpack(f.read(frameHeader.size))
+            if magic != b"SOFR" or count != pointCount or frameIterations > iterations:
+                break
+            keep += 1
+        f.truncate(keep*frameSize)
+
+def readSoTrajectoryFrame(path,frame,pointCount):
+    
+    """ Read the iteration count and points coordinates of a frame of a
+    trajectory file, frames have a fixed size so this seeks straight to it """
+    
+    frameSize = frameHeader.size + pointCount*3*8
+    with open(path,"rb") as f:
+        f.seek(0,2)
+        frameCount = f.tell()//frameSize
+        if frameCount == 0:
+            raise LookupError("The trajectory file has no frames with " + str(pointCount) + " points.")
+        f.seek(max(0,min(frame,frameCount-1))*frameSize)
+        magic,count,iterations = frameHeader.unpack(f.read(frameHeader.size))
+        if magic != b"SOFR" or count != pointCount:
+            raise LookupError("The trajectory file does not match the points.")
+            
+        return iterations,readSoArray(f,"d",pointCount*3)
@@ -3,7 +3,7 @@ Extract vertex indices from a mesh using various patterns.
 -
 Authors: Anders Holden Deleuran (CITA/KADK), Mario Deuss (LGG/EPFL) 
 Github: github.com/AndersDeleuran/ShapeOpGHPython
-Updated: 150401
+Updated: 261017
     Args:
         Pattern:
             The vertex indices pattern to extract from the mesh:
@@ -16,187 +16,535 @@ Updated: 150401
                 edgeFaceVertices = neighbour face-vertex indices for each edge.
                 faceAngleVertices = neighbour vertices for each vertex corner for each face.
                 nakedVertices = vertices on the perimeter of the mesh, sorted by closed loops.
-        Mesh: The mesh to extract vertex indices from.
+        Mesh: The mesh to extract vertex indices from, vertices which share a topology vertex (e.g. along unwelded seams) are connected like welded vertices.
+        BlockSize: Optional number of constraints per block, if set the pattern is output as a source of index blocks which is generated while the solver adds the constraints, instead of as a datatree (for very large meshes, not used by verticesAll). While the blocks are generated the indexer holds the face array, a table of the faces around each vertex (about 60 bytes per face in all) and one block.
+        CacheSize: Optional number of patterns this indexer keeps in the cache shared by all mesh indexers, a pattern is reused while the mesh topology is unchanged (default = 32, 0 disables the cache).
     Returns:
-        PointIndices: The vertex indices pattern.
+        PointIndices: The vertex indices pattern (or a source of index blocks if BlockSize is set).
 """
 
 import Grasshopper as gh
+from array import array
+from collections import OrderedDict
+from scriptcontext import sticky as st
 
 # Set component name
 ghenv.Component.Name = "ShapeOpMeshIndexer"
 ghenv.Component.NickName = "SOMI"
 
-def getFaceVertices(mesh):
+# Topology functions: these only operate on a flat face array (four vertex
+# indices per face, D is -1 for triangles) and return flat index arrays plus
+# offsets, so they do not depend on RhinoCommon. A mesh can have several
+# vertices at one topology vertex (e.g. along unwelded seams), the vertex map
+# maps each vertex to the first vertex of its topology vertex so that the
+# patterns following the connectivity are found on the welded faces
+
+def faceCorners(faces,i):
     
-    """ Get datatree with the face vertex indices for each face in a mesh """
+    """ Get the vertex indices of face i in a flat face array """
     
-    faceVertices = gh.DataTree[int]()
+    b = i*4
+    if faces[b+3] < 0:
+        return faces[b],faces[b+1],faces[b+2]
+    return faces[b],faces[b+1],faces[b+2],faces[b+3]
+
+def weldFaces(faces,vertexMap=None):
     
-    for i in range(Mesh.Faces.Count):
-        fl = Mesh.Faces.Item[i]
-        if fl.IsQuad:
-            fIDs = (fl.A,fl.B,fl.C,fl.D)
-        else:
-            fIDs = (fl.A,fl.B,fl.C)
-        faceVertices.AddRange(fIDs,gh.Kernel.Data.GH_Path(i))
-        
-    return faceVertices
+    """ Replace each vertex of a flat face array with the first vertex of its
+    topology vertex, the faces are returned as they are without a vertex map """
+    
+    if vertexMap is None:
+        return faces
+    welded = array("i",faces)
+    for k,v in enumerate(faces):
+        if v >= 0:
+            welded[k] = vertexMap[v]
+            
+    return welded
 
-def getVertexNeighbours(mesh):
+def topoVertexGroups(vertexMap):
     
-    """ Get datatree with the vertex plus vertex neighbour indices
-    for each vertex in a mesh """
+    """ Get the vertices of each topology vertex which has more than one
+    vertex (its first vertex first) by the first vertex """
     
-    vertexNeighbours = gh.DataTree[int]()
+    groups = {}
+    for i,first in enumerate(vertexMap):
+        if i != first:
+            groups.setdefault(first,[first]).append(i)
+            
+    return groups
+
+def topoVertexCount(faces,vertexMap=None):
     
-    for i in range(Mesh.Vertices.Count):
-        vnIDs = [i] + list(Mesh.Vertices.GetConnectedVertices(i))
-        vertexNeighbours.AddRange(vnIDs,gh.Kernel.Data.GH_Path(i))
+    """ Get the number of vertices a flat face array refers to """
+    
+    if vertexMap is not None:
+        return len(vertexMap)
         
-    return vertexNeighbours
+    return max(faces)+1 if len(faces) else 0
 
-def getEdgeVertices(mesh):
+def topoVertexFaces(faces,vertexCount):
     
-    """ Get datatree with the edge vertex indices for each edge in mesh """
+    """ Get the faces around each vertex of a flat face array as flat face
+    indices plus offsets per vertex, which take four bytes per face corner
+    instead of a table of all the edges """
+    
+    offsets = array("i",[0])*(vertexCount+1)
+    for v in faces:
+        if v >= 0:
+            offsets[v+1] += 1
+    for i in range(vertexCount):
+        offsets[i+1] += offsets[i]
+    ends = array("i",offsets)
+    vertexFaces = array("i",[0])*offsets[-1]
+    for k,v in enumerate(faces):
+        if v >= 0:
+            vertexFaces[ends[v]] = k//4
+            ends[v] += 1
+            
+    return vertexFaces,offsets
+
+def topoVertexEdges(faces,vertexFaces,offsets,v):
+    
+    """ Get the indices of the faces adjacent to the edge from vertex v to
+    each of its neighbour vertices, by neighbour vertex """
     
-    # Get edge vertices
-    edges = []
-    for i in range(Mesh.Vertices.Count):
-        neighbours = Mesh.Vertices.GetConnectedVertices(i)
-        for n in neighbours:
-            if n > i:
-                edges.append((i,n))
+    edgeFaces = {}
+    for f in vertexFaces[offsets[v]:offsets[v+1]]:
+        corners = faceCorners(faces,f)
+        j = corners.index(v)
+        for n in (corners[j-1],corners[(j+1)%len(corners)]):
+            if n in edgeFaces:
+                edgeFaces[n].append(f)
+            else:
+                edgeFaces[n] = [f]
                 
-    # Make datatree
-    edgeVertices = gh.DataTree[int]()
-    for i,e in enumerate(edges):
-        edgeVertices.AddRange(e,gh.Kernel.Data.GH_Path(i))
+    return edgeFaces
+
+def iterTopoEdges(faces,vertexCount):
+    
+    """ Iterate over the sorted edges (as (a,b) tuples where a < b) of a flat
+    face array and the indices of the faces adjacent to each edge. The edges
+    are found vertex by vertex, so only the edges of one vertex are held in
+    memory """
+    
+    vertexFaces,offsets = topoVertexFaces(faces,vertexCount)
+    for a in range(vertexCount):
+        edgeFaces = topoVertexEdges(faces,vertexFaces,offsets,a)
+        for b in sorted(edgeFaces):
+            if b > a:
+                yield (a,b),edgeFaces[b]
+                
+def packTopo(constraints):
+    
+    """ Pack an iterable of vertex index sequences into flat indices and offsets """
+    
+    indices,offsets = array("i"),array("i",[0])
+    for c in constraints:
+        indices.extend(c)
+        offsets.append(len(indices))
+        
+    return indices,offsets
+
+def iterTopo(indices,offsets):
+    
+    """ Iterate over the vertex index sequences of flat indices and offsets """
+    
+    for i in range(len(offsets)-1):
+        yield indices[offsets[i]:offsets[i+1]]
+
+def iterTopoBlocks(constraints,blockSize):
+    
+    """ Pack an iterable of vertex index sequences into blocks of flat indices
+    and offsets with at most blockSize sequences each """
+    
+    indices,offsets = array("i"),array("i",[0])
+    for c in constraints:
+        indices.extend(c)
+        offsets.append(len(indices))
+        if len(offsets) > blockSize:
+            yield indices,offsets
+            indices,offsets = array("i"),array("i",[0])
+    if len(offsets) > 1:
+        yield indices,offsets
+
+def iterFaceVertices(faces):
+    
+    """ Iterate over the vertex indices of each face """
+    
+    for i in range(len(faces)//4):
+        yield faceCorners(faces,i)
+
+def iterFaceAngleVertices(faces):
+    
+    """ Iterate over the corner vertex followed by its two neighbours for each
+    corner of each face """
+    
+    for i in range(len(faces)//4):
+        c = faceCorners(faces,i)
+        n = len(c)
+        for j in range(n):
+            yield c[j],c[(j+1)%n],c[j-1]
+
+def iterEdgeVertices(faces,vertexMap=None):
+    
+    """ Iterate over the vertex indices of each edge of the welded faces. The
+    other vertices of a topology vertex get an edge to each of its neighbours,
+    so that every vertex is on an edge """
+    
+    vertexCount = topoVertexCount(faces,vertexMap)
+    if vertexMap is None:
+        for e,ef in iterTopoEdges(faces,vertexCount):
+            yield e
+        return
+        
+    # Find the edges of each vertex on the welded faces, the edges of a first
+    # vertex also go to the other vertices of its neighbours
+    faces = weldFaces(faces,vertexMap)
+    vertexFaces,offsets = topoVertexFaces(faces,vertexCount)
+    groups = topoVertexGroups(vertexMap)
+    for a in range(vertexCount):
+        first = vertexMap[a]
+        neighbours = topoVertexEdges(faces,vertexFaces,offsets,first)
+        ends = [n for n in neighbours if n > a]
+        if first == a:
+            ends.extend(i for n in neighbours for i in groups.get(n,(n,))[1:] if i > a)
+        for b in sorted(ends):
+            yield a,b
+
+def iterVertexNeighbours(faces,vertexCount,vertexMap=None):
+    
+    """ Iterate over each vertex followed by its neighbour vertices on the
+    welded faces, the vertices of a topology vertex share its neighbours """
+    
+    faces = weldFaces(faces,vertexMap)
+    vertexFaces,offsets = topoVertexFaces(faces,vertexCount)
+    for i in range(vertexCount):
+        first = vertexMap[i] if vertexMap is not None else i
+        yield [i] + sorted(topoVertexEdges(faces,vertexFaces,offsets,first))
+
+def iterEdgeFaceVertices(faces,vertexMap=None):
+    
+    """ Iterate over the edge vertices followed by the other vertices of its
+    two faces for each edge of the welded faces which has two adjacent faces
+    (i.e. the bending pattern) """
+    
+    vertexCount = topoVertexCount(faces,vertexMap)
+    faces = weldFaces(faces,vertexMap)
+    for e,ef in iterTopoEdges(faces,vertexCount):
+        if len(ef) == 2:
+            ids = list(e)
+            for f in ef:
+                ids.extend(v for v in faceCorners(faces,f) if v != e[0] and v != e[1])
+            yield ids
+
+def topoFaceVertices(faces):
+    
+    """ Get the vertex indices of each face """
+    
+    return packTopo(iterFaceVertices(faces))
+
+def topoFaceAngleVertices(faces):
+    
+    """ Get the corner vertex followed by its two neighbours for each corner
+    of each face """
+    
+    return packTopo(iterFaceAngleVertices(faces))
+
+def topoEdgeVertices(faces,vertexMap=None):
+    
+    """ Get the vertex indices of each edge """
+    
+    indices = array("i",[v for e in iterEdgeVertices(faces,vertexMap) for v in e])
+    offsets = array("i",range(0,len(indices)+1,2))
+    
+    return indices,offsets
+
+def topoVertexNeighbours(faces,vertexCount,vertexMap=None):
+    
+    """ Get each vertex followed by its neighbour vertices """
+    
+    return packTopo(iterVertexNeighbours(faces,vertexCount,vertexMap))
+
+def topoEdgeFaceVertices(faces,vertexMap=None):
+    
+    """ Get the edge vertices followed by the other vertices of its two faces
+    for each edge which has two adjacent faces (i.e. the bending pattern) """
+    
+    return packTopo(iterEdgeFaceVertices(faces,vertexMap))
+
+def topoBoundaryLoops(faces,vertexMap=None):
+    
+    """ Get the vertices of each boundary loop of the welded faces in
+    traversal order, boundary edges are the edges with one adjacent face and
+    they are chained over the boundary edges of each vertex, so that faces
+    with flipped orientations do not break a loop. A loop starts at its lowest
+    vertex along the direction of the face of its first edge. Each topology
+    vertex of a loop is output as all of its vertices, its first vertex first """
+    
+    vertexCount = topoVertexCount(faces,vertexMap)
+    faces = weldFaces(faces,vertexMap)
+    boundary = set(e for e,ef in iterTopoEdges(faces,vertexCount) if len(ef) == 1)
+    
+    # Map each vertex to its neighbours along the boundary edges, the next
+    # vertices along the face directions before the previous vertices
+    halfEdges = []
+    for i in range(len(faces)//4):
+        corners = faceCorners(faces,i)
+        for j in range(len(corners)):
+            a,b = corners[j-1],corners[j]
+            if ((a,b) if a < b else (b,a)) in boundary:
+                halfEdges.append((a,b))
+    neighbours = {}
+    for a,b in halfEdges:
+        neighbours.setdefault(a,[]).append(b)
+    for a,b in halfEdges:
+        neighbours.setdefault(b,[]).append(a)
+        
+    # Chain the boundary edges into loops, starting from the lowest vertex index
+    indices,offsets = array("i"),array("i",[0])
+    for start in sorted(neighbours):
+        v = start
+        while neighbours[v]:
+            indices.append(v)
+            u = neighbours[v].pop(0)
+            neighbours[u].remove(v)
+            v = u
+            if v == start:
+                break
+        if len(indices) > offsets[-1]:
+            offsets.append(len(indices))
+            
+    # Output all the vertices of each topology vertex
+    if vertexMap is not None:
+        groups = topoVertexGroups(vertexMap)
+        loops = iterTopo(indices,offsets)
+        indices,offsets = packTopo([u for v in loop for u in groups.get(v,(v,))] for loop in loops)
+        
+    return indices,offsets
+
+# Grasshopper adapters: these convert between RhinoCommon meshes, the flat
+# face arrays used by the topology functions and Grasshopper datatrees
+
+def getMeshFaces(mesh):
+    
+    """ Get the flat face array of a mesh """
+    
+    faces = array("i")
+    for i in range(mesh.Faces.Count):
+        fl = mesh.Faces.Item[i]
+        faces.extend((fl.A,fl.B,fl.C,fl.D) if fl.IsQuad else (fl.A,fl.B,fl.C,-1))
+        
+    return faces
+
+def getVertexMap(mesh):
+    
+    """ Get the vertex map of a mesh, which maps each mesh vertex to the first
+    mesh vertex of its topology vertex, or None if the mesh is welded """
+    
+    tv = mesh.TopologyVertices
+    if tv.Count == mesh.Vertices.Count:
+        return None
+    firsts = [tv.MeshVertexIndices(i)[0] for i in range(tv.Count)]
+    
+    return array("i",[firsts[tv.TopologyVertexIndex(i)] for i in range(mesh.Vertices.Count)])
+
+def makeDataTree(indices,offsets):
+    
+    """ Make datatree with a branch per flat indices offset range """
+    
+    tree = gh.DataTree[int]()
+    for i in range(len(offsets)-1):
+        tree.AddRange(list(indices[offsets[i]:offsets[i+1]]),gh.Kernel.Data.GH_Path(i))
+        
+    return tree
+
+def hashFaces(faces):
+    
+    """ Hash a flat face array by its bytes """
+    
+    return hash(faces.tobytes() if hasattr(faces,"tobytes") else faces.tostring())
+
+# The patterns which can be output as index blocks: the function iterating
+# over the pattern (from the flat face array, vertex count and vertex map)
+# and whether it uses the vertex map
+blockPatterns = {
+    "faceVertices":(lambda faces,n,vm: iterFaceVertices(faces),False),
+    "edgeVertices":(lambda faces,n,vm: iterEdgeVertices(faces,vm),True),
+    "vertexNeighbours":(iterVertexNeighbours,True),
+    "verticesEach":(lambda faces,n,vm: ((i,) for i in range(n)),False),
+    "edgeFaceVertices":(lambda faces,n,vm: iterEdgeFaceVertices(faces,vm),True),
+    "faceAngleVertices":(lambda faces,n,vm: iterFaceAngleVertices(faces),False),
+    "nakedVertices":(lambda faces,n,vm: iterTopo(*topoBoundaryLoops(faces,vm)),True)}
+
+def makeIndexBlocks(faces,vertexCount,pattern,blockSize,vertexMap=None):
+    
+    """ Make a source of the vertex indices pattern which the solver iterates
+    over as blocks of at most blockSize constraints (flat indices and offsets
+    arrays). The blocks are generated again each time they are iterated, so
+    only the face array is held in between, and a table of the faces around
+    each vertex and one block while iterating """
+    
+    iterate = blockPatterns[pattern][0]
+    
+    def blocks():
+        return iterTopoBlocks(iterate(faces,vertexCount,vertexMap),blockSize)
+        
+    # Count the constraints and indices in one pass without keeping the blocks
+    count = indexCount = 0
+    for indices,offsets in blocks():
+        count += len(offsets)-1
+        indexCount += len(indices)
         
-    return edgeVertices
+    return {"format":"blocks","pattern":pattern,"count":count,"indexCount":indexCount,
+            "key":hash((pattern,vertexCount,hashFaces(faces),hashFaces(vertexMap or array("i")))),
+            "blocks":blocks}
 
-def getVerticesEach(mesh):
+def getFaceVertices(faces,vertexCount,vertexMap=None):
+    
+    """ Get datatree with the face vertex indices for each face in a mesh """
+    
+    return makeDataTree(*topoFaceVertices(faces))
+
+def getVertexNeighbours(faces,vertexCount,vertexMap=None):
+    
+    """ Get datatree with the vertex plus vertex neighbour indices
+    for each vertex in a mesh """
+    
+    return makeDataTree(*topoVertexNeighbours(faces,vertexCount,vertexMap))
+
+def getEdgeVertices(faces,vertexCount,vertexMap=None):
+    
+    """ Get datatree with the edge vertex indices for each edge in mesh """
+    
+    return makeDataTree(*topoEdgeVertices(faces,vertexMap))
+
+def getVerticesEach(faces,vertexCount,vertexMap=None):
     
     """ Get datatree with the index of each vertex in a mesh """
     
     verticesEach = gh.DataTree[int]()
-    for i in range(Mesh.Vertices.Count):
+    for i in range(vertexCount):
         verticesEach.AddRange([i],gh.Kernel.Data.GH_Path(i))
         
     return verticesEach
 
-def getVerticesAll(mesh):
+def getVerticesAll(faces,vertexCount,vertexMap=None):
     
     """ Get a list with all the vertex indices of a mesh """
     
-    verticesAll = range(mesh.Vertices.Count)
+    verticesAll = range(vertexCount)
     
     return verticesAll
 
-def getEdgeFaceVertices(mesh):
+def getEdgeFaceVertices(faces,vertexCount,vertexMap=None):
     
     """ Get datatree with the four/six face vertex indices for each mesh edge, 
     which is used to construct the shapeop bending constraint signature """
     
-    # Make GH datatree
-    edgeFaceVerticesPtIDs = gh.DataTree[int]()
-    
-    for i in range(mesh.TopologyEdges.Count):
-        
-        p = gh.Kernel.Data.GH_Path(i)
-        
-        if len(mesh.TopologyEdges.GetConnectedFaces(i)) == 2:
-            
-            # Get edge vertex indices
-            tVts = mesh.TopologyEdges.GetTopologyVertices(i)
-            eVtA = mesh.TopologyVertices.MeshVertexIndices(tVts.I)[0]
-            eVtB = mesh.TopologyVertices.MeshVertexIndices(tVts.J)[0]
-            eVts = set((eVtA,eVtB))
-            
-            # Get edge face vertex index
-            fA,fB = mesh.TopologyEdges.GetConnectedFaces(i)
-            fVtsA = mesh.Faces.GetTopologicalVertices(fA)
-            fVtsB = mesh.Faces.GetTopologicalVertices(fB)
-            fVtsA = [mesh.TopologyVertices.MeshVertexIndices(i)[0] for i in fVtsA]
-            fVtsB = [mesh.TopologyVertices.MeshVertexIndices(i)[0] for i in fVtsB]
-            fVts = set(fVtsA + fVtsB)
-            
-            # Get the face indices which are not part of the edge
-            fVts = list(fVts - eVts)
-            
-            # Make the bending constraint point indices list
-            eFVIDs = list(eVts) + fVts
-            edgeFaceVerticesPtIDs.AddRange(eFVIDs,p)
-            
-            
-    return edgeFaceVerticesPtIDs
+    return makeDataTree(*topoEdgeFaceVertices(faces,vertexMap))
 
-def getFaceAngleVertices(mesh):
+def getFaceAngleVertices(faces,vertexCount,vertexMap=None):
     
     """ Get datatree with the face angle vertex indices for each face in a mesh """
     
-    faceVertices = gh.DataTree[int]()
-    
-    n = 0
-    for i in range(Mesh.Faces.Count):
-        fl = Mesh.Faces.Item[i]
-        if fl.IsQuad:
-            faceVertices.AddRange((fl.A,fl.B,fl.D),gh.Kernel.Data.GH_Path(n+0))
-            faceVertices.AddRange((fl.B,fl.C,fl.A),gh.Kernel.Data.GH_Path(n+1))
-            faceVertices.AddRange((fl.C,fl.D,fl.B),gh.Kernel.Data.GH_Path(n+2))
-            faceVertices.AddRange((fl.D,fl.A,fl.C),gh.Kernel.Data.GH_Path(n+3))
-            n += 4
-        else:
-            faceVertices.AddRange((fl.A,fl.B,fl.C),gh.Kernel.Data.GH_Path(n+0))
-            faceVertices.AddRange((fl.B,fl.C,fl.A),gh.Kernel.Data.GH_Path(n+1))
-            faceVertices.AddRange((fl.C,fl.A,fl.B),gh.Kernel.Data.GH_Path(n+2))
-            n += 3
-            
-    return faceVertices
+    return makeDataTree(*topoFaceAngleVertices(faces))
 
-def getNakedVertices(mesh):
+def getNakedVertices(faces,vertexCount,vertexMap=None):
     
     """ Get datatree with indices of naked vertices, sorted by closed loops """
     
-    # Get naked edges as polylines and naked edge status
-    npl = list(mesh.GetNakedEdges())
-    nvts = mesh.GetNakedEdgePointStatus()
-    
-    # Sort the naked vertices by which polyline they belong to
-    nakedVertices = gh.DataTree[int]()
-    for i,v in enumerate(nvts):
-        if v:
-            for j,pl in enumerate(npl):
-                p = gh.Kernel.Data.GH_Path(j)
-                if pl.Contains(mesh.Vertices.Item[i]):
-                    nakedVertices.Add(i,p)
-                    
-    return nakedVertices
-
-if Mesh and Pattern:
-    
-    if Pattern == "faceVertices":
-        PointIndices = getFaceVertices(Mesh)
-        
-    elif Pattern == "edgeVertices":
-        PointIndices = getEdgeVertices(Mesh)
-        
-    elif Pattern == "vertexNeighbours":
-        PointIndices = getVertexNeighbours(Mesh)
-        
-    elif Pattern == "verticesEach":
-        PointIndices = getVerticesEach(Mesh)
-        
-    elif Pattern == "verticesAll":
-        PointIndices = getVerticesAll(Mesh)
+    return makeDataTree(*topoBoundaryLoops(faces,vertexMap))
+
+# The patterns which can be output as datatrees: the function getting the
+# pattern (from the flat face array, vertex count and vertex map) and whether
+# it uses the vertex map, or None if it only depends on the vertex count
+indexPatterns = {
+    "faceVertices":(getFaceVertices,False),
+    "edgeVertices":(getEdgeVertices,True),
+    "vertexNeighbours":(getVertexNeighbours,True),
+    "verticesEach":(getVerticesEach,None),
+    "verticesAll":(getVerticesAll,None),
+    "edgeFaceVertices":(getEdgeFaceVertices,True),
+    "faceAngleVertices":(getFaceAngleVertices,False),
+    "nakedVertices":(getNakedVertices,True)}
+
+def getPatternCache():
+    
+    """ Get the cache of index patterns shared by all mesh indexers from
+    sticky, which holds the patterns by topology key in least recently used
+    order, the mesh each owner component indexed last and the counts of cache
+    hits and misses """
+    
+    if "ShapeOpIndexerCache" not in st:
+        st["ShapeOpIndexerCache"] = {"entries":OrderedDict(),"last":{},"hits":0,"misses":0}
         
-    elif Pattern == "edgeFaceVertices":
-        PointIndices = getEdgeFaceVertices(Mesh)
+    return st["ShapeOpIndexerCache"]
+
+def trimPatternCache(cache,owner,maxCount):
+    
+    """ Evict the least recently used patterns of an owner component until
+    it holds at most maxCount patterns, the cache size of a component only
+    limits its own patterns """
+    
+    keys = [k for k,e in cache["entries"].items() if e["owner"] == owner]
+    for k in keys[:max(len(keys)-maxCount,0)]:
+        del cache["entries"][k]
+
+def getIndexPattern(mesh,pattern,blockSize=None,cacheSize=32,owner=None):
+    
+    """ Get the vertex indices pattern of a mesh, as a datatree or a source of
+    index blocks. The pattern only depends on the face connectivity, so it is
+    looked up in the pattern cache on a hash of the face array and only made
+    when the topology is new. When an owner indexes the same mesh object as
+    last time (Grasshopper does not change meshes in place) the pattern is
+    found without reading the faces. The cache is only used if cacheSize > 0 """
+    
+    asBlocks = bool(blockSize) and pattern in blockPatterns
+    uses = blockPatterns[pattern][1] if asBlocks else indexPatterns[pattern][1]
+    vertexCount = mesh.Vertices.Count
+    cache = getPatternCache()
+    args = pattern,blockSize if asBlocks else None,vertexCount,mesh.Faces.Count
+    
+    # Look up the key of the mesh the owner indexed last
+    last = cache["last"].get(owner) if cacheSize > 0 else None
+    if last is not None and last[0] is mesh and last[1] == args and last[2] in cache["entries"]:
+        key = last[2]
+        entry = cache["entries"].pop(key)
+        cache["hits"] += 1
         
-    elif Pattern == "faceAngleVertices":
-        PointIndices = getFaceAngleVertices(Mesh)
+    # Look up the pattern, comparing the topology too in case of a hash collision
+    else:
+        faces = getMeshFaces(mesh) if uses is not None else array("i")
+        vertexMap = getVertexMap(mesh) if uses else None
+        topology = faces,vertexMap
+        key = args + (hashFaces(faces),hashFaces(vertexMap) if vertexMap is not None else None)
+        entry = cache["entries"].pop(key,None) if cacheSize > 0 else None
+        if entry is not None and entry["topology"] == topology:
+            cache["hits"] += 1
+        else:
+            cache["misses"] += 1
+            if asBlocks:
+                entry = {"topology":topology,"pattern":[makeIndexBlocks(faces,vertexCount,pattern,blockSize,vertexMap),]}
+            else:
+                entry = {"topology":topology,"pattern":indexPatterns[pattern][0](faces,vertexCount,vertexMap)}
+                
+    # Store the pattern as the most recently used of the owner and evict its least recently used
+    if cacheSize > 0:
+        entry["owner"] = owner
+        cache["entries"][key] = entry
+        cache["last"][owner] = mesh,args,key
+        trimPatternCache(cache,owner,cacheSize)
         
-    elif Pattern == "nakedVertices":
-        PointIndices = getNakedVertices(Mesh)
+    return entry["pattern"]
+
+if CacheSize is None:
+    CacheSize = 32
+    
+if Mesh and Pattern in indexPatterns:
+    PointIndices = getIndexPattern(Mesh,Pattern,BlockSize,CacheSize,str(ghenv.Component.InstanceGuid))
+    cache = getPatternCache()
+    ghenv.Component.Message = "Cache: " + str(cache["hits"]) + " hits, " + str(cache["misses"]) + " misses"
 else:
-    PointIndices = []
\ No newline at end of file
+    PointIndices = []
+    ghenv.Component.Message = None
\ No newline at end of file
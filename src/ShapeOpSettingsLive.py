@@ -6,7 +6,7 @@ False the solver will iteratively run the solve step.
 -
 Authors: Anders Holden Deleuran (CITA/KADK), Mario Deuss (LGG/EPFL) 
 Github: github.com/AndersDeleuran/ShapeOpGHPython
-Updated: 150330
+Updated: 261017
     Args:
         Iterations: The number of iterations to run each time the component updates (default = 5)
         Mass: The mass of the points (default = 1.00)
@@ -15,7 +15,22 @@ Updated: 150330
         UnaryVector: A vector which will apply a force to all points in its direction and magnitude (default = None).
         Dynamic: True to initialize the solver with dynamics (default = True).
         Pause: True to pause, False to unpause (default = False).
-        Reset: True to Reset, False to run the solver live.
+        Threaded: True to solve continuously on a background thread, the component then only displays the latest solved points (default = False).
+        RefreshInterval: The interval in milliseconds at which the component updates (default = 10).
+        TargetFrameTime: Optional target time in milliseconds per update (e.g. 33), the iterations of each update are then adapted so that solving plus redrawing takes this long (default = None).
+        Tolerance: Auto-pause the solver once the maximum point displacement of an update is below this distance (default = None).
+        Backend: The solver backend, "native" for the ShapeOp library or "python" for the slow pure Python reference solver (default = "native").
+        SolverMemory: The approximate memory in megabytes all the solvers of all the solver components may use, the least recently used cached static solvers are deleted beyond it, live solvers are only deleted with their component (default = 2048).
+        Merge: True to merge duplicate constraints (of the same type on the same points) by summing their weights before they are added to the solver, duplicates with different scalars are reported and not merged, so the solver resets when changing scalars changes which constraints merge (default = False).
+        Profile: True to time each phase of the solution and output it from the solver Profile output (default = False).
+        ProfileLog: Optional path of a file which the profile of each solution is appended to as a line of JSON, rolled over at 1 MB (default = None).
+        SnapshotPath: Optional path of a binary snapshot file holding the points, iteration count, editable constraint scalars and velocities (if the backend exposes them) of the solver (default = None).
+        SaveSnapshot: True to save a snapshot to SnapshotPath each time the solver updates (default = False).
+        RestoreSnapshot: True to reset the solver and restore the snapshot from SnapshotPath, once each time it is set to True (default = False).
+        SnapshotInterval: Save a snapshot and append a trajectory frame each time this many iterations have been solved, None or 0 for never (default = None).
+        TrajectoryPath: Optional path of an append-only trajectory file which the points are written to as a frame at each SnapshotInterval, resetting removes the frames solved after the reset (default = None).
+        ScrubFrame: Output the points of this frame of the trajectory file instead of solving, None to solve (default = None).
+        Reset: True to Reset, False to run the solver live. If the constraint topology is unchanged the initialized solver is kept, its velocities are then zeroed, which reinitializes (and refactors) the solver if the ShapeOp library cannot set velocities.
     Returns:
         Settings: A Python dictionary wrapping the settings.
 """
@@ -40,7 +55,23 @@ if Reset is None:
     Reset = True
 if Pause is None:
     Pause = False
+if Threaded is None:
+    Threaded = False
+if RefreshInterval is None:
+    RefreshInterval = 10
+if Backend is None:
+    Backend = "native"
+if SolverMemory is None:
+    SolverMemory = 2048
+if Merge is None:
+    Merge = False
+if Profile is None:
+    Profile = False
+if SaveSnapshot is None:
+    SaveSnapshot = False
+if RestoreSnapshot is None:
+    RestoreSnapshot = False
 
 # Wrap all settings in a dict
-Settings = [{"mode":"live","iterations":Iterations,"mass":Mass,"damping":Damping,"timeStep":TimeStep,"dynamic":Dynamic,"reset":Reset,"pause":Pause,"unaryVector":UnaryVector},]
+Settings = [{"mode":"live","iterations":Iterations,"mass":Mass,"damping":Damping,"timeStep":TimeStep,"dynamic":Dynamic,"reset":Reset,"pause":Pause,"unaryVector":UnaryVector,"threaded":Threaded,"refreshInterval":RefreshInterval,"targetFrameTime":TargetFrameTime,"tolerance":Tolerance,"backend":Backend,"solverMemory":SolverMemory,"merge":Merge,"profile":Profile,"profileLog":ProfileLog,"snapshotPath":SnapshotPath,"saveSnapshot":SaveSnapshot,"restoreSnapshot":RestoreSnapshot,"snapshotInterval":SnapshotInterval,"trajectoryPath":TrajectoryPath,"scrubFrame":ScrubFrame},]
 
@@ -5,9 +5,22 @@ initalized without dynamics.
 -
 Authors: Anders Holden Deleuran (CITA/KADK), Mario Deuss (LGG/EPFL) 
 Github: github.com/AndersDeleuran/ShapeOpGHPython
-Updated: 150330
+Updated: 261017
     Args:
-        Iterations: The amount of iterations to run.
+        Iterations: The amount of iterations to run (the maximum if Tolerance or TimeBudget is set).
+        Tolerance: Stop solving once the maximum point displacement between two chunks of iterations is below this distance (default = None).
+        TimeBudget: Stop solving once this many seconds have been spent solving (default = None).
+        Chunk: The number of iterations between each convergence check (default = 10).
+        CacheSize: The number of initialized solvers to keep for reuse (per solver component) when only scalars or iterations change, 0 to delete each solver after solving (default = 4).
+        CacheMemory: The approximate memory in megabytes the cached solvers of a solver component may use (default = 512).
+        Workers: The number of threads used for solving Variants or Partition components in parallel, 1 solves them one after the other (default = 4).
+        Partition: True to solve each connected component of the constraints (e.g. disconnected mesh pieces) with its own solver in parallel, solvers are then not cached (default = False).
+        Levels: The number of coarser levels to solve first when solving from coarse to fine, each level clusters the points with their neighbours in the constraint graph and its result is the starting point of the next finer level, 0 to solve only the input constraints (default = 0). The coarse levels are solved with a quarter of the Iterations and ten times the Tolerance, and Iterations outputs the iterations of the finest level.
+        Backend: The solver backend, "native" for the ShapeOp library or "python" for the slow pure Python reference solver (default = "native").
+        SolverMemory: The approximate memory in megabytes all the solvers of all the solver components may use, the least recently used cached static solvers are deleted beyond it, live solvers are only deleted with their component (default = 2048).
+        Merge: True to merge duplicate constraints (of the same type on the same points) by summing their weights before they are added to the solver, duplicates with different scalars are reported and not merged (default = False).
+        Profile: True to time each phase of the solution and output it from the solver Profile output (default = False).
+        ProfileLog: Optional path of a file which the profile of each solution is appended to as a line of JSON, rolled over at 1 MB (default = None).
     Returns:
         Settings: A Python dictionary wrapping the settings.
 """
@@ -21,6 +34,26 @@ ghenv.Component.NickName = "SOSS"
 # Check/set inputs
 if Iterations is None:
     Iterations = 50
+if Chunk is None:
+    Chunk = 10
+if CacheSize is None:
+    CacheSize = 4
+if CacheMemory is None:
+    CacheMemory = 512
+if Workers is None:
+    Workers = 4
+if Partition is None:
+    Partition = False
+if Levels is None:
+    Levels = 0
+if Backend is None:
+    Backend = "native"
+if SolverMemory is None:
+    SolverMemory = 2048
+if Merge is None:
+    Merge = False
+if Profile is None:
+    Profile = False
 
 # Wrap all settings in dict and output to GH
-Settings = [{"mode":"static","iterations":Iterations},]
\ No newline at end of file
+Settings = [{"mode":"static","iterations":Iterations,"tolerance":Tolerance,"timeBudget":TimeBudget,"chunk":Chunk,"cacheSize":CacheSize,"cacheMemory":CacheMemory,"workers":Workers,"partition":Partition,"levels":Levels,"backend":Backend,"solverMemory":SolverMemory,"merge":Merge,"profile":Profile,"profileLog":ProfileLog},]
\ No newline at end of file
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,"bench"))
+
+import harness
+
+harness.install()
+
+@pytest.fixture(autouse=True)
+def cleanHost():
+    harness.useNativeLibrary(None)
+    harness.resetSticky()
+    yield
+    harness.resetSticky()
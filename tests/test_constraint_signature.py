@@ -0,0 +1,36 @@
+import harness
+import scenarios
+from harness import Point3d
+
+def coords(sig):
+    return [round(v,9) for v in sig["scalars"]]
+
+def test_derived_edge_lengths():
+    points = [Point3d(0,0,0),Point3d(3,4,0),Point3d(3,4,2)]
+    sig = scenarios.makeSig("EdgeStrain",[[0,1],[1,2]],points=points,factor=0.5)
+    assert coords(sig) == [2.5,1.0,1.0,1.0,1.0,1.0]
+    assert list(sig["scalarOffsets"]) == [0,3,6]
+
+def test_derived_positions_and_shapes():
+    points = [Point3d(0,0,0),Point3d(2,0,0),Point3d(2,2,0)]
+    sig = scenarios.makeSig("Closeness",[[2],[0]],points=points)
+    assert coords(sig) == [2,2,0,0,0,0]
+    sig = scenarios.makeSig("Similarity",[[0,1]],points=points,factor=2.0)
+    assert coords(sig) == [-1,0,0,3,0,0]
+    assert list(sig["scalarOffsets"]) == [0,6]
+
+def test_derived_scalars_of_index_blocks():
+    mesh = harness.gridMesh(3)
+    points = mesh.Vertices.ToPoint3dArray()
+    tree = scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices"),points=points)
+    blocks = scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices",blockSize=5),points=points)
+    assert blocks["format"] == "blocks"
+    assert list(blocks["scalars"]) == list(tree["scalars"])
+    assert list(blocks["scalarOffsets"]) == list(tree["scalarOffsets"])
+
+def test_points_not_covering_indices_keep_scalars():
+    component = harness.Component("ShapeOpConstraintSignature")
+    ns = harness.runComponent(component,ConstraintType="EdgeStrain",PointIndices=scenarios.toTree([[0,5]]),
+                              Weights=[1.0],Scalars=scenarios.toTree([[2.0,1.0,1.0]]),Points=[Point3d()],Factor=None)
+    assert list(ns["ConstraintSigs"][0]["scalars"]) == [2.0,1.0,1.0]
+    assert len(component.messages) == 1
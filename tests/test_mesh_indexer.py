@@ -0,0 +1,101 @@
+import harness
+import scenarios
+
+import ShapeOpMeshIndexer as mi
+
+def branches(tree):
+    return [list(b) for b in tree.Branches]
+
+def test_welded_grid_patterns():
+    mesh = harness.gridMesh(2)
+    faces = mi.getMeshFaces(mesh)
+    assert mi.getVertexMap(mesh) is None
+    assert len(list(mi.iterEdgeVertices(faces))) == 12
+    assert branches(mi.getVertexNeighbours(faces,9))[4] == [4,1,3,5,7]
+    assert len(list(mi.iterEdgeFaceVertices(faces))) == 4
+
+def test_seam_vertices_are_connected():
+    # Two quads sharing a seam whose vertices are duplicated (1/2 and 5/6)
+    mesh = harness.gridMesh(2,1,seams=(1,))
+    faces = mi.getMeshFaces(mesh)
+    vertexMap = mi.getVertexMap(mesh)
+    assert list(vertexMap) == [0,1,1,3,4,5,5,7]
+
+    edges = list(mi.iterEdgeVertices(faces,vertexMap))
+    assert set(v for e in edges for v in e) == set(range(8))
+    assert (0,2) in edges and (1,3) in edges and (2,3) in edges
+
+    neighbours = branches(mi.getVertexNeighbours(faces,8,vertexMap))
+    assert len(neighbours) == 8
+    assert all(len(b) > 1 for b in neighbours)
+    assert sorted(neighbours[2][1:]) == sorted(neighbours[1][1:]) == [0,3,5]
+
+    # The bending pattern spans the seam
+    assert list(mi.iterEdgeFaceVertices(faces,vertexMap)) == [[1,5,0,4,3,7]]
+
+def test_indexer_component_uses_topology():
+    mesh = harness.gridMesh(2,1,seams=(1,))
+    tree = scenarios.indexMesh(mesh,"edgeVertices")
+    assert tree.BranchCount == 13
+    blocks = scenarios.indexMesh(mesh,"edgeVertices",blockSize=4)[0]
+    ids = [list(c) for indices,offsets in blocks["blocks"]() for c in mi.iterTopo(indices,offsets)]
+    assert ids == branches(tree)
+
+def test_seam_mesh_solves():
+    mesh = harness.gridMesh(4,4,seams=(2,))
+    points = mesh.Vertices.ToPoint3dArray()
+    sigs = [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices"),1.0),
+            scenarios.makeSig("Closeness",[[0],[4]],10.0)]
+    settings = scenarios.staticSettings(Iterations=10,CacheSize=0,Backend="python")
+    out = scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,settings)
+    assert out["ConstraintCount"] == sigs[0]["count"] + 2
+    assert all(a.DistanceTo(b) < 1e-6 for a,b in zip(out["Points"],points))
+
+def test_seam_is_not_naked():
+    mesh = harness.gridMesh(2,1,seams=(1,))
+    loops = branches(scenarios.indexMesh(mesh,"nakedVertices"))
+    assert loops == [[0,1,2,3,7,5,6,4]]
+    welded = branches(scenarios.indexMesh(harness.gridMesh(2,1),"nakedVertices"))
+    assert welded == [[0,1,2,5,4,3]]
+
+def indexWith(component,mesh,pattern,cacheSize):
+    return harness.runComponent(component,Mesh=mesh,Pattern=pattern,CacheSize=cacheSize)["PointIndices"]
+
+def test_pattern_cache_hits_and_misses():
+    a = harness.Component("ShapeOpMeshIndexer")
+    mesh = harness.gridMesh(3)
+    tree = indexWith(a,mesh,"edgeVertices",4)
+    assert indexWith(a,mesh,"edgeVertices",4) is tree
+    cache = mi.getPatternCache()
+    assert (cache["hits"],cache["misses"]) == (1,1)
+
+    # The same mesh object is a hit without reading its faces
+    items,mesh.Faces.Item = mesh.Faces.Item,None
+    assert indexWith(a,mesh,"edgeVertices",4) is tree
+    mesh.Faces.Item = items
+
+    # An equal mesh is a hit on its faces, another topology or pattern is a miss
+    assert indexWith(a,harness.gridMesh(3),"edgeVertices",4) is tree
+    assert indexWith(a,harness.gridMesh(3,triangles=True),"edgeVertices",4) is not tree
+    assert indexWith(a,mesh,"faceVertices",4) is not tree
+    assert (cache["hits"],cache["misses"]) == (3,3)
+
+def test_pattern_cache_is_trimmed_per_component():
+    a,b,c = [harness.Component("ShapeOpMeshIndexer") for i in range(3)]
+    for n in (1,2,3):
+        indexWith(a,harness.gridMesh(n),"faceVertices",2)
+    indexWith(b,harness.gridMesh(4),"faceVertices",1)
+    indexWith(c,harness.gridMesh(5),"faceVertices",0)
+    cache = mi.getPatternCache()
+    assert [e["owner"] for e in cache["entries"].values()] == [a.InstanceGuid]*2 + [b.InstanceGuid]
+    assert [k[2] for k in cache["entries"]] == [9,16,25]
+
+    # The least recently used pattern of a component is evicted first
+    indexWith(a,harness.gridMesh(2),"faceVertices",2)
+    indexWith(a,harness.gridMesh(1),"faceVertices",2)
+    assert [k[2] for k in cache["entries"]] == [25,9,4]
+    assert cache["misses"] == 6
+
+def test_flipped_face_keeps_one_boundary_loop():
+    mesh = harness.Mesh([(x,y,0) for y in range(2) for x in range(3)],[(0,1,4,3),(1,4,5,2)])
+    assert branches(scenarios.indexMesh(mesh,"nakedVertices")) == [[0,1,2,5,4,3]]
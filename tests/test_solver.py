@@ -0,0 +1,361 @@
+import math
+import os
+import sys
+
+import pytest
+
+import harness
+import scenarios
+
+def test_python_backend_solves_static():
+    mesh,points,sigs = scenarios.cloth(4)
+    settings = scenarios.staticSettings(Iterations=20,CacheSize=0,Backend="python")
+    out = scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,settings)
+    assert out["ConstraintCount"] == 40 + 2
+    assert out["Iterations"] == 20
+    # Nothing pulls the cloth away from its rest state
+    assert all(a.DistanceTo(b) < 1e-6 for a,b in zip(out["Points"],points))
+
+def test_native_fallback_to_python_backend():
+    mesh,points,sigs = scenarios.cloth(2)
+    component = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(component,sigs,points,scenarios.staticSettings(CacheSize=0))
+    assert any("Python backend" in m for level,m in component.messages)
+
+def test_changing_backend_resets_live_solver():
+    mesh,points,sigs = scenarios.cloth(3)
+    component = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=True,Backend="python"))
+    out = scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=False,Backend="python"))
+    assert out["Iterations"] == 5
+
+    # The stub library must not be handed the handle of the Python solver
+    stub = harness.StubShapeOp()
+    harness.useNativeLibrary(stub)
+    out = scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=False))
+    info = out["SolverInfo"][0]
+    assert info["fullResets"] == 2
+    assert stub.calls["shapeop_create"] == 1
+    out = scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=False))
+    assert stub.calls["shapeop_solve"] == 1
+
+def test_batched_constraints_match_per_constraint():
+    import bench_constraints
+    import ShapeOpConstraintSolver as cs
+    import ShapeOpCore as core
+    cs.so = core.loadSoBackend("python")
+    csd = bench_constraints.chainSig(5)
+    solvers = []
+    for add in (bench_constraints.addPerConstraint,cs.addSoConstraints):
+        solver,ptCoords = cs.makeSoSolver([harness.Point3d(i,0,0) for i in range(6)])
+        solvers.append((add(solver,csd),solver.constraints))
+    assert solvers[0][0] == solvers[1][0] == list(range(5))
+    assert [c["rest"] for c in solvers[0][1]] == [c["rest"] for c in solvers[1][1]] == [1.0]*5
+
+def test_pack_unpack_points_round_trip():
+    import ShapeOpConstraintSolver as cs
+    points = [harness.Point3d(i,-i,i*0.5) for i in range(7)]
+    ptCoords = cs.packSoPoints(points)
+    assert cs.packSoPoints(points[::-1],ptCoords) is ptCoords
+    assert cs.unpackSoPoints(ptCoords) == points[::-1]
+
+def test_python_angle_constraint_default_range():
+    import ShapeOpConstraintSolver as cs
+    import ShapeOpCore as core
+    cs.so = core.loadSoBackend("python")
+    points = [harness.Point3d(0,0,0),harness.Point3d(1,0,0),harness.Point3d(0,1,0)]
+    solver,ptCoords = cs.makeSoSolver(points)
+    cs.addSoConstraints(solver,scenarios.makeSig("AngleConstraint",[[0,1,2]]))
+    c = solver.constraints[0]
+    assert (c["rangeMin"],c["rangeMax"]) == (0.0,math.pi)
+
+def test_variant_scalars_must_match_signature():
+    import ShapeOpConstraintSolver as cs
+    import ShapeOpCore as core
+    cs.so = core.loadSoBackend("python")
+    points = [harness.Point3d(i,0,0) for i in range(3)]
+    sigs = [scenarios.makeSig("EdgeStrain",[[0,1],[1,2]],scalars=[[1.0,0.9,1.1],[1.0,0.9,1.1]]),
+            scenarios.makeSig("Closeness",[[0],[2]])]
+    settings = scenarios.staticSettings(Iterations=5,Workers=2)
+    variants = [(None,None),(None,[[1.0,0.8,1.2,1.0,0.8,1.2],None])]
+    variantPoints,iterations,count,info = cs.runSoSolverBatch(sigs,points,variants,settings)
+    assert iterations == [5,5] and count == 4
+    # A variant with the scalars of one constraint would be read past its end
+    with pytest.raises(LookupError):
+        cs.runSoSolverBatch(sigs,points,[(None,[[1.0,0.9,1.1],None])],settings)
+
+def test_static_cache_is_trimmed_per_component():
+    import ShapeOpConstraintSolver as cs
+    harness.useNativeLibrary(harness.StubShapeOp())
+    a,b,c = [harness.Component("ShapeOpConstraintSolver") for i in range(3)]
+    for component,n,cacheSize in ((a,2,1),(b,3,1),(a,4,1),(c,5,0)):
+        mesh,points,sigs = scenarios.cloth(n)
+        scenarios.solve(component,sigs,points,scenarios.staticSettings(CacheSize=cacheSize))
+    owners = sorted(e["owner"] for e in cs.getSoStaticCache().values())
+    assert owners == sorted([a.InstanceGuid,b.InstanceGuid])
+
+def test_static_cache_lookup_only_when_caching():
+    import ShapeOpConstraintSolver as cs
+    stub = harness.StubShapeOp()
+    harness.useNativeLibrary(stub)
+    mesh,points,sigs = scenarios.cloth(2)
+    a,b = [harness.Component("ShapeOpConstraintSolver") for i in range(2)]
+    scenarios.solve(a,sigs,points,scenarios.staticSettings(CacheSize=2))
+    scenarios.solve(b,sigs,points,scenarios.staticSettings(CacheSize=0))
+    assert [e["owner"] for e in cs.getSoStaticCache().values()] == [a.InstanceGuid]
+    assert len(stub.solvers) == 1 and stub.calls["shapeop_create"] == 2
+
+def test_static_cache_compares_topology_on_hit():
+    import ShapeOpConstraintSolver as cs
+    stub = harness.StubShapeOp()
+    harness.useNativeLibrary(stub)
+    mesh,points,sigs = scenarios.cloth(2)
+    component = harness.Component("ShapeOpConstraintSolver")
+    settings = scenarios.staticSettings(CacheSize=2)
+    assert scenarios.solve(component,sigs,points,settings)["SolverInfo"][0]["cache"] == "miss"
+    assert scenarios.solve(component,sigs,points,settings)["SolverInfo"][0]["cache"] == "result"
+
+    # An entry whose topology differs under the same hash is a miss
+    entry = next(iter(cs.getSoStaticCache().values()))
+    entry["topology"] = ("colliding",)
+    assert scenarios.solve(component,sigs,points,settings)["SolverInfo"][0]["cache"] == "miss"
+    assert len(stub.solvers) == 1
+
+def test_failed_static_solve_deletes_solver():
+    import ShapeOpConstraintSolver as cs
+    stub = harness.StubShapeOp()
+    harness.useNativeLibrary(stub)
+    mesh,points,sigs = scenarios.cloth(2)
+    component = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(component,sigs,points,scenarios.staticSettings(Iterations=5,CacheSize=4))
+    assert len(stub.solvers) == 1
+    stub.shapeop_solve = lambda solver,iterations: 1
+    with pytest.raises(LookupError):
+        scenarios.solve(component,sigs,points,scenarios.staticSettings(Iterations=6,CacheSize=4))
+    assert not stub.solvers and not cs.getSoStaticCache()
+
+def test_incremental_reset_zeroes_velocities():
+    mesh,points,sigs = scenarios.cloth(2)
+    reset = scenarios.liveSettings(Reset=True,Backend="python",UnaryVector=scenarios.gravity)
+    component = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(component,sigs,points,reset)
+    scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=False,Backend="python",UnaryVector=scenarios.gravity))
+    info = scenarios.solve(component,sigs,points,reset)["SolverInfo"][0]
+    assert info["incrementalResets"] == 1 and info["velocityReset"] == "setVelocities"
+
+    # A library without the velocities setter reinitializes the solver
+    stub = harness.StubShapeOp()
+    harness.useNativeLibrary(stub)
+    component = harness.Component("ShapeOpConstraintSolver")
+    for i in range(2):
+        info = scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=True))["SolverInfo"][0]
+    assert info["velocityReset"] == "initDynamic"
+    assert stub.calls["shapeop_initDynamic"] == 2
+
+def test_restore_snapshot_once_and_truncate_trajectory(tmp_path):
+    mesh,points,sigs = scenarios.cloth(2)
+    snapshot,trajectory = str(tmp_path/"cloth.sosn"),str(tmp_path/"cloth.sotr")
+    component = harness.Component("ShapeOpConstraintSolver")
+
+    def tick(**inputs):
+        settings = scenarios.liveSettings(Backend="python",UnaryVector=scenarios.gravity,
+                                          SnapshotInterval=5,TrajectoryPath=trajectory,**inputs)
+        return scenarios.solve(component,sigs,points,settings)["Iterations"]
+
+    def frames():
+        return os.path.getsize(trajectory)//(16+len(points)*24)
+
+    tick(Reset=True)
+    tick(Reset=False)
+    assert tick(Reset=False,SnapshotPath=snapshot,SaveSnapshot=True) == 10
+    tick(Reset=False)
+    assert frames() == 3
+
+    # Restoring goes back to the frame of the snapshot, holding True keeps solving
+    assert tick(Reset=False,SnapshotPath=snapshot,RestoreSnapshot=True) == 10
+    assert frames() == 2
+    assert tick(Reset=False,SnapshotPath=snapshot,RestoreSnapshot=True) == 15
+    assert frames() == 3
+    tick(Reset=True)
+    assert frames() == 0
+
+def test_live_merge_layout_change_resets():
+    points = [harness.Point3d(i,0,0) for i in range(3)]
+    anchor = scenarios.makeSig("Closeness",[[0],[2]])
+    component = harness.Component("ShapeOpConstraintSolver")
+
+    def tick(second,reset=False):
+        sig = scenarios.makeSig("EdgeStrain",[[0,1],[0,1],[1,2]],scalars=[[1.0,0.9,1.1],second,[1.0,0.9,1.1]])
+        settings = scenarios.liveSettings(Reset=reset,Backend="python",Merge=True)
+        return scenarios.solve(component,[sig,anchor],points,settings)
+
+    assert tick([1.0,0.9,1.1],True)["ConstraintCount"] == 4
+    assert tick([1.0,0.9,1.1])["SolverInfo"][0]["fullResets"] == 1
+    # The duplicate stops merging, so the constraints no longer match the solver
+    out = tick([1.0,0.8,1.2])
+    assert out["ConstraintCount"] == 5 and out["SolverInfo"][0]["fullResets"] == 2
+
+def test_live_solvers_are_kept_while_in_a_document():
+    import ShapeOpCore as core
+    harness.useNativeLibrary(harness.StubShapeOp())
+    mesh,points,sigs = scenarios.cloth(3)
+    live = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(live,sigs,points,scenarios.liveSettings(Reset=True))
+    entries = core.getSoRegistry()["solvers"]
+    entry = [e for e in entries.values() if e["kind"] == "live"][0]
+
+    # Each live update marks the solver as used
+    entry["lastUsed"] = 0.0
+    scenarios.solve(live,sigs,points,scenarios.liveSettings(Reset=False))
+    assert entry["lastUsed"] > 0.0
+
+    # Running out of solver memory evicts cached static solvers only
+    static = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(static,sigs,points,scenarios.staticSettings(CacheSize=4))
+    scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,scenarios.staticSettings(CacheSize=4,SolverMemory=0))
+    owners = [e["owner"] for e in entries.values()]
+    assert live.InstanceGuid in owners and static.InstanceGuid not in owners
+
+def test_worker_stops_when_component_is_removed():
+    import ShapeOpConstraintSolver as cs
+    harness.useNativeLibrary(harness.StubShapeOp())
+    mesh,points,sigs = scenarios.cloth(3)
+    component = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=True,Threaded=True))
+    scenarios.solve(component,sigs,points,scenarios.liveSettings(Reset=False,Threaded=True))
+    worker = [v for k,v in cs.st.items() if k.startswith("worker_")][0]
+    assert worker["thread"].is_alive()
+    component.document = None
+    worker["thread"].join(5.0)
+    assert not worker["thread"].is_alive()
+
+def islands():
+    # A 2x2 grid and a separate quad, plus a point which no constraint uses
+    vertices = [(x,y,0) for y in range(3) for x in range(3)] + [(x+10,y,0) for y in range(2) for x in range(2)]
+    mesh = harness.Mesh(vertices,[(0,1,4,3),(1,2,5,4),(3,4,7,6),(4,5,8,7),(9,10,12,11)])
+    points = mesh.Vertices.ToPoint3dArray() + [harness.Point3d(50,50,50)]
+    return mesh,points
+
+def test_partitioned_solve_matches_whole_solve():
+    mesh,points = islands()
+    sigs = [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices")),
+            scenarios.makeSig("Closeness",[[0],[12]],10.0,scalars=[[0,0,1],[11,1,2]])]
+    whole = scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points[:-1],
+                            scenarios.staticSettings(Iterations=30,CacheSize=0,Backend="python"))
+    out = scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,
+                          scenarios.staticSettings(Iterations=30,Partition=True,Workers=2,Backend="python"))
+    assert out["Iterations"] == 30 and out["ConstraintCount"] == whole["ConstraintCount"]
+    assert len(out["Points"]) == len(points)
+    assert all(a.DistanceTo(b) < 1e-9 for a,b in zip(out["Points"][:-1],whole["Points"]))
+    assert out["Points"][0].Z > 0.5 and out["Points"][12].Z > 0.5
+    # The unconstrained point is returned as it is
+    assert out["Points"][-1] is points[-1]
+
+    info = out["SolverInfo"][0]
+    assert info["components"] == 2
+    assert info["componentPoints"] == [9,4]
+    assert len(info["componentSeconds"]) == 2 and all(s >= 0 for s in info["componentSeconds"])
+
+def test_partition_splits_index_blocks():
+    import ShapeOpConstraintSolver as cs
+    mesh,points = islands()
+    sigs = [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices",blockSize=5)),
+            scenarios.makeSig("Closeness",[[0],[12]],[2.0,3.0])]
+    members,parts = cs.partitionSoConstraintSigs(sigs,len(points))
+    assert [list(m) for m in members] == [list(range(9)),list(range(9,13)),[13]]
+    assert [[p["count"] for p in c] for c in parts] == [[12,1],[4,1],[]]
+
+    # The indices are local to each component, and the weights follow their constraints
+    closeness = parts[1][1]
+    assert list(closeness["pointIndices"]) == [3] and list(closeness["weights"]) == [3.0]
+    indices,offsets = parts[1][0]["pointIndices"],parts[1][0]["indexOffsets"]
+    edges = [tuple(indices[offsets[k]:offsets[k+1]]) for k in range(len(offsets)-1)]
+    assert sorted(edges) == [(0,1),(0,2),(1,3),(2,3)]
+
+def test_live_update_edits_only_changed_anchors():
+    stub = harness.StubShapeOp()
+    harness.useNativeLibrary(stub)
+    edited = []
+    editConstraint = stub.shapeop_editConstraint
+    def recordEdit(solver,t,constraintId,ptr,scalarCount):
+        edited.append(constraintId)
+        return editConstraint(solver,t,constraintId,ptr,scalarCount)
+    stub.shapeop_editConstraint = recordEdit
+
+    mesh = harness.gridMesh(3)
+    points = mesh.Vertices.ToPoint3dArray()
+    targets = [[p.X,p.Y,p.Z] for p in points]
+    def sigs():
+        return [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices")),
+                scenarios.makeSig("Closeness",[[i] for i in range(len(points))],10.0,scalars=targets)]
+    component = harness.Component("ShapeOpConstraintSolver")
+    scenarios.solve(component,sigs(),points,scenarios.liveSettings(Reset=True))
+    edits = stub.calls["shapeop_editConstraint"]
+
+    # Moving two anchors only edits their two Closeness constraints
+    targets[3][2] += 1.0
+    targets[7][0] -= 1.0
+    out = scenarios.solve(component,sigs(),points,scenarios.liveSettings(Reset=False))
+    info = out["SolverInfo"][0]
+    assert (info["editsSent"],info["editsSkipped"]) == (2,len(points)-2)
+    assert stub.calls["shapeop_editConstraint"] - edits == 2
+    assert edited[-2:] == [24+3,24+7]
+
+    # Unchanged scalars send no edits
+    out = scenarios.solve(component,sigs(),points,scenarios.liveSettings(Reset=False))
+    info = out["SolverInfo"][0]
+    assert (info["editsSent"],info["editsSkipped"]) == (0,len(points))
+    assert stub.calls["shapeop_editConstraint"] - edits == 2
+
+def test_multilevel_coarse_levels_get_reduced_budget():
+    mesh = harness.gridMesh(8)
+    points = mesh.Vertices.ToPoint3dArray()
+    sigs = [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices")),
+            scenarios.makeSig("Closeness",[[0],[8]],10.0,scalars=[[-2,0,1],[10,0,1]])]
+    settings = scenarios.staticSettings(Iterations=40,CacheSize=0,Levels=2,Backend="python")
+    out = scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,settings)
+    info = out["SolverInfo"][0]
+    assert info["levels"] > 1
+    assert info["levelIterations"] == [10]*(info["levels"]-1) + [40]
+    assert out["Iterations"] == 40
+
+def solveEveryType():
+    import bench_examples
+    mesh = bench_examples.waveMesh(4,triangles=True)
+    quads = bench_examples.waveMesh(4)
+    points = mesh.Vertices.ToPoint3dArray()
+    faces = scenarios.indexMesh(mesh,"faceVertices")
+    naked = [[i] for i in scenarios.indexMesh(mesh,"nakedVertices").Branches[0]]
+    sigs = [scenarios.makeSig(t,faces,0.5) for t in ("TriangleStrain","Area","Line","Plane","Circle","Similarity","Rigid")]
+    sigs += [scenarios.makeSig(t,[[0,1,2,3]],0.5) for t in ("Rectangle","Parallelogram")]
+    sigs += [scenarios.makeSig("TetrahedronStrain",[[0,1,5,11]]),scenarios.makeSig("Volume",[[2,3,7,13]]),
+             scenarios.makeSig("Sphere",[[0,1,2,6,7]]),scenarios.makeSig("AngleConstraint",[[6,7,11]],scalars=[[0.5,1.0]]),
+             scenarios.makeSig("LaplacianDisplacement",scenarios.indexMesh(mesh,"vertexNeighbours"),0.3),
+             scenarios.makeSig("Bending",scenarios.indexMesh(mesh,"edgeFaceVertices"),0.1),
+             scenarios.makeSig("EdgeStrain",scenarios.indexMesh(mesh,"edgeVertices")),
+             scenarios.makeSig("Closeness",naked,5.0)]
+    static = scenarios.solve(harness.Component("ShapeOpConstraintSolver"),sigs,points,
+                             scenarios.staticSettings(Iterations=20,CacheSize=0,Backend="python"))["Points"]
+
+    # A live update which edits the Closeness targets of the batches
+    targets = [[p.X,p.Y,p.Z] for p in quads.Vertices.ToPoint3dArray()]
+    live = [scenarios.makeSig("EdgeStrain",scenarios.indexMesh(quads,"edgeVertices")),None]
+    component = harness.Component("ShapeOpConstraintSolver")
+    for z in (0.0,2.0):
+        targets[0][2] = z
+        live[1] = scenarios.makeSig("Closeness",[[0],[4],[24]],10.0,scalars=[targets[0],targets[4],targets[24]])
+        settings = scenarios.liveSettings(Reset=z == 0.0,UnaryVector=scenarios.gravity,Backend="python")
+        moved = scenarios.solve(component,live,quads.Vertices.ToPoint3dArray(),settings)["Points"]
+
+    return [(p.X,p.Y,p.Z) for p in list(static)+list(moved)]
+
+def test_python_backend_batches_match_reference(monkeypatch):
+    pytest.importorskip("numpy")
+    batched = solveEveryType()
+    for name in ("numpy","scipy","scipy.sparse","scipy.sparse.linalg"):
+        monkeypatch.setitem(sys.modules,name,None)
+    monkeypatch.delitem(sys.modules,"ShapeOpCore")
+    reference = solveEveryType()
+    assert max(abs(a-b) for p,q in zip(batched,reference) for a,b in zip(p,q)) < 1e-8
+    # The edited target pulled the first live point up
+    assert reference[25][2] > 0.1
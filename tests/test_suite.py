@@ -0,0 +1,45 @@
+import csv
+import json
+
+import pytest
+
+import bench_examples
+import suite
+
+def report(*medians):
+    return {"results":[{"name":"case","size":size,"warmup":0,"repeat":1,"metrics":{},
+                        "seconds":{"min":m,"median":m,"mean":m}} for size,m in enumerate(medians)]}
+
+def test_compare_results_against_baseline():
+    baseline = report(1.0,1.0)
+    assert suite.compareResults(report(1.05,0.5),baseline,10.0) == []
+    assert suite.compareResults(report(1.2,1.0,9.0),baseline,10.0) == [("case",0,1.0,1.2)]
+
+def test_write_results_csv(tmp_path):
+    path = str(tmp_path/"results.csv")
+    suite.writeResultsCsv(report(0.5),path)
+    with open(path) as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]["name"] == "case" and float(rows[0]["median"]) == 0.5
+
+@pytest.mark.parametrize("example,mesh",[
+    (bench_examples.hangingCloth,lambda n: bench_examples.harness.gridMesh(n)),
+    (bench_examples.sheetMaterial,lambda n: bench_examples.waveMesh(n,triangles=True)),
+    (bench_examples.quadMeshWithCircularUV,bench_examples.waveMesh),
+    (bench_examples.complexMeshWithVariousConstraints,lambda n: bench_examples.waveMesh(n,seams=(2,)))])
+def test_example_pipelines(example,mesh):
+    m = mesh(4)
+    out = example(m,4)
+    assert len(out["Points"]) == m.Vertices.Count
+    assert out["Iterations"] > 0
+
+def test_suite_fails_on_regression(tmp_path):
+    baseline = str(tmp_path/"baseline.json")
+    assert suite.main(["--quick","--filter","live.update","--out",baseline]) == 0
+    with open(baseline) as f:
+        fast = json.load(f)
+    for r in fast["results"]:
+        r["seconds"]["median"] *= 1e-6
+    with open(baseline,"w") as f:
+        json.dump(fast,f)
+    assert suite.main(["--quick","--filter","live.update","--baseline",baseline,"--threshold","10"]) == 1